@@ -0,0 +1,134 @@
+"""
+Cache de résultats adressé par contenu.
+
+Chaque fichier de sortie est associé dans un manifeste JSON à une clé calculée à partir :
+- du hash SHA-256 des fichiers d'entrée,
+- des paramètres de traitement,
+- de la version du code (hash des sources des modules utilisés).
+
+Un résultat n'est recalculé que si sa clé a changé ou si le fichier de sortie a disparu.
+Les hash des fichiers d'entrée sont mémorisés avec leur taille et date de modification,
+pour ne pas relire les enregistrements inchangés à chaque exécution.
+
+Exemple :
+    cache = ResultCache(os.path.join(output_dir, MANIFEST_NAME))
+    key = cache.make_key([edf_path], {'l_freq': 1.5}, code_version(edf_cleaning))
+    if not cache.is_fresh(output_path, key):
+        ...  # calcul
+        cache.record(output_path, key)
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import time
+
+MANIFEST_NAME = '.ecofec_cache.json'
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Hash SHA-256 du contenu d'un fichier, lu par blocs."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_version(*modules):
+    """
+    Version du code : hash des fichiers sources des modules (ou fonctions) donnés.
+    Toute modification du code de traitement invalide donc les résultats en cache.
+    """
+    digest = hashlib.sha256()
+    for module in modules:
+        with open(inspect.getsourcefile(module), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class ResultCache:
+    """Manifeste JSON {chemin de sortie: clé} stocké à côté des résultats."""
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.entries = {}
+        self.hashes = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+            self.entries = content.get('entries', {})
+            self.hashes = content.get('hashes', {})
+
+    def input_hash(self, path):
+        """Hash d'un fichier d'entrée, recalculé seulement si sa taille ou sa date ont changé."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.hashes.get(path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+        sha = file_hash(path)
+        self.hashes[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha}
+        return sha
+
+    def make_key(self, input_paths, params, version):
+        """Clé de cache : hash des contenus d'entrée, des paramètres et de la version du code."""
+        description = {
+            'inputs': [self.input_hash(path) for path in input_paths],
+            'params': params,
+            'version': version,
+        }
+        text = json.dumps(description, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def is_fresh(self, output_path, key):
+        """Vrai si le fichier de sortie existe et a été produit avec la même clé."""
+        entry = self.entries.get(os.path.abspath(output_path))
+        return entry is not None and entry['key'] == key and os.path.exists(output_path)
+
+    def record(self, output_path, key):
+        """Enregistre la clé d'un résultat produit avec succès et sauvegarde le manifeste."""
+        self.entries[os.path.abspath(output_path)] = {'key': key, 'created': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self.save()
+
+    def save(self):
+        """Écriture atomique du manifeste (fichier temporaire puis remplacement)."""
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'entries': self.entries, 'hashes': self.hashes}, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+
+class FolderCaches(ResultCache):
+    """
+    Manifestes de plusieurs dossiers de sortie, avec l'interface de ResultCache : la clé de chaque
+    sortie est lue et enregistrée dans le manifeste de son dossier (MANIFEST_NAME). Un seul appel
+    à pipeline.run_tasks peut ainsi produire des sorties dans plusieurs dossiers.
+    Les hash des fichiers d'entrée ne sont mémorisés que pendant l'exécution.
+    """
+
+    def __init__(self, manifest_name=MANIFEST_NAME):
+        self.manifest_name = manifest_name
+        self.entries = {}
+        self.hashes = {}
+        self.caches = {}
+
+    def folder_cache(self, output_path):
+        """Manifeste du dossier d'un fichier de sortie (chargé au premier accès)."""
+        folder = os.path.dirname(os.path.abspath(output_path))
+        if folder not in self.caches:
+            self.caches[folder] = ResultCache(os.path.join(folder, self.manifest_name))
+        return self.caches[folder]
+
+    def is_fresh(self, output_path, key):
+        return self.folder_cache(output_path).is_fresh(output_path, key)
+
+    def record(self, output_path, key):
+        self.folder_cache(output_path).record(output_path, key)
+
+    def save(self):
+        for cache in self.caches.values():
+            cache.save()
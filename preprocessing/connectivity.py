@@ -0,0 +1,192 @@
+"""
+Connectivité fonctionnelle entre toutes les paires de canaux : cohérence, PLV et wPLI.
+
+Le signal des segments propres est découpé en fenêtres de `window_sec` secondes sans
+recouvrement (fenêtre de Hann). Chaque fenêtre de chaque canal n'est transformée qu'une fois
+(une FFT par canal et par fenêtre) ; les spectres croisés de toutes les paires i < j sont
+ensuite calculés en une seule opération vectorisée, et seules des sommes sur les fenêtres sont
+conservées (CrossSpectralSums). La mémoire ne dépend donc pas de la durée analysée :
+- les segments sont lus par blocs d'au plus `block_windows` fenêtres depuis l'EDF (memmap) ;
+- les sommes de plusieurs blocs (ou de plusieurs processus) s'additionnent.
+
+Mesures, pour une paire (x, y) et une fréquence, sur les K fenêtres :
+- cohérence : |Σ X·Y*| / sqrt(Σ |X|² · Σ |Y|²)
+- PLV       : |Σ exp(i(φx - φy))| / K
+- wPLI      : |Σ Im(X·Y*)| / Σ |Im(X·Y*)|
+Les valeurs par bande sont les moyennes des mesures sur les fréquences de la bande.
+
+Exemple :
+    sums, freqs, ch_names = compute_connectivity(edf_path, segments, f_max=80, n_jobs=8)
+    table = connectivity_table(sums, freqs, ch_names, spectral.make_bands(80))
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy.signal import get_window
+
+from preprocessing.signal_io import open_signal
+from preprocessing.pipeline import process_pool
+
+MEASURES = ('Coherence', 'PLV', 'wPLI')
+
+# Durée des fenêtres (s) : résolution fréquentielle de 1 / WINDOW_SEC Hz
+WINDOW_SEC = 2.0
+
+# Nombre maximal de fenêtres lues et transformées à la fois (borne la mémoire)
+BLOCK_WINDOWS = 32
+
+
+class CrossSpectralSums:
+    """
+    Sommes sur les fenêtres des spectres (auto et croisés) de toutes les paires de canaux i < j.
+    Deux instances (blocs ou processus différents) se combinent avec merge.
+    """
+
+    def __init__(self, n_channels, n_freqs):
+        self.pair_i, self.pair_j = np.triu_indices(n_channels, k=1)
+        n_pairs = len(self.pair_i)
+        self.n_windows = 0
+        self.power = np.zeros((n_channels, n_freqs))
+        self.csd = np.zeros((n_pairs, n_freqs), dtype=complex)
+        self.phase = np.zeros((n_pairs, n_freqs), dtype=complex)
+        self.imag = np.zeros((n_pairs, n_freqs))
+        self.abs_imag = np.zeros((n_pairs, n_freqs))
+
+    def add(self, spectra):
+        """Ajoute les spectres (n_windows, n_channels, n_freqs) d'un bloc de fenêtres."""
+        if len(spectra) == 0:
+            return
+        magnitude = np.abs(spectra)
+        unit = np.divide(spectra, magnitude, out=np.zeros_like(spectra), where=magnitude > 0)
+        cross = spectra[:, self.pair_i] * np.conj(spectra[:, self.pair_j])
+        self.n_windows += len(spectra)
+        self.power += np.sum(magnitude ** 2, axis=0)
+        self.csd += cross.sum(axis=0)
+        self.phase += np.sum(unit[:, self.pair_i] * np.conj(unit[:, self.pair_j]), axis=0)
+        self.imag += cross.imag.sum(axis=0)
+        self.abs_imag += np.abs(cross.imag).sum(axis=0)
+
+    def merge(self, other):
+        """Ajoute les sommes d'une autre instance (mêmes canaux et fréquences)."""
+        self.n_windows += other.n_windows
+        for name in ('power', 'csd', 'phase', 'imag', 'abs_imag'):
+            total = getattr(self, name)
+            np.add(total, getattr(other, name), out=total)
+        return self
+
+    def measures(self):
+        """{mesure: tableau (n_pairs, n_freqs)} ; NaN si aucune fenêtre."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            norm = np.sqrt(self.power[self.pair_i] * self.power[self.pair_j])
+            return {
+                'Coherence': np.abs(self.csd) / norm,
+                'PLV': np.abs(self.phase) / self.n_windows if self.n_windows else np.full(self.imag.shape, np.nan),
+                'wPLI': np.abs(self.imag) / self.abs_imag,
+            }
+
+
+def frequencies(sfreq, window_sec=WINDOW_SEC, f_min=0.0, f_max=None):
+    """Fréquences de la FFT d'une fenêtre et masque des fréquences conservées [f_min, f_max]."""
+    nperseg = int(round(window_sec * sfreq))
+    freqs = np.fft.rfftfreq(nperseg, 1.0 / sfreq)
+    mask = (freqs >= f_min) & (freqs <= (f_max if f_max is not None else freqs[-1]))
+    return freqs[mask], mask
+
+
+def window_spectra(data, nperseg, freq_mask):
+    """Spectres des fenêtres consécutives de data (n_channels, n_samples) : (n_windows, n_channels, n_freqs)."""
+    n_windows = data.shape[1] // nperseg
+    windows = data[:, :n_windows * nperseg].reshape(data.shape[0], n_windows, nperseg).transpose(1, 0, 2)
+    windows = windows - windows.mean(axis=-1, keepdims=True)
+    return np.fft.rfft(windows * get_window('hann', nperseg), axis=-1)[..., freq_mask]
+
+
+def segment_blocks(segments, nperseg, block_windows=BLOCK_WINDOWS):
+    """
+    Découpe les segments en blocs [début, fin) d'au plus block_windows fenêtres entières ;
+    la fin de chaque segment plus courte qu'une fenêtre est ignorée.
+    """
+    blocks = []
+    for start, end in segments:
+        n_windows = (int(end) - int(start)) // nperseg
+        for first in range(0, n_windows, block_windows):
+            count = min(block_windows, n_windows - first)
+            block_start = int(start) + first * nperseg
+            blocks.append((block_start, block_start + count * nperseg))
+    return blocks
+
+
+def block_sums(edf_path, channels, blocks, window_sec=WINDOW_SEC, f_min=0.0, f_max=None):
+    """Sommes des spectres des blocs d'un EDF, lus un par un (exécutable dans un processus 'spawn')."""
+    reader = open_signal(edf_path)
+    nperseg = int(round(window_sec * reader.sfreq))
+    freqs, mask = frequencies(reader.sfreq, window_sec, f_min, f_max)
+    sums = CrossSpectralSums(len(channels), len(freqs))
+    for start, stop in blocks:
+        sums.add(window_spectra(reader.read(channels, start, stop), nperseg, mask))
+    return sums
+
+
+def compute_connectivity(edf_path, segments, channels=None, window_sec=WINDOW_SEC, f_min=0.0, f_max=None,
+                         block_windows=BLOCK_WINDOWS, n_jobs=1, executor=None):
+    """
+    Sommes des spectres croisés de toutes les paires de canaux sur les segments d'un EDF.
+
+    :param segments: bornes [début, fin) des segments (échantillons)
+    :param channels: canaux analysés (tous les canaux de données si None)
+    :param n_jobs: nombre de processus ; les blocs sont répartis entre eux
+    :param executor: groupe de processus existant (voir pipeline.process_pool) à utiliser
+                     plutôt que d'en créer un, par exemple pour plusieurs appels successifs
+    :return: (CrossSpectralSums, freqs, channels)
+    """
+    reader = open_signal(edf_path)
+    channels = list(channels) if channels is not None else reader.ch_names
+    nperseg = int(round(window_sec * reader.sfreq))
+    freqs, _ = frequencies(reader.sfreq, window_sec, f_min, f_max)
+    blocks = segment_blocks(segments, nperseg, block_windows)
+
+    if executor is None and (n_jobs <= 1 or len(blocks) <= 1):
+        return block_sums(edf_path, channels, blocks, window_sec, f_min, f_max), freqs, channels
+    if executor is None:
+        with process_pool(n_jobs) as executor:
+            return compute_connectivity(edf_path, segments, channels, window_sec, f_min, f_max,
+                                        block_windows, n_jobs, executor)
+
+    # Blocs répartis en lots contigus, un résultat (sommes) par lot
+    sums = CrossSpectralSums(len(channels), len(freqs))
+    n_batches = min(max(n_jobs, 1) * 4, len(blocks))
+    batches = [batch.tolist() for batch in np.array_split(np.array(blocks), n_batches)] if blocks else []
+    futures = [executor.submit(block_sums, edf_path, channels, batch, window_sec, f_min, f_max)
+               for batch in batches]
+    # Lots combinés dans l'ordre de soumission : l'ordre des sommes flottantes, donc le résultat,
+    # ne dépend pas de l'ordre de fin des processus
+    for future in futures:
+        sums.merge(future.result())
+    return sums, freqs, channels
+
+
+def connectivity_table(sums, freqs, ch_names, bands):
+    """
+    Table (une ligne par paire de canaux et par bande) : Channel_1, Channel_2, Band, Coherence,
+    PLV, wPLI, N_Windows.
+    """
+    measures = sums.measures()
+    rows = []
+    for band, (f_min, f_max) in bands.items():
+        in_band = (freqs >= f_min) & (freqs <= f_max)
+        with warnings.catch_warnings():
+            # Bande vide ou paire sans fenêtre : moyenne NaN, sans avertissement
+            warnings.simplefilter('ignore', RuntimeWarning)
+            values = {name: np.nanmean(m[:, in_band], axis=1) if in_band.any() else np.full(len(m), np.nan)
+                      for name, m in measures.items()}
+        rows.append(pd.DataFrame({
+            'Channel_1': np.asarray(ch_names)[sums.pair_i],
+            'Channel_2': np.asarray(ch_names)[sums.pair_j],
+            'Band': band,
+            **values,
+        }))
+    table = pd.concat(rows, ignore_index=True)
+    table['N_Windows'] = sums.n_windows
+    return table
@@ -1,42 +1,87 @@
 import os
 import mne
+import numpy as np
+from preprocessing.edf_io import EdfReader
+from preprocessing.filtering import (design_filter, apply_filter, design_resample_kernel, resample_margin,
+                                     resample)
+from preprocessing.instrumentation import StageTotals, profiled, stage
+from preprocessing.signal_io import open_writer, write_signal
 
-def preprocess_eeg_edf(edf_path, channels_of_interest=None, l_freq=1.5, h_freq=80, notch_freq=50):
+# Canaux EEG du montage standard 10-20 conservés par défaut
+DEFAULT_CHANNELS = [
+    'Fp1', 'Fp2', 'F7', 'F3', 'Fz', 'F4', 'F8',
+    'T3', 'C3', 'Cz', 'C4', 'T4',
+    'T5', 'P3', 'Pz', 'P4', 'T6',
+    'O1', 'O2'
+]
+
+def select_channels(ch_names, channels_of_interest=None):
     """
-    Preprocess an EEG EDF file:
-    - Loads EDF file
-    - Selects specified channels
-    - Applies notch filter and bandpass filter
-    - Returns filtered raw data
+    Renvoie les canaux d'intérêt présents dans le fichier, dans l'ordre demandé.
+    Sans liste fournie, les canaux du montage standard (DEFAULT_CHANNELS) sont utilisés.
     """
-    # Load raw EDF data
-    raw = mne.io.read_raw_edf(edf_path, preload=True)
-
-    # Définir les canaux d’intérêt
-    channels_of_interest = [
-        'Fp1', 'Fp2', 'F7', 'F3', 'Fz', 'F4', 'F8',
-        'T3', 'C3', 'Cz', 'C4', 'T4',
-        'T5', 'P3', 'Pz', 'P4', 'T6',
-        'O1', 'O2'
-    ]
+    if channels_of_interest is None:
+        channels_of_interest = DEFAULT_CHANNELS
+    return [ch for ch in channels_of_interest if ch in ch_names]
 
-    # Garde uniquement les canaux présents dans le fichier
-    available_channels = [ch for ch in channels_of_interest if ch in raw.ch_names]
-    raw.pick_channels(available_channels)
+def output_header(reader, channels, l_freq, h_freq, notch_freq):
+    """
+    Champs d'en-tête du fichier nettoyé (voir signal_io.open_writer) : plage physique symétrique
+    et au moins aussi large que celle du fichier source, identifiants, date et filtres appliqués.
+    """
+    header = reader.header
+    header_index = {label: i for i, label in enumerate(header['labels'])}
+    indices = [header_index[ch] for ch in channels]
+    physical_max = [max(abs(header['physical_min'][i]), abs(header['physical_max'][i])) for i in indices]
+    return dict(physical_min=[-v for v in physical_max], physical_max=physical_max,
+                physical_dimension=[header['physical_dimension'][i] for i in indices],
+                patient_id=header['patient_id'], recording_id=header['recording_id'],
+                start_date=header['start_date'], start_time=header['start_time'],
+                prefiltering=f"HP:{l_freq}Hz LP:{h_freq}Hz N:{notch_freq}Hz")
 
-    # Select channels if specified
-    if channels_of_interest is not None:
-        raw.pick_channels(channels_of_interest)
+def clean_signal(edf_path, channels_of_interest=None, l_freq=1.5, h_freq=80, notch_freq=50, resample_sfreq=None,
+                 filter_method='fir', dtype=np.float64):
+    """
+    Signal nettoyé complet sous forme de tableau numpy, sans passer par MNE : lecture des canaux
+    d'intérêt, filtre combiné (notch et passe-bande) en une passe, rééchantillonnage optionnel.
+    Tous les calculs sont faits en `dtype` (float64, ou float32 pour diviser la mémoire par deux).
 
-    # Copy raw to avoid modifying original
-    raw_filtered = raw.copy()
+    :return: (data (n_channels, n_times) en volts, canaux, fréquence d'échantillonnage)
+    """
+    # Charger uniquement les canaux d’intérêt présents dans le fichier
+    reader = EdfReader(edf_path, dtype=dtype)
+    channels = select_channels(reader.ch_names, channels_of_interest)
+    sfreq = reader.sfreq
+    with stage('edf_cleaning.decode', file=edf_path):
+        data = reader.read(channels)
 
-    # Apply notch filter (remove powerline noise)
-    raw_filtered.notch_filter(freqs=notch_freq, fir_design='firwin')
+    # Coupe-bande (bruit secteur) et passe-bande en une seule passe, filtre conçu une fois par fréquence
+    with stage('edf_cleaning.filter', file=edf_path):
+        data = apply_filter(data, design_filter(sfreq, l_freq, h_freq, notch_freq, filter_method), filter_method)
 
-    # Apply bandpass filter
-    raw_filtered.filter(l_freq=l_freq, h_freq=h_freq, fir_design='firwin')
+    # Rééchantillonnage : le passe-bas du filtre passe-bande sert d'anti-repliement
+    if resample_sfreq is not None and resample_sfreq != sfreq:
+        with stage('edf_cleaning.resample', file=edf_path):
+            up, down, kernel = design_resample_kernel(sfreq, resample_sfreq, h_freq)
+            data = resample(data, up, down, kernel)
+            sfreq = resample_sfreq
+    return data, channels, sfreq
 
+def preprocess_eeg_edf(edf_path, channels_of_interest=None, l_freq=1.5, h_freq=80, notch_freq=50, resample_sfreq=None,
+                       filter_method='fir'):
+    """
+    Preprocess an EEG EDF file:
+    - Loads the selected channels of the EDF file (other channels are never decoded)
+    - Applies the combined notch + bandpass filter in a single pass ('fir' or 'iir', see filtering.design_filter)
+    - Optionally resamples to resample_sfreq Hz (polyphase, after the bandpass, see filtering.py)
+    - Returns filtered raw data (see clean_signal for the same result as a numpy array)
+    """
+    data, channels, sfreq = clean_signal(edf_path, channels_of_interest, l_freq, h_freq, notch_freq, resample_sfreq,
+                                         filter_method)
+    raw_filtered = mne.io.RawArray(data, mne.create_info(channels, sfreq, 'eeg'), verbose=False)
+    meas_date = EdfReader(edf_path).meas_date
+    if meas_date is not None:
+        raw_filtered.set_meas_date(meas_date)
     return raw_filtered
 
 def clean_edf(input_file, output_file, channels_of_interest=None, l_freq=1.5, h_freq=80, notch_freq=50, plot=False):
@@ -55,8 +100,85 @@ def clean_edf(input_file, output_file, channels_of_interest=None, l_freq=1.5, h_
     if plot:
         raw_clean.plot()
 
-from mne.export import export_raw
+def stream_clean_edf(edf_path, output_path, channels_of_interest=None, l_freq=1.5, h_freq=80, notch_freq=50,
+                     block_sec=60.0, resample_sfreq=None, filter_method='fir', dtype=np.float64):
+    """
+    Prétraitement en flux d'un fichier EDF : lecture, filtrage (notch et passe-bande combinés),
+    rééchantillonnage optionnel à resample_sfreq Hz et écriture par blocs de `block_sec` secondes,
+    au format donné par l'extension de output_path ('.edf', '.fif' ou '.npy', voir signal_io).
+
+    Chaque bloc est lu avec une marge de part et d'autre égale à la demi-longueur du filtre
+    combiné (et du noyau de rééchantillonnage), de sorte que les échantillons écrits sont
+    identiques à ceux d'un traitement du signal complet. La mémoire utilisée dépend de
+    la taille des blocs et non de la durée de l'enregistrement. Les blocs sont lus, filtrés et
+    rééchantillonnés en `dtype` (float64 ou float32).
+    """
+    reader = EdfReader(edf_path, dtype=dtype)
+    channels = select_channels(reader.ch_names, channels_of_interest)
+    sfreq = reader.sfreq
+    n_times = reader.n_times
+
+    design = design_filter(sfreq, l_freq, h_freq, notch_freq, filter_method)
+    margin = design[1]
+
+    # Rééchantillonnage : blocs et marge en multiples de down, pour que chaque bloc commence sur un échantillon de sortie
+    out_sfreq = sfreq
+    up, down, resample_kernel, resample_pad = 1, 1, None, 0
+    if resample_sfreq is not None and resample_sfreq != sfreq:
+        up, down, resample_kernel = design_resample_kernel(sfreq, resample_sfreq, h_freq)
+        resample_pad = resample_margin(up, down, resample_kernel)
+        out_sfreq = resample_sfreq
+    n_out = -(-n_times * up // down)
 
-def clean_and_save_edf(edf_path, output_path, channels_of_interest=None, l_freq=1.5, h_freq=80, notch_freq=50, plot=False):
-    raw_clean = preprocess_eeg_edf(edf_path, channels_of_interest, l_freq, h_freq, notch_freq)
-    raw_clean.export(output_path, fmt='edf')
+    block_size = max(int(block_sec * sfreq) // down, 1) * down
+    # Mesures cumulées sur tous les blocs (une ligne par sous-étape, voir instrumentation)
+    totals = StageTotals(file=edf_path)
+    with open_writer(output_path, channels, out_sfreq, n_out,
+                     **output_header(reader, channels, l_freq, h_freq, notch_freq)) as writer:
+        for start in range(0, n_times, block_size):
+            stop = min(start + block_size, n_times)
+            # Plage filtrée nécessaire au rééchantillonnage du bloc, puis plage lue
+            seg_lo = max(0, start - resample_pad)
+            seg_hi = min(n_times, stop + resample_pad)
+            lo = max(0, seg_lo - margin)
+            hi = min(n_times, seg_hi + margin)
+            at_start, at_end = lo == 0, hi == n_times
+
+            with totals.part('edf_cleaning.decode'):
+                data = reader.read(channels, start=lo, stop=hi)
+            with totals.part('edf_cleaning.filter'):
+                data = apply_filter(data, design, filter_method, at_start=at_start, at_end=at_end)
+
+            # Le bloc filtré couvre [lo, hi] moins la marge retirée sur les bords intérieurs
+            first = lo if at_start else lo + margin
+            data = data[:, seg_lo - first:seg_hi - first]
+            if resample_kernel is not None:
+                with totals.part('edf_cleaning.resample'):
+                    data = resample(data, up, down, resample_kernel)
+            out_start = start * up // down
+            out_stop = min(-(-stop * up // down), n_out)
+            offset = seg_lo * up // down
+            with totals.part('edf_cleaning.write'):
+                writer.write(data[:, out_start - offset:out_stop - offset])
+    totals.emit()
+
+@profiled(file_arg='edf_path')
+def clean_and_save_edf(edf_path, output_path, channels_of_interest=None, l_freq=1.5, h_freq=80, notch_freq=50, plot=False,
+                       block_sec=None, resample_sfreq=None, filter_method='fir', dtype=np.float64):
+    """
+    Prétraitement + sauvegarde du fichier nettoyé, au format donné par l'extension de output_path :
+    '.edf' (EDF 16 bits écrit par blocs), '.fif' (MNE) ou '.npy' (float32 et en-tête JSON, voir signal_io).
+    Si block_sec est donné, le fichier est traité en flux par blocs (voir stream_clean_edf).
+    Si resample_sfreq est donné, le fichier nettoyé est rééchantillonné à cette fréquence (Hz).
+    filter_method : 'fir' (défaut) ou 'iir' (voir filtering.design_filter).
+    dtype : type des calculs, float64 (défaut) ou float32 (mémoire divisée par deux).
+    """
+    if block_sec is not None:
+        stream_clean_edf(edf_path, output_path, channels_of_interest, l_freq, h_freq, notch_freq, block_sec=block_sec,
+                         resample_sfreq=resample_sfreq, filter_method=filter_method, dtype=dtype)
+        return
+    data, channels, sfreq = clean_signal(edf_path, channels_of_interest, l_freq, h_freq, notch_freq, resample_sfreq,
+                                         filter_method, dtype)
+    with stage('edf_cleaning.write', file=output_path):
+        reader = EdfReader(edf_path)
+        write_signal(output_path, data, channels, sfreq, **output_header(reader, channels, l_freq, h_freq, notch_freq))
@@ -0,0 +1,450 @@
+"""
+Lecture et écriture de fichiers EDF sans chargement complet en mémoire.
+
+Le format EDF stocke un en-tête texte (256 octets + 256 octets par signal) suivi
+d'enregistrements de données ("data records") en entiers 16 bits little-endian.
+- EdfReader projette les enregistrements en mémoire (memmap) et ne décode que les
+  canaux et la plage d'échantillons demandés ;
+- EdfWriter écrit un fichier par blocs, sans jamais garder l'enregistrement complet en mémoire.
+
+Les fichiers sont écrits sous un nom temporaire (partial_path) et ne prennent leur nom définitif
+qu'à la fermeture réussie : une écriture interrompue par une erreur ne laisse pas de fichier
+d'apparence complète.
+"""
+
+import os
+import datetime
+import numpy as np
+
+# Facteur de conversion de l'unité physique EDF vers les volts (convention MNE)
+UNIT_SCALES = {
+    'v': 1.0,
+    'mv': 1e-3,
+    'uv': 1e-6,
+    'µv': 1e-6,
+    'nv': 1e-9,
+}
+
+DIGITAL_MIN = -32768
+DIGITAL_MAX = 32767
+
+
+def unit_scale(physical_dimension):
+    """Renvoie le facteur de conversion d'une unité EDF (ex. 'uV') vers les volts (1 si inconnue)."""
+    return UNIT_SCALES.get(physical_dimension.strip().lower(), 1.0)
+
+
+def partial_path(path):
+    """Nom temporaire (même dossier, même extension) d'un fichier en cours d'écriture par ce processus."""
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{os.getpid()}.tmp-{name}")
+
+
+def edf_meas_date(start_date, start_time):
+    """Date UTC des champs EDF 'dd.mm.yy' et 'hh.mm.ss', ou None s'ils sont illisibles."""
+    try:
+        day, month, year = (int(v) for v in start_date.split('.'))
+        hour, minute, second = (int(v) for v in start_time.split('.'))
+    except ValueError:
+        return None
+    year += 1900 if year >= 85 else 2000
+    return datetime.datetime(year, month, day, hour, minute, second, tzinfo=datetime.timezone.utc)
+
+
+def read_edf_header(edf_path):
+    """
+    Lit l'en-tête d'un fichier EDF/EDF+.
+
+    :param edf_path: chemin du fichier .edf
+    :return: dictionnaire contenant les champs généraux et, par signal, les listes
+             'labels', 'physical_dimension', 'physical_min', 'physical_max',
+             'digital_min', 'digital_max', 'prefiltering', 'samples_per_record'
+    """
+    with open(edf_path, 'rb') as f:
+        fixed = f.read(256).decode('latin-1')
+        n_signals = int(fixed[252:256])
+        signal_block = f.read(256 * n_signals).decode('latin-1')
+
+    header = {
+        'version': fixed[0:8].strip(),
+        'patient_id': fixed[8:88].strip(),
+        'recording_id': fixed[88:168].strip(),
+        'start_date': fixed[168:176].strip(),
+        'start_time': fixed[176:184].strip(),
+        'header_bytes': int(fixed[184:192]),
+        'reserved': fixed[192:236].strip(),
+        'n_records': int(fixed[236:244]),
+        'record_duration': float(fixed[244:252]),
+        'n_signals': n_signals,
+    }
+
+    # Les champs des signaux sont stockés par colonnes : tous les labels, puis toutes les unités, etc.
+    field_widths = [
+        ('labels', 16), ('transducer', 80), ('physical_dimension', 8),
+        ('physical_min', 8), ('physical_max', 8), ('digital_min', 8), ('digital_max', 8),
+        ('prefiltering', 80), ('samples_per_record', 8), ('signal_reserved', 32),
+    ]
+    offset = 0
+    for name, width in field_widths:
+        values = [signal_block[offset + i * width: offset + (i + 1) * width].strip() for i in range(n_signals)]
+        offset += width * n_signals
+        header[name] = values
+
+    for name in ('physical_min', 'physical_max'):
+        header[name] = [float(v) for v in header[name]]
+    for name in ('digital_min', 'digital_max', 'samples_per_record'):
+        header[name] = [int(float(v)) for v in header[name]]
+
+    return header
+
+
+class EdfReader:
+    """
+    Lecteur EDF à accès aléatoire basé sur un memmap des enregistrements de données.
+
+    L'en-tête est lu une seule fois ; read() ne décode que les canaux et échantillons
+    demandés et renvoie des valeurs physiques en volts, comme mne.io.read_raw_edf.
+    Les canaux d'annotations EDF+ sont ignorés.
+
+    Les valeurs sont renvoyées en `dtype` : float64 par défaut, ou float32 (largement suffisant
+    pour des données 16 bits) pour diviser par deux la mémoire des étapes suivantes.
+
+    Exemple :
+        reader = EdfReader(edf_path)
+        data = reader.read(['Fp1', 'Fp2'], start=0, stop=int(10 * reader.sfreq))
+    """
+
+    def __init__(self, edf_path, dtype=np.float64):
+        self.path = edf_path
+        self.dtype = np.dtype(dtype)
+        self.header = header = read_edf_header(edf_path)
+
+        samples_per_record = np.array(header['samples_per_record'])
+        record_size = int(samples_per_record.sum())
+        n_records = header['n_records']
+        if n_records < 0:
+            # Nombre d'enregistrements inconnu (écriture interrompue) : déduit de la taille du fichier
+            n_records = (os.path.getsize(edf_path) - header['header_bytes']) // (2 * record_size)
+
+        self._records = np.memmap(edf_path, dtype='<i2', mode='r', offset=header['header_bytes'],
+                                  shape=(n_records, record_size))
+        self._offsets = np.concatenate([[0], np.cumsum(samples_per_record)[:-1]])
+
+        self._index = {}
+        for i, label in enumerate(header['labels']):
+            if label != 'EDF Annotations' and label not in self._index:
+                self._index[label] = i
+        self.ch_names = list(self._index)
+
+        # Conversion numérique -> physique (volts) : x = (dig * cal + offset) * scale
+        physical_min = np.array(header['physical_min'])
+        physical_max = np.array(header['physical_max'])
+        digital_min = np.array(header['digital_min'], dtype=float)
+        digital_max = np.array(header['digital_max'], dtype=float)
+        self._cal = (physical_max - physical_min) / (digital_max - digital_min)
+        self._cal_offset = physical_min - digital_min * self._cal
+        self._scale = np.array([unit_scale(u) for u in header['physical_dimension']])
+
+        self.n_records = int(n_records)
+        self.record_duration = header['record_duration']
+        rates = {samples_per_record[i] for i in self._index.values()}
+        # Fréquence de référence : celle des canaux les plus échantillonnés
+        self._samples_per_record = int(max(rates)) if rates else 0
+        self.sfreq = self._samples_per_record / self.record_duration
+        self.n_times = self.n_records * self._samples_per_record
+
+    @property
+    def meas_date(self):
+        """Date de début de l'enregistrement (UTC), ou None si l'en-tête est illisible."""
+        return edf_meas_date(self.header['start_date'], self.header['start_time'])
+
+    def read(self, channels=None, start=0, stop=None):
+        """
+        Lit les échantillons [start, stop) des canaux demandés.
+
+        :param channels: liste de noms de canaux (tous les canaux de données si None)
+        :param start: premier échantillon
+        :param stop: échantillon de fin (exclu), fin du fichier si None
+        :return: tableau (n_channels, stop - start) en volts
+        """
+        if channels is None:
+            channels = self.ch_names
+        if stop is None:
+            stop = self.n_times
+        start = max(0, int(start))
+        stop = min(self.n_times, int(stop))
+        spr = self._samples_per_record
+
+        data = np.empty((len(channels), max(stop - start, 0)), dtype=self.dtype)
+        if stop <= start:
+            return data
+
+        first_record = start // spr
+        last_record = (stop - 1) // spr + 1
+        begin = start - first_record * spr
+        for row, ch in enumerate(channels):
+            if ch not in self._index:
+                raise ValueError(f"Canal absent du fichier EDF : {ch}")
+            i = self._index[ch]
+            if self.header['samples_per_record'][i] != spr:
+                raise ValueError(f"Le canal {ch} n'a pas la fréquence d'échantillonnage de référence ({self.sfreq} Hz).")
+            offset = self._offsets[i]
+            digital = self._records[first_record:last_record, offset:offset + spr].reshape(-1)
+            data[row] = digital[begin:begin + stop - start]
+            data[row] *= self._cal[i]
+            data[row] += self._cal_offset[i]
+            data[row] *= self._scale[i]
+        return data
+
+    def read_windows(self, channels, starts, n_samples):
+        """
+        Lit en une fois des fenêtres de même longueur commençant aux échantillons `starts`.
+
+        Les échantillons situés hors de l'enregistrement valent NaN.
+
+        :return: tableau (n_windows, n_channels, n_samples) en volts
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        spr = self._samples_per_record
+        sample_idx = starts[:, np.newaxis] + np.arange(n_samples)
+        inside = (sample_idx >= 0) & (sample_idx < self.n_times)
+        clipped = np.clip(sample_idx, 0, max(self.n_times - 1, 0))
+        records, positions = np.divmod(clipped, spr)
+
+        data = np.empty((len(starts), len(channels), n_samples), dtype=self.dtype)
+        for col, ch in enumerate(channels):
+            if ch not in self._index:
+                raise ValueError(f"Canal absent du fichier EDF : {ch}")
+            i = self._index[ch]
+            if self.header['samples_per_record'][i] != spr:
+                raise ValueError(f"Le canal {ch} n'a pas la fréquence d'échantillonnage de référence ({self.sfreq} Hz).")
+            values = self._records[records, self._offsets[i] + positions].astype(self.dtype)
+            values *= self._cal[i]
+            values += self._cal_offset[i]
+            values *= self._scale[i]
+            data[:, col, :] = np.where(inside, values, np.nan)
+        return data
+
+    def to_raw(self, channels=None, start=0, stop=None):
+        """
+        Construit un mne.io.RawArray (type 'eeg') limité aux canaux et à la plage demandés.
+        `first_samp` conserve la position de la plage dans l'enregistrement d'origine.
+        """
+        import mne
+
+        if channels is None:
+            channels = self.ch_names
+        data = self.read(channels, start, stop)
+        info = mne.create_info(list(channels), self.sfreq, 'eeg')
+        raw = mne.io.RawArray(data, info, first_samp=max(0, int(start)), verbose=False)
+        if self.meas_date is not None:
+            raw.set_meas_date(self.meas_date)
+        return raw
+
+
+def _format_field(value, width):
+    """Formate une valeur numérique ou texte pour un champ ASCII EDF de largeur fixe."""
+    if isinstance(value, str):
+        text = value
+    elif float(value).is_integer():
+        text = str(int(value))
+    else:
+        text = f"{value:.{width}g}"
+        # Réduire la précision jusqu'à ce que le nombre tienne dans le champ
+        precision = width
+        while len(text) > width and precision > 1:
+            precision -= 1
+            text = f"{value:.{precision}g}"
+    if len(text) > width:
+        raise ValueError(f"Valeur trop longue pour un champ EDF de {width} caractères : {text!r}")
+    return text.ljust(width)
+
+
+def _format_seconds(value):
+    """Temps en secondes au format des annotations EDF+ (sans zéros inutiles)."""
+    text = f"{value:.6f}".rstrip('0').rstrip('.')
+    return text if text not in ('', '-0') else '0'
+
+
+class EdfWriter:
+    """
+    Écriture d'un fichier EDF par blocs d'échantillons.
+
+    Les données sont fournies en volts (convention MNE) sous forme de tableaux
+    (n_channels, n_samples) de longueur quelconque ; elles sont découpées en
+    enregistrements de `record_duration` secondes, quantifiées en 16 bits sur la
+    plage physique donnée puis écrites directement sur disque. Le nombre
+    d'enregistrements est mis à jour dans l'en-tête à la fermeture, puis le fichier
+    temporaire prend le nom `path`. Une erreur dans le bloc `with` appelle abort() :
+    le fichier partiel est supprimé.
+
+    Avec annotations=True, le fichier est écrit au format EDF+C avec un signal
+    'EDF Annotations' : les annotations ajoutées par add_annotation() sont placées
+    dans l'enregistrement qui contient leur début (ou le suivant s'il est plein).
+
+    Exemple :
+        with EdfWriter(path, ch_names, 512, phys_min, phys_max) as writer:
+            for block in blocks:
+                writer.write(block)
+    """
+
+    def __init__(self, path, ch_names, sfreq, physical_min, physical_max, physical_dimension='uV',
+                 record_duration=1.0, patient_id='X', recording_id='X',
+                 start_date='01.01.85', start_time='00.00.00', prefiltering='',
+                 annotations=False, annotation_bytes=160):
+        samples_per_record = sfreq * record_duration
+        if not float(samples_per_record).is_integer():
+            raise ValueError(f"sfreq * record_duration doit être entier (sfreq={sfreq}, durée={record_duration}).")
+
+        n_channels = len(ch_names)
+        self.path = path
+        self.ch_names = list(ch_names)
+        self.sfreq = sfreq
+        self.record_duration = record_duration
+        self.samples_per_record = int(samples_per_record)
+        self.n_records = 0
+        self.annotations = annotations
+        self.annotation_bytes = annotation_bytes + annotation_bytes % 2 if annotations else 0
+        self._pending_annotations = []
+
+        self.physical_min = np.broadcast_to(np.asarray(physical_min, dtype=float), (n_channels,)).copy()
+        self.physical_max = np.broadcast_to(np.asarray(physical_max, dtype=float), (n_channels,)).copy()
+        if isinstance(physical_dimension, str):
+            physical_dimension = [physical_dimension] * n_channels
+        self.physical_dimension = list(physical_dimension)
+
+        # Conversion volts -> valeur numérique : dig = (x / scale - pmin) * gain + dmin
+        scales = np.array([unit_scale(u) for u in self.physical_dimension])
+        self._scale = scales[:, None]
+        self._gain = ((DIGITAL_MAX - DIGITAL_MIN) / (self.physical_max - self.physical_min))[:, None]
+        self._pending = np.zeros((n_channels, 0))
+
+        self.tmp_path = partial_path(path)
+        self._file = open(self.tmp_path, 'wb')
+        self._file.write(self._build_header(patient_id, recording_id, start_date, start_time, prefiltering))
+
+    def _build_header(self, patient_id, recording_id, start_date, start_time, prefiltering):
+        labels = list(self.ch_names)
+        units = list(self.physical_dimension)
+        physical_min = list(self.physical_min)
+        physical_max = list(self.physical_max)
+        samples = [self.samples_per_record] * len(labels)
+        prefilters = [prefiltering] * len(labels)
+        if self.annotations:
+            labels.append('EDF Annotations')
+            units.append('')
+            physical_min.append(-1)
+            physical_max.append(1)
+            samples.append(self.annotation_bytes // 2)
+            prefilters.append('')
+        n_signals = len(labels)
+
+        header = (
+            _format_field('0', 8)
+            + _format_field(patient_id[:80], 80)
+            + _format_field(recording_id[:80], 80)
+            + _format_field(start_date, 8)
+            + _format_field(start_time, 8)
+            + _format_field(256 * (n_signals + 1), 8)
+            + _format_field('EDF+C' if self.annotations else '', 44)
+            + _format_field(-1, 8)
+            + _format_field(self.record_duration, 8)
+            + _format_field(n_signals, 4)
+        )
+        columns = [
+            [_format_field(name[:16], 16) for name in labels],
+            [_format_field('', 80)] * n_signals,
+            [_format_field(u, 8) for u in units],
+            [_format_field(v, 8) for v in physical_min],
+            [_format_field(v, 8) for v in physical_max],
+            [_format_field(DIGITAL_MIN, 8)] * n_signals,
+            [_format_field(DIGITAL_MAX, 8)] * n_signals,
+            [_format_field(p[:80], 80) for p in prefilters],
+            [_format_field(n, 8) for n in samples],
+            [_format_field('', 32)] * n_signals,
+        ]
+        header += ''.join(''.join(column) for column in columns)
+        return header.encode('latin-1')
+
+    def add_annotation(self, onset, duration, description):
+        """Ajoute une annotation (onset et durée en secondes depuis le début du fichier)."""
+        if not self.annotations:
+            raise ValueError("Ce fichier a été ouvert sans signal d'annotations (annotations=False).")
+        self._pending_annotations.append((onset, duration, description))
+
+    def _annotation_block(self, record_index):
+        """Octets du signal 'EDF Annotations' d'un enregistrement (TAL de datation + annotations)."""
+        record_start = record_index * self.record_duration
+        block = f"+{_format_seconds(record_start)}\x14\x14\x00".encode('latin-1')
+        record_end = record_start + self.record_duration
+        while self._pending_annotations and self._pending_annotations[0][0] < record_end:
+            onset, duration, description = self._pending_annotations[0]
+            tal = f"+{_format_seconds(onset)}\x15{_format_seconds(duration)}\x14{description}\x14\x00".encode('latin-1')
+            if len(block) + len(tal) > self.annotation_bytes:
+                break
+            block += tal
+            self._pending_annotations.pop(0)
+        return block.ljust(self.annotation_bytes, b'\x00')
+
+    def _write_records(self, data):
+        n_channels = data.shape[0]
+        n_records = data.shape[1] // self.samples_per_record
+        digital = self._to_digital(data)
+        # (n_channels, n_records, spr) -> (n_records, n_channels * spr) : ordre EDF
+        records = digital.reshape(n_channels, n_records, self.samples_per_record).transpose(1, 0, 2)
+        records = records.reshape(n_records, n_channels * self.samples_per_record)
+        if self.annotations:
+            blocks = b''.join(self._annotation_block(self.n_records + k) for k in range(n_records))
+            tal = np.frombuffer(blocks, dtype='<i2').reshape(n_records, self.annotation_bytes // 2)
+            records = np.hstack([records, tal])
+        self._file.write(np.ascontiguousarray(records).tobytes())
+        self.n_records += n_records
+
+    def _to_digital(self, data):
+        digital = np.round((data / self._scale - self.physical_min[:, None]) * self._gain + DIGITAL_MIN)
+        return np.clip(digital, DIGITAL_MIN, DIGITAL_MAX).astype('<i2')
+
+    def write(self, data):
+        """Ajoute un bloc (n_channels, n_samples) en volts à la suite du fichier."""
+        data = np.asarray(data, dtype=float)
+        if data.shape[0] != len(self.ch_names):
+            raise ValueError(f"{data.shape[0]} canaux fournis, {len(self.ch_names)} attendus.")
+        if self._pending.shape[1]:
+            data = np.concatenate([self._pending, data], axis=1)
+
+        n_complete = (data.shape[1] // self.samples_per_record) * self.samples_per_record
+        if n_complete:
+            self._write_records(data[:, :n_complete])
+        self._pending = data[:, n_complete:]
+
+    def close(self):
+        """Complète le dernier enregistrement avec des zéros, finalise l'en-tête et renomme le fichier."""
+        if self._file.closed:
+            return
+        if self._pending.shape[1]:
+            pad = self.samples_per_record - self._pending.shape[1]
+            self._write_records(np.pad(self._pending, ((0, 0), (0, pad))))
+            self._pending = self._pending[:, :0]
+        if self._pending_annotations:
+            print(f"⚠️ {len(self._pending_annotations)} annotation(s) non écrite(s) : "
+                  f"augmenter annotation_bytes ({self.annotation_bytes}).")
+        self._file.seek(236)
+        self._file.write(_format_field(self.n_records, 8).encode('latin-1'))
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Abandonne l'écriture : ferme et supprime le fichier partiel (rien n'est écrit sous `path`)."""
+        if self._file.closed:
+            return
+        self._file.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
@@ -0,0 +1,159 @@
+"""
+Extraction et stockage des fenêtres péri-événementielles (epochs) centrées sur les IEDs.
+
+Toutes les fenêtres d'un fichier EDF nettoyé sont extraites en une passe et stockées dans un
+tableau (n_events, n_channels, n_samples) au format .npy, à côté du fichier EDF, accompagné
+d'un fichier JSON de métadonnées. Le nom des fichiers contient un hash des paramètres (événements,
+canaux, fenêtre, type) : plusieurs jeux d'événements ou types d'un même EDF coexistent sans
+s'écraser. Les fichiers sont écrits sous un nom temporaire puis renommés, un lecteur ou un autre
+processus ne voit donc jamais de tableau partiel. Le tableau est relu en memmap : la morphologie, la validation
+et le calcul des templates accèdent aux fenêtres sans revenir à l'enregistrement brut.
+
+Les événements trop proches du début ou de la fin de l'enregistrement ne sont pas supprimés :
+ils sont marqués invalides ('valid' = False) et les échantillons hors enregistrement valent NaN.
+
+Le tableau est en float64 par défaut, ou en float32 (dtype='float32') : deux fois moins de disque
+et de mémoire pour des données 16 bits, avec une précision très supérieure au pas de quantification.
+
+Exemple :
+    epochs_path = get_epochs(edf_path, df_csv['Tmu_seconds'])
+    data, meta = load_epochs(epochs_path)
+    window = data[i, meta['channels'].index('F8')]
+"""
+
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+
+from preprocessing.cache import ResultCache, MANIFEST_NAME, code_version
+from preprocessing.edf_io import partial_path
+from preprocessing.signal_io import open_signal
+from preprocessing.instrumentation import profiled
+
+# Fenêtre par défaut : 0.5 s de part et d'autre de l'événement (affichage de validation d'1 s)
+EPOCH_TMIN = -0.5
+EPOCH_TMAX = 0.5
+
+# Nombre d'événements lus à la fois dans le fichier EDF (borne la mémoire de travail)
+EVENTS_PER_CHUNK = 1024
+
+
+def epochs_paths(edf_path, params=None):
+    """
+    Chemins du tableau .npy et des métadonnées .json associés à un fichier EDF et, si donnés,
+    aux paramètres d'extraction (hash court ajouté au nom).
+    """
+    base = os.path.splitext(edf_path)[0] + '_epochs'
+    if params is not None:
+        text = json.dumps(params, sort_keys=True, default=str)
+        base += '_' + hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+    return base + '.npy', base + '.json'
+
+
+def event_samples(event_times, sfreq):
+    """Indice d'échantillon de chaque événement (même convention que int(t * fs) dans les scripts)."""
+    return (np.asarray(event_times, dtype=float) * sfreq).astype(np.int64)
+
+
+@profiled(file_arg='edf_path')
+def extract_epochs(edf_path, event_times, channels=None, tmin=EPOCH_TMIN, tmax=EPOCH_TMAX, dtype=np.float64,
+                   npy_path=None):
+    """
+    Extrait les fenêtres [t + tmin, t + tmax] de chaque événement dans un fichier .npy.
+
+    :param edf_path: fichier EDF (nettoyé) source
+    :param event_times: temps des événements en secondes
+    :param channels: canaux à extraire (tous les canaux de données si None)
+    :param dtype: type du tableau (float64 ou float32)
+    :param npy_path: fichier de sortie (epochs_paths(edf_path) si None)
+    :return: chemin du fichier .npy créé
+    """
+    reader = open_signal(edf_path, dtype)
+    if channels is None:
+        channels = reader.ch_names
+    sfreq = reader.sfreq
+    event_times = np.asarray(event_times, dtype=float)
+
+    n_before = int(-tmin * sfreq)
+    n_after = int(tmax * sfreq)
+    n_samples = n_before + n_after
+    starts = event_samples(event_times, sfreq) - n_before
+    valid = (starts >= 0) & (starts + n_samples <= reader.n_times)
+
+    if npy_path is None:
+        npy_path = epochs_paths(edf_path)[0]
+    json_path = os.path.splitext(npy_path)[0] + '.json'
+    tmp_npy, tmp_json = partial_path(npy_path), partial_path(json_path)
+    try:
+        data = np.lib.format.open_memmap(tmp_npy, mode='w+', dtype=reader.dtype,
+                                         shape=(len(event_times), len(channels), n_samples))
+        for first in range(0, len(starts), EVENTS_PER_CHUNK):
+            chunk = slice(first, first + EVENTS_PER_CHUNK)
+            data[chunk] = reader.read_windows(channels, starts[chunk], n_samples)
+        data.flush()
+        del data
+    except BaseException:
+        os.remove(tmp_npy)
+        raise
+
+    meta = {
+        'edf_path': os.path.abspath(edf_path),
+        'channels': list(channels),
+        'sfreq': sfreq,
+        'tmin': tmin,
+        'tmax': tmax,
+        'n_before': n_before,
+        'n_times': reader.n_times,
+        'event_times': event_times.tolist(),
+        'valid': valid.tolist(),
+    }
+    with open(tmp_json, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_npy, npy_path)
+    os.replace(tmp_json, json_path)
+
+    n_invalid = int((~valid).sum())
+    if n_invalid:
+        print(f"{n_invalid} événement(s) en bord d'enregistrement marqués invalides (fenêtre incomplète).")
+    return npy_path
+
+
+def get_epochs(edf_path, event_times, channels=None, tmin=EPOCH_TMIN, tmax=EPOCH_TMAX, overwrite=False,
+               dtype=np.float64):
+    """
+    Renvoie le fichier d'epochs associé à edf_path et à ces paramètres, en ne le recalculant que
+    si le fichier EDF ou ce module ont changé (cache du dossier de l'EDF).
+    """
+    event_times = np.asarray(event_times, dtype=float)
+    cache = ResultCache(os.path.join(os.path.dirname(os.path.abspath(edf_path)), MANIFEST_NAME))
+    params = {
+        'events_sha256': hashlib.sha256(event_times.tobytes()).hexdigest(),
+        'channels': channels,
+        'tmin': tmin,
+        'tmax': tmax,
+        'dtype': np.dtype(dtype).name,
+    }
+    npy_path, _ = epochs_paths(edf_path, params)
+    key = cache.make_key([edf_path], params, code_version(sys.modules[__name__]))
+    if overwrite or not cache.is_fresh(npy_path, key):
+        extract_epochs(edf_path, event_times, channels, tmin, tmax, dtype, npy_path)
+        cache.record(npy_path, key)
+    return npy_path
+
+
+def load_epochs(npy_path):
+    """
+    Ouvre un fichier d'epochs en lecture seule (memmap).
+
+    :return: (data, meta) avec data de forme (n_events, n_channels, n_samples) et meta le
+             dictionnaire de métadonnées ('channels', 'sfreq', 'n_before', 'event_times', 'valid', ...)
+    """
+    data = np.load(npy_path, mmap_mode='r')
+    json_path = os.path.splitext(npy_path)[0] + '.json'
+    with open(json_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    meta['valid'] = np.asarray(meta['valid'], dtype=bool)
+    meta['event_times'] = np.asarray(meta['event_times'], dtype=float)
+    return data, meta
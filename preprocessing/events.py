@@ -0,0 +1,239 @@
+"""
+Stockage en colonnes (Parquet) des événements IED.
+
+Le CSV d'événements (colonnes 'Tmu' en µs et 'Electrode', plus d'éventuelles colonnes annexes)
+est lu une seule fois et converti en un fichier Parquet compressé et typé :
+- event_id  : numéro de ligne dans le CSV (= indice de l'epoch correspondante), int32
+- time      : temps en secondes (Tmu / 1e6), float64
+- electrode : étiquette d'électrode, catégorielle (codes + dictionnaire)
+- state     : état / période de l'événement (Eveil, Sommeil... ; nul hors période), catégoriel
+- colonnes annexes du CSV, sauf celles de `drop_columns`
+
+Le stock est un dossier partitionné par patient (<stock>/patient=<id>/events.parquet) : les
+lectures filtrées par patient, électrode, état ou plage de temps ne lisent que les fichiers,
+colonnes et groupes de lignes nécessaires. Chaque jeu de paramètres de conversion (périodes,
+colonnes supprimées) a son propre stock, <racine>/<nom du CSV>-<hash du chemin>/params=<hash> :
+des lecteurs demandant des périodes différentes ne se remplacent pas le fichier. La conversion est
+mise en cache et n'est refaite que si le CSV ou le code change.
+
+Les stocks sont écrits sous une racine de cache, jamais dans le dossier des données brutes :
+la variable d'environnement ECOFEC_EVENT_STORE, positionnée par set_store_root() (par exemple
+par run_cohort dans son dossier de sortie), et data/cache/events par défaut.
+
+Exemple :
+    df = load_events(csv_path, columns=['time', 'electrode'], periodes=config['periodes'],
+                     electrodes=['F8', 'T4'], states=['Eveil'])
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from preprocessing.cache import ResultCache, MANIFEST_NAME, code_version
+from preprocessing import periods
+from preprocessing.periods import label_periods
+
+EVENT_COLUMNS = ['event_id', 'time', 'electrode', 'state']
+
+# Clé des métadonnées Parquet où sont notés les paramètres de conversion
+PARAMS_METADATA_KEY = 'ecofec_params'
+
+# Taille des groupes de lignes Parquet (granularité des lectures filtrées)
+ROW_GROUP_SIZE = 64 * 1024
+
+# Nombre de lignes du CSV lues à la fois lors de la conversion
+CSV_CHUNK_ROWS = 1_000_000
+
+# Variable d'environnement donnant la racine des stocks, et racine par défaut
+STORE_ENV_VAR = 'ECOFEC_EVENT_STORE'
+DEFAULT_STORE_ROOT = os.path.join('data', 'cache', 'events')
+
+
+def store_root():
+    """Racine des stocks d'événements (ECOFEC_EVENT_STORE, sinon data/cache/events)."""
+    return os.environ.get(STORE_ENV_VAR) or DEFAULT_STORE_ROOT
+
+
+def set_store_root(path):
+    """Fixe la racine des stocks (processus courant et processus lancés ensuite)."""
+    os.environ[STORE_ENV_VAR] = os.path.abspath(path)
+
+
+def event_store_path(csv_path, periodes=None, drop_columns=None, root=None):
+    """
+    Dossier du stock d'événements d'un CSV pour des paramètres de conversion donnés :
+    <racine>/<nom du CSV>-<hash du chemin du CSV>/params=<hash des paramètres>.
+    """
+    csv_id = hashlib.sha256(os.path.abspath(csv_path).encode('utf-8')).hexdigest()[:8]
+    params_id = hashlib.sha256(_params_text(periodes, drop_columns).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(root or store_root(), f'{default_patient(csv_path)}-{csv_id}', f'params={params_id}')
+
+
+def patient_file(store_path, patient):
+    """Fichier Parquet d'un patient dans le stock."""
+    return os.path.join(store_path, f'patient={patient}', 'events.parquet')
+
+
+def default_patient(csv_path):
+    """Identifiant de patient par défaut : nom du fichier CSV sans extension."""
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def _params_text(periodes, drop_columns):
+    """Paramètres de conversion sérialisés (métadonnées du fichier Parquet)."""
+    return json.dumps({'periodes': periodes, 'drop_columns': sorted(drop_columns or [])}, sort_keys=True, default=str)
+
+
+def _chunk_table(df, first_id, periodes):
+    """Table Arrow d'un bloc de lignes du CSV (électrode et état encodés en dictionnaire)."""
+    time = df['Tmu'].to_numpy() / 1e6
+    columns = {
+        'event_id': pa.array(np.arange(first_id, first_id + len(df), dtype=np.int32)),
+        'time': pa.array(time),
+        'electrode': pa.array(df['Electrode'].astype(str).to_numpy(), pa.string()).dictionary_encode(),
+        'state': pa.array(label_periods(time, periodes or {}), pa.string()).dictionary_encode(),
+    }
+    for column in df.columns.drop(['Tmu', 'Electrode']):
+        # from_pandas : les valeurs manquantes (NaN) deviennent nulles, y compris dans le texte
+        columns[column] = pa.Array.from_pandas(df[column])
+    return pa.table(columns)
+
+
+def _extra_column_types(csv_path, extra_columns, chunksize):
+    """
+    Types Arrow des colonnes annexes sur l'ensemble du CSV.
+
+    pandas infère le type de chaque bloc séparément (une colonne vide dans un bloc est lue en
+    float64, du texte dans un autre) : les types des blocs sont promus vers un type commun, et une
+    colonne sans type commun (nombres et texte) est relue en texte.
+
+    :return: ({colonne: type Arrow}, colonnes à lire en texte)
+    """
+    types = {}
+    text_columns = set()
+    for chunk in pd.read_csv(csv_path, usecols=extra_columns, chunksize=chunksize):
+        for column in extra_columns:
+            if column in text_columns:
+                continue
+            field = pa.field(column, pa.Array.from_pandas(chunk[column]).type)
+            if column in types:
+                try:
+                    field = pa.unify_schemas([pa.schema([pa.field(column, types[column])]), pa.schema([field])],
+                                             promote_options='permissive').field(column)
+                except (pa.ArrowTypeError, pa.ArrowInvalid):
+                    text_columns.add(column)
+                    field = pa.field(column, pa.large_string())
+            types[column] = field.type
+    return types, text_columns
+
+
+def ingest_events(csv_path, store_path=None, patient=None, periodes=None, drop_columns=(), chunksize=CSV_CHUNK_ROWS):
+    """
+    Convertit un CSV d'événements en fichier Parquet dans le stock.
+
+    Le CSV est lu par blocs de `chunksize` lignes, chacun écrit comme un groupe de lignes
+    Parquet : la mémoire utilisée ne dépend pas de la taille de la table. Si le CSV a des
+    colonnes annexes, une première lecture de ces seules colonnes fixe leur type.
+
+    :param periodes: définition des périodes (voir periods.parse_periods) pour la colonne 'state'
+    :param drop_columns: colonnes du CSV à ne pas conserver
+    :return: chemin du fichier Parquet écrit
+    """
+    store_path = store_path or event_store_path(csv_path, periodes, drop_columns)
+    patient = patient or default_patient(csv_path)
+    drop_columns = drop_columns or ()
+
+    output_path = patient_file(store_path, patient)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    # Schéma fixé avant l'écriture du premier bloc : les colonnes annexes ont le même type dans
+    # tous les groupes de lignes (voir _extra_column_types)
+    header = pd.read_csv(csv_path, nrows=0).columns
+    extra_columns = [c for c in header if c not in ('Tmu', 'Electrode') and c not in drop_columns]
+    extra_types, text_columns = _extra_column_types(csv_path, extra_columns, chunksize) if extra_columns else ({}, set())
+    labels = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema(
+        [('event_id', pa.int32()), ('time', pa.float64()), ('electrode', labels), ('state', labels)]
+        + [(column, extra_types[column]) for column in extra_columns],
+        metadata={PARAMS_METADATA_KEY: _params_text(periodes, drop_columns)})
+
+    # Écriture dans un fichier temporaire propre au processus puis remplacement atomique
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    n_events = 0
+    try:
+        with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+            for chunk in pd.read_csv(csv_path, usecols=['Tmu', 'Electrode'] + extra_columns, chunksize=chunksize,
+                                     dtype={column: str for column in text_columns}):
+                table = _chunk_table(chunk, n_events, periodes)
+                n_events += len(chunk)
+                writer.write_table(table.cast(schema), row_group_size=ROW_GROUP_SIZE)
+    except BaseException:
+        # Pas de fichier partiel dans la partition (il serait lu avec le dossier du stock)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def get_event_store(csv_path, root=None, patient=None, periodes=None, drop_columns=None, overwrite=False):
+    """
+    Renvoie le stock d'événements d'un CSV pour ces périodes et colonnes supprimées (voir
+    event_store_path), en ne refaisant la conversion que si le CSV ou le code ont changé.
+    """
+    store_path = event_store_path(csv_path, periodes, drop_columns, root)
+    patient = patient or default_patient(csv_path)
+    output_path = patient_file(store_path, patient)
+    cache = ResultCache(os.path.join(store_path, MANIFEST_NAME))
+    params = {'periodes': periodes, 'drop_columns': sorted(drop_columns or [])}
+    key = cache.make_key([csv_path], params, code_version(sys.modules[__name__], periods))
+    if overwrite or not cache.is_fresh(output_path, key):
+        ingest_events(csv_path, store_path, patient, periodes, drop_columns)
+        cache.record(output_path, key)
+    return store_path
+
+
+def read_events(store_path, columns=None, patients=None, electrodes=None, states=None, time_range=None):
+    """
+    Lit les événements du stock, filtrés par patient, électrode, état et plage de temps [début, fin].
+
+    :param columns: colonnes à lire (toutes si None) ; 'event_id' est toujours lu pour l'ordre des lignes
+    :return: DataFrame trié par patient puis par event_id (ordre du CSV)
+    """
+    filters = []
+    if patients is not None:
+        filters.append(('patient', 'in', [str(p) for p in patients]))
+    if electrodes is not None:
+        filters.append(('electrode', 'in', list(electrodes)))
+    if states is not None:
+        filters.append(('state', 'in', list(states)))
+    if time_range is not None:
+        filters.append(('time', '>=', float(time_range[0])))
+        filters.append(('time', '<=', float(time_range[1])))
+
+    if columns is not None:
+        columns = list(dict.fromkeys(['event_id'] + list(columns)))
+    table = pq.read_table(store_path, columns=columns, filters=filters or None, partitioning='hive')
+    df = table.to_pandas()
+    sort_keys = [c for c in ('patient', 'event_id') if c in df.columns]
+    return df.sort_values(sort_keys, kind='stable').reset_index(drop=True)
+
+
+def load_events(csv_path, columns=None, periodes=None, drop_columns=None, patient=None, **filters):
+    """
+    Événements d'un CSV lus depuis son stock Parquet (créé ou mis à jour si besoin).
+    `filters` : electrodes, states, time_range (voir read_events).
+    """
+    patient = patient or default_patient(csv_path)
+    store_path = get_event_store(csv_path, patient=patient, periodes=periodes, drop_columns=drop_columns)
+    df = read_events(patient_file(store_path, patient), columns=columns, **filters)
+    for column in ('electrode', 'state'):
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
@@ -0,0 +1,191 @@
+"""
+Conception et application des filtres du prétraitement.
+
+Les noyaux sont construits avec mne.filter.create_filter en reprenant les paramètres
+de raw.notch_filter(fir_design='firwin') et raw.filter(fir_design='firwin'), puis
+appliqués en phase nulle par convolution centrée, après un padding 'reflect_limited'
+aux bords du signal comme le fait MNE. Cela permet de filtrer un enregistrement par
+blocs chevauchants avec le même résultat qu'un filtrage sur le signal complet.
+
+design_filter fusionne le coupe-bande et le passe-bande en une seule réponse, appliquée en
+une passe (convolution FFT par recouvrement-addition) au lieu de deux, et met en cache les
+filtres conçus par (sfreq, l_freq, h_freq, notch_freq, méthode) : une cohorte ne partage que
+quelques fréquences d'échantillonnage. Deux méthodes :
+- 'fir' : produit de convolution des deux noyaux FIR de MNE (même résultat que les deux passes
+          raw.notch_filter puis raw.filter, à la précision numérique près) ;
+- 'iir' : Butterworth passe-bande et coupe-bande (iirnotch) en sections du second ordre,
+          appliqués en phase nulle (aller-retour, sosfiltfilt). Par blocs, la marge est la
+          durée d'amortissement de la réponse impulsionnelle : le résultat est identique au
+          filtrage du signal complet à la précision `IIR_TOLERANCE` près.
+
+Le rééchantillonnage optionnel (polyphase, rapport rationnel up / down) se fait après le
+passe-bande, dont le passe-bas sert de filtre anti-repliement : le noyau du rééchantillonneur
+n'a qu'à couper au-delà de target_sfreq - h_freq, avec une bande de transition large, donc
+un noyau court.
+
+Le résultat garde le type du signal : un signal float32 est filtré et rééchantillonné en float32
+(le filtre IIR est calculé en float64 par scipy puis reconverti).
+"""
+
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+import mne
+from scipy.signal import butter, firwin, iirnotch, oaconvolve, resample_poly, sosfilt, sosfiltfilt, tf2sos
+
+FILTER_METHODS = ('fir', 'iir')
+
+# Filtre IIR : ordre du Butterworth (par bande) et largeur (Hz) du coupe-bande à -3 dB
+IIR_ORDER = 4
+IIR_NOTCH_BANDWIDTH = 1.0
+
+# Amplitude relative sous laquelle la réponse impulsionnelle IIR est considérée éteinte
+IIR_TOLERANCE = 1e-7
+IIR_MAX_DECAY_SEC = 60.0
+
+
+def design_notch_kernel(sfreq, notch_freq, notch_width=None, trans_bandwidth=1.0):
+    """
+    Noyau FIR coupe-bande équivalent à raw.notch_filter(freqs=notch_freq, fir_design='firwin').
+    """
+    if notch_width is None:
+        notch_width = notch_freq / 200.0
+    half_trans = trans_bandwidth / 2.0
+    low = notch_freq - notch_width / 2.0 - half_trans
+    high = notch_freq + notch_width / 2.0 + half_trans
+    # l_freq > h_freq : MNE construit un filtre coupe-bande
+    return mne.filter.create_filter(None, sfreq, l_freq=high, h_freq=low,
+                                    l_trans_bandwidth=half_trans, h_trans_bandwidth=half_trans,
+                                    fir_design='firwin', verbose=False)
+
+
+def design_bandpass_kernel(sfreq, l_freq, h_freq):
+    """
+    Noyau FIR passe-bande équivalent à raw.filter(l_freq, h_freq, fir_design='firwin').
+    """
+    return mne.filter.create_filter(None, sfreq, l_freq=l_freq, h_freq=h_freq,
+                                    fir_design='firwin', verbose=False)
+
+
+@lru_cache(maxsize=None)
+def design_filter(sfreq, l_freq, h_freq, notch_freq=None, method='fir'):
+    """
+    Filtre combiné coupe-bande (notch_freq, optionnel) + passe-bande [l_freq, h_freq], mis en
+    cache par paramètres.
+
+    :return: (coefficients, marge) : noyau FIR (méthode 'fir') ou sections du second ordre
+             (méthode 'iir'), et nombre d'échantillons non fiables sur un bord intérieur de bloc
+    """
+    if method == 'fir':
+        kernel = design_bandpass_kernel(sfreq, l_freq, h_freq)
+        if notch_freq is not None:
+            kernel = np.convolve(design_notch_kernel(sfreq, notch_freq), kernel)
+        kernel.setflags(write=False)
+        return kernel, len(kernel) // 2
+    if method == 'iir':
+        sos = butter(IIR_ORDER, [l_freq, h_freq], btype='bandpass', fs=sfreq, output='sos')
+        if notch_freq is not None:
+            b, a = iirnotch(notch_freq, notch_freq / IIR_NOTCH_BANDWIDTH, fs=sfreq)
+            sos = np.vstack([tf2sos(b, a), sos])
+        margin = _iir_margin(sos, sfreq)
+        sos.setflags(write=False)
+        return sos, margin
+    raise ValueError(f"Méthode de filtrage inconnue : {method} (disponibles : {', '.join(FILTER_METHODS)})")
+
+
+def _iir_margin(sos, sfreq):
+    """Durée (en échantillons) de la réponse impulsionnelle jusqu'à IIR_TOLERANCE de son maximum."""
+    impulse = np.zeros(int(IIR_MAX_DECAY_SEC * sfreq))
+    impulse[0] = 1.0
+    response = np.abs(sosfilt(sos, impulse))
+    return int(np.flatnonzero(response > IIR_TOLERANCE * response.max())[-1]) + 1
+
+
+def apply_filter(data, design, method='fir', at_start=True, at_end=True):
+    """
+    Applique un filtre de design_filter en phase nulle sur data (n_channels, n_samples), en une passe.
+
+    Comme apply_fir, les `marge` échantillons de chaque bord intérieur (bloc découpé dans un
+    enregistrement plus long) ne sont pas fiables et sont retirés du résultat.
+    """
+    coefficients, margin = design
+    if method == 'fir':
+        return apply_fir(data, coefficients, at_start=at_start, at_end=at_end)
+    # scipy exige des coefficients modifiables : copie des sections en cache (quelques valeurs)
+    filtered = sosfiltfilt(np.array(coefficients), data, axis=-1).astype(data.dtype, copy=False)
+    return filtered[..., (0 if at_start else margin):filtered.shape[-1] - (0 if at_end else margin)]
+
+
+def pad_reflect_limited(data, n_left, n_right):
+    """
+    Padding 'reflect_limited' de MNE sur le dernier axe : réflexion impaire autour des
+    échantillons de bord, complétée par des zéros si le signal est plus court que le padding.
+    """
+    n = data.shape[-1]
+    left_zeros = np.zeros(data.shape[:-1] + (max(n_left - n + 1, 0),), dtype=data.dtype)
+    right_zeros = np.zeros(data.shape[:-1] + (max(n_right - n + 1, 0),), dtype=data.dtype)
+    left = 2 * data[..., :1] - data[..., n_left:0:-1]
+    right = 2 * data[..., -1:] - data[..., -2:-n_right - 2:-1]
+    return np.concatenate([left_zeros, left, data, right, right_zeros], axis=-1)
+
+
+def apply_fir(data, h, at_start=True, at_end=True):
+    """
+    Applique le noyau h (longueur impaire, phase linéaire) en phase nulle sur data (n_channels, n_samples).
+
+    Aux bords réels du signal (at_start / at_end), le signal est prolongé par réflexion.
+    Sur un bord intérieur (bloc découpé dans un enregistrement plus long), les len(h) // 2
+    échantillons de bord ne sont pas fiables et sont retirés du résultat.
+
+    :return: signal filtré, raccourci de len(h) // 2 échantillons de chaque côté intérieur
+    """
+    half = len(h) // 2
+    n_left = half if at_start else 0
+    n_right = half if at_end else 0
+    padded = pad_reflect_limited(data, n_left, n_right)
+    # Noyau dans le type du signal : un signal float32 est filtré en float32
+    filtered = oaconvolve(padded, h[np.newaxis, :].astype(padded.dtype, copy=False), mode='same', axes=-1)
+    # Le padding des bords réels et les bords intérieurs non fiables font tous deux `half` échantillons
+    return filtered[..., half:filtered.shape[-1] - half]
+
+
+def resample_ratio(sfreq, target_sfreq):
+    """Rapport (up, down) irréductible de target_sfreq / sfreq."""
+    ratio = Fraction(target_sfreq).limit_denominator(1000) / Fraction(sfreq).limit_denominator(1000)
+    return ratio.numerator, ratio.denominator
+
+
+def design_resample_kernel(sfreq, target_sfreq, h_freq):
+    """
+    Noyau FIR (à la fréquence sfreq * up) du rééchantillonnage polyphase d'un signal déjà
+    filtré en dessous de h_freq : bande passante [0, h_freq], bande coupée à partir de
+    target_sfreq - h_freq (ce qui s'y trouve se replierait sous h_freq).
+
+    :return: (up, down, noyau)
+    """
+    if target_sfreq > sfreq:
+        raise ValueError(f"Fréquence cible ({target_sfreq} Hz) supérieure à celle du fichier ({sfreq} Hz) : "
+                         f"le rééchantillonnage ne sert qu'à réduire le nombre d'échantillons.")
+    if target_sfreq <= 2 * h_freq:
+        raise ValueError(f"Fréquence cible ({target_sfreq} Hz) trop basse pour h_freq = {h_freq} Hz "
+                         f"(elle doit dépasser 2 * h_freq).")
+    up, down = resample_ratio(sfreq, target_sfreq)
+    fs_up = sfreq * up
+    transition = target_sfreq - 2 * h_freq
+    # Longueur d'un fenêtrage de Hamming (comme firwin dans MNE), impaire
+    numtaps = int(np.ceil(3.3 * fs_up / transition)) // 2 * 2 + 1
+    return up, down, firwin(numtaps, h_freq + transition / 2, window='hamming', fs=fs_up)
+
+
+def resample_margin(up, down, kernel):
+    """Marge (en échantillons d'entrée, multiple de down) perturbée aux bords par le rééchantillonnage."""
+    half = int(np.ceil((len(kernel) // 2) / up)) + 1
+    return int(np.ceil(half / down)) * down
+
+
+def resample(data, up, down, kernel):
+    """Rééchantillonnage polyphase de data (n_channels, n_samples) par up / down, avec le noyau donné."""
+    if up == down == 1:
+        return data
+    return resample_poly(data, up, down, axis=-1, window=kernel.astype(data.dtype, copy=False), padtype='line')
@@ -0,0 +1,254 @@
+"""
+Mesure des étapes de traitement : temps écoulé, temps CPU, pic de mémoire et entrées/sorties.
+
+Les mesures sont activées par la variable d'environnement ECOFEC_PROFILE (chemin d'un fichier
+JSON lines), ou par enable(path) qui la positionne aussi pour les processus lancés ensuite.
+Chaque étape terminée ajoute une ligne au fichier :
+    {"stage": "edf_cleaning.filter", "file": "p1.edf", "wall_s": 4.2, "cpu_s": 4.1,
+     "peak_rss_mb": 812.0, "read_bytes": 0, "write_bytes": 0, "disk_read_bytes": 0,
+     "disk_write_bytes": 0, "status": "ok", "pid": 1234, "time": "2025-01-01T12:00:00"}
+
+- peak_rss_mb : pic de mémoire résidente du processus pendant l'étape (le compteur VmHWM de
+  Linux est remis à zéro au début de chaque étape ; à défaut, pic depuis le début du processus,
+  null si le système ne donne pas cette mesure) ;
+- read_bytes / write_bytes : octets lus / écrits par appels système (fichiers, tubes) ;
+- disk_read_bytes / disk_write_bytes : octets réellement lus / écrits sur le disque, y compris
+  les lectures par memmap (EdfReader), hors cache du système.
+Les compteurs d'E/S viennent de /proc/self/io et valent null sur les systèmes qui ne l'ont pas.
+
+Désactivées, stage() renvoie un contexte vide partagé et profiled() appelle directement la
+fonction : le coût est celui d'un test de variable globale.
+
+Exemple :
+    with stage('edf_cleaning.filter', file=edf_path):
+        raw.apply_function(...)
+
+    @profiled('ieds_morphology.morphology_from_files')
+    def morphology_from_files(csv_path, ...): ...
+"""
+
+import contextlib
+import datetime
+import functools
+import inspect
+import json
+import os
+import time
+
+ENV_VAR = 'ECOFEC_PROFILE'
+
+_path = os.environ.get(ENV_VAR) or None
+_stack = []
+_NULL = contextlib.nullcontext()
+
+
+def enable(path):
+    """Active les mesures vers le fichier JSON lines `path` (processus courant et processus lancés ensuite)."""
+    global _path
+    _path = os.path.abspath(path)
+    os.environ[ENV_VAR] = _path
+    os.makedirs(os.path.dirname(_path), exist_ok=True)
+
+
+def disable():
+    """Désactive les mesures."""
+    global _path
+    _path = None
+    os.environ.pop(ENV_VAR, None)
+
+
+def enabled():
+    """Vrai si les mesures sont activées."""
+    return _path is not None
+
+
+def _io_counters():
+    """Compteurs d'E/S du processus (rchar, wchar, read_bytes, write_bytes), None si indisponibles."""
+    try:
+        with open('/proc/self/io', 'rb') as f:
+            values = dict(line.split(b':') for line in f.read().splitlines())
+        return {key.decode(): int(value) for key, value in values.items()}
+    except (OSError, ValueError):
+        return None
+
+
+def _status_kb(field):
+    """Champ mémoire de /proc/self/status (en ko), None si indisponible."""
+    try:
+        with open('/proc/self/status', 'rb') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _reset_peak():
+    """Remet le pic de mémoire (VmHWM) à la mémoire actuelle ; False si impossible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_kb():
+    """
+    Pic de mémoire résidente depuis la dernière remise à zéro (ou depuis le début du processus),
+    None si indisponible (module resource absent sous Windows).
+    """
+    peak = _status_kb(b'VmHWM:')
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _write(record):
+    line = (json.dumps(record, default=str) + '\n').encode('utf-8')
+    # Une seule écriture en mode ajout : les lignes de processus parallèles ne se mélangent pas
+    fd = os.open(_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def _measure(name, fields, emit=None):
+    # Le pic des étapes englobantes est relevé avant la remise à zéro du compteur
+    peak = _peak_kb()
+    if peak is not None:
+        for frame in _stack:
+            frame['peak_kb'] = max(frame['peak_kb'] or 0, peak)
+    frame = {'peak_kb': 0}
+    if _reset_peak():
+        frame['peak_kb'] = _status_kb(b'VmRSS:') or 0
+    else:
+        frame['peak_kb'] = peak
+    _stack.append(frame)
+
+    io_start = _io_counters()
+    wall, cpu = time.perf_counter(), time.process_time()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        io_end = _io_counters()
+        _stack.pop()
+        peak = _peak_kb()
+        if peak is not None:
+            peak = max(frame['peak_kb'] or 0, peak)
+            for parent in _stack:
+                parent['peak_kb'] = max(parent['peak_kb'] or 0, peak)
+
+        def delta(key):
+            return io_end[key] - io_start[key] if io_start and io_end and key in io_start else None
+
+        (emit or _write)({
+            'stage': name,
+            **fields,
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'peak_rss_mb': round(peak / 1024, 1) if peak is not None else None,
+            'read_bytes': delta('rchar'),
+            'write_bytes': delta('wchar'),
+            'disk_read_bytes': delta('read_bytes'),
+            'disk_write_bytes': delta('write_bytes'),
+            'status': status,
+            'pid': os.getpid(),
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        })
+
+
+def stage(name, **fields):
+    """
+    Contexte mesurant une étape ; `fields` (ex. file=chemin) sont ajoutés à la ligne JSON.
+    Les étapes peuvent être imbriquées.
+    """
+    if _path is None:
+        return _NULL
+    return _measure(name, fields)
+
+
+class StageTotals:
+    """
+    Cumul des mesures de sous-étapes répétées (par exemple à chaque bloc d'un traitement en flux) :
+    une seule ligne par sous-étape est écrite par emit(), avec le nombre d'appels ('calls'),
+    les temps et octets additionnés et le plus grand pic de mémoire.
+
+    Exemple :
+        totals = StageTotals(file=edf_path)
+        for block in blocks:
+            with totals.part('edf_cleaning.decode'):
+                ...
+        totals.emit()
+    """
+
+    def __init__(self, **fields):
+        self.fields = fields
+        self.records = {}
+
+    def part(self, name):
+        if _path is None:
+            return _NULL
+        return _measure(name, self.fields, emit=self._add)
+
+    def _add(self, record):
+        total = self.records.get(record['stage'])
+        if total is None:
+            self.records[record['stage']] = dict(record, calls=1)
+            return
+        total['calls'] += 1
+        for key in ('wall_s', 'cpu_s', 'read_bytes', 'write_bytes', 'disk_read_bytes', 'disk_write_bytes'):
+            if total[key] is not None and record[key] is not None:
+                total[key] += record[key]
+        if total['peak_rss_mb'] is not None and record['peak_rss_mb'] is not None:
+            total['peak_rss_mb'] = max(total['peak_rss_mb'], record['peak_rss_mb'])
+        if record['status'] != 'ok':
+            total['status'] = record['status']
+
+    def emit(self):
+        """Écrit les cumuls (une ligne par sous-étape) et les remet à zéro."""
+        if _path is not None:
+            for record in self.records.values():
+                record['wall_s'] = round(record['wall_s'], 6)
+                record['cpu_s'] = round(record['cpu_s'], 6)
+                record['time'] = datetime.datetime.now().isoformat(timespec='seconds')
+                _write(record)
+        self.records = {}
+
+
+def profiled(name=None, file_arg=None):
+    """
+    Décorateur : mesure chaque appel de la fonction comme une étape.
+
+    :param name: nom de l'étape (module.fonction par défaut)
+    :param file_arg: nom du paramètre donnant le fichier traité (champ 'file')
+    """
+    def decorator(func):
+        stage_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+        signature = inspect.signature(func) if file_arg else None
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _path is None:
+                return func(*args, **kwargs)
+            fields = {}
+            if signature is not None:
+                bound = signature.bind_partial(*args, **kwargs).arguments
+                if file_arg in bound:
+                    fields['file'] = bound[file_arg]
+            with _measure(stage_name, fields):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
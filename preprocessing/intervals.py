@@ -0,0 +1,96 @@
+"""
+Opérations sur des ensembles d'intervalles [début, fin).
+
+Les intervalles sont représentés par des tableaux numpy de forme (n, 2). Toutes les opérations
+sont vectorisées et leur coût dépend du nombre d'intervalles, pas de la durée qu'ils couvrent :
+c'est ce qui permet de trouver les segments propres d'un enregistrement de 24 h à partir des
+seuls onsets des pointes, sans parcourir le signal échantillon par échantillon.
+
+Exemple :
+    artefacts = merge_intervals(np.column_stack([debuts, fins]))
+    propres = filter_min_length(complement(artefacts, 0, n_samples), min_samples)
+"""
+
+import numpy as np
+
+
+def as_intervals(intervals):
+    """Convertit une liste de paires (début, fin) en tableau (n, 2), sans les intervalles vides."""
+    intervals = np.asarray(intervals)
+    if intervals.size == 0:
+        return np.empty((0, 2), dtype=intervals.dtype if intervals.dtype != object else float)
+    intervals = intervals.reshape(-1, 2)
+    return intervals[intervals[:, 1] > intervals[:, 0]]
+
+
+def sort_intervals(intervals):
+    """Trie les intervalles par début croissant (puis par fin)."""
+    intervals = as_intervals(intervals)
+    order = np.lexsort((intervals[:, 1], intervals[:, 0]))
+    return intervals[order]
+
+
+def merge_intervals(intervals):
+    """
+    Fusionne les intervalles qui se chevauchent ou se touchent.
+    :return: intervalles triés et disjoints
+    """
+    intervals = sort_intervals(intervals)
+    if len(intervals) == 0:
+        return intervals
+    # Fin maximale atteinte par les intervalles précédents : un nouveau bloc commence
+    # lorsque le début dépasse strictement cette fin
+    running_end = np.maximum.accumulate(intervals[:, 1])
+    new_block = np.empty(len(intervals), dtype=bool)
+    new_block[0] = True
+    new_block[1:] = intervals[1:, 0] > running_end[:-1]
+    block_starts = np.flatnonzero(new_block)
+    block_ends = np.append(block_starts[1:], len(intervals)) - 1
+    return np.column_stack([intervals[block_starts, 0], running_end[block_ends]])
+
+
+def complement(intervals, start, stop):
+    """Parties de [start, stop) non couvertes par les intervalles."""
+    merged = merge_intervals(intervals)
+    if len(merged):
+        merged = np.clip(merged, start, stop)
+    bounds = np.concatenate([[start], merged.ravel(), [stop]])
+    gaps = bounds.reshape(-1, 2)
+    return gaps[gaps[:, 1] > gaps[:, 0]]
+
+
+def intersect(a, b):
+    """Intersection de deux ensembles d'intervalles."""
+    a = merge_intervals(a)
+    b = merge_intervals(b)
+    if len(a) == 0 or len(b) == 0:
+        return np.empty((0, 2), dtype=np.result_type(a, b))
+    # Pour chaque intervalle de a : intervalles de b qui le chevauchent, [first, last)
+    first = np.searchsorted(b[:, 1], a[:, 0], side='right')
+    last = np.searchsorted(b[:, 0], a[:, 1], side='left')
+    counts = np.maximum(last - first, 0)
+    a_idx = np.repeat(np.arange(len(a)), counts)
+    b_idx = np.repeat(first, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+    result = np.column_stack([np.maximum(a[a_idx, 0], b[b_idx, 0]), np.minimum(a[a_idx, 1], b[b_idx, 1])])
+    return result[result[:, 1] > result[:, 0]]
+
+
+def filter_min_length(intervals, min_length):
+    """Garde les intervalles de longueur >= min_length."""
+    intervals = as_intervals(intervals)
+    return intervals[(intervals[:, 1] - intervals[:, 0]) >= min_length]
+
+
+def contained_in(intervals, containers):
+    """
+    Masque booléen : chaque intervalle est-il entièrement inclus (bornes comprises) dans
+    l'un des conteneurs ? Les conteneurs qui se chevauchent sont fusionnés au préalable.
+    """
+    intervals = np.asarray(intervals, dtype=float).reshape(-1, 2)
+    containers = merge_intervals(np.asarray(containers, dtype=float))
+    if len(containers) == 0:
+        return np.zeros(len(intervals), dtype=bool)
+    idx = np.searchsorted(containers[:, 0], intervals[:, 0], side='right') - 1
+    inside = idx >= 0
+    idx = np.maximum(idx, 0)
+    return inside & (intervals[:, 1] <= containers[idx, 1])
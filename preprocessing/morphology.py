@@ -0,0 +1,151 @@
+"""
+Calcul vectorisé de la morphologie des IEDs sur un lot de fenêtres.
+
+compute_morphology_batch reproduit, pour toutes les fenêtres à la fois, les mesures historiquement
+calculées événement par événement dans scripts/ieds_morphology.py :
+- pic : maximum de |signal| dans la fenêtre restreinte autour de l'événement,
+- passages gauche/droit : changements de signe de la pente (à au moins 7 / 5 échantillons du pic),
+- amplitude : pic - signal au passage gauche,
+- demi-largeur : écart entre les derniers/premiers points >= -amplitude / 2 de part et d'autre du pic,
+- pentes : extrema de la dérivée filtrée (passe-bas de Butterworth) avant et après le pic.
+
+Les résultats sont identiques au calcul par événement ; le filtre de la dérivée n'est conçu
+qu'une fois par fréquence d'échantillonnage. Des fenêtres float32 sont traitées en float32.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, lfilter
+
+# Zone de recherche du pic autour de l'événement : [-25 ms, +20 ms]
+PEAK_SEARCH_BEFORE = 0.025
+PEAK_SEARCH_AFTER = 0.02
+
+
+@lru_cache(maxsize=None)
+def slope_filter(fs, cutoff=80, order=2):
+    """Coefficients (b, a) du passe-bas appliqué à la dérivée, mis en cache par fréquence."""
+    nyquist = 0.5 * fs
+    norm_cutoff = cutoff / nyquist
+    return butter(order, norm_cutoff, btype='low', analog=False)
+
+
+def _last_true(mask, default):
+    """Indice du dernier True de chaque ligne, `default` si la ligne n'en contient pas."""
+    n = mask.shape[1]
+    last = n - 1 - np.argmax(mask[:, ::-1], axis=1)
+    return np.where(mask.any(axis=1), last, default)
+
+
+def _first_true(mask, default):
+    """Indice du premier True de chaque ligne, `default` si la ligne n'en contient pas."""
+    first = np.argmax(mask, axis=1)
+    return np.where(mask.any(axis=1), first, default)
+
+
+def peak_search_bounds(center_idx, start_idx, fs):
+    """
+    Bornes [début, fin) de la zone de recherche du pic dans des fenêtres commençant à start_idx,
+    pour des événements à l'échantillon center_idx.
+    """
+    center_idx = np.asarray(center_idx)
+    restricted_start = (center_idx - PEAK_SEARCH_BEFORE * fs).astype(int) - start_idx
+    restricted_end = (center_idx + PEAK_SEARCH_AFTER * fs).astype(int) - start_idx
+    return restricted_start, restricted_end
+
+
+def _as_float(windows):
+    """Fenêtres en flottants : float32 et float64 sont conservés, les autres types convertis en float64."""
+    windows = np.asarray(windows)
+    return windows if windows.dtype in (np.float32, np.float64) else windows.astype(float)
+
+
+def find_peaks_batch(windows, restricted_start, restricted_end):
+    """
+    Pic de chaque fenêtre : indice et valeur du maximum de |signal| dans la zone restreinte.
+
+    :param windows: tableau (n_windows, n_samples)
+    :return: (peak_index, peak_value), tableaux de longueur n_windows
+    """
+    windows = _as_float(windows)
+    n_windows, n_samples = windows.shape
+    sample = np.arange(n_samples)[np.newaxis, :]
+    restricted_start = np.broadcast_to(np.asarray(restricted_start), (n_windows,))[:, np.newaxis]
+    restricted_end = np.broadcast_to(np.asarray(restricted_end), (n_windows,))[:, np.newaxis]
+
+    abs_windows = np.abs(windows)
+    in_restricted = (sample >= restricted_start) & (sample < restricted_end)
+    peak_index = np.argmax(np.where(in_restricted, abs_windows, -np.inf), axis=1)
+    return peak_index, abs_windows[np.arange(n_windows), peak_index]
+
+
+def compute_morphology_batch(windows, fs, restricted_start, restricted_end):
+    """
+    Mesures morphologiques de toutes les fenêtres d'un lot.
+
+    :param windows: tableau (n_windows, n_samples) de fenêtres centrées sur les événements
+    :param fs: fréquence d'échantillonnage (Hz)
+    :param restricted_start: début (inclus) de la zone de recherche du pic dans chaque fenêtre
+                             (scalaire ou tableau de n_windows indices)
+    :param restricted_end: fin (exclue) de la zone de recherche du pic
+    :return: dictionnaire de tableaux de longueur n_windows : 'peak_index', 'peak_value',
+             'amplitude', 'half_amplitude', 'half_width', 'half_width_left', 'half_width_right',
+             'crossing_left', 'crossing_right', 'negative_slope', 'positive_slope',
+             'negative_slope_index', 'positive_slope_index', et 'derivative_smoothed'
+             (n_windows, n_samples - 1)
+    """
+    windows = _as_float(windows)
+    n_windows, n_samples = windows.shape
+    rows = np.arange(n_windows)
+    sample = np.arange(n_samples)[np.newaxis, :]
+
+    # --- Pic : max de |signal| dans la fenêtre restreinte ---
+    peak_index, peak_value = find_peaks_batch(windows, restricted_start, restricted_end)
+    peak = peak_index[:, np.newaxis]
+
+    # --- Passages : changements de signe de la pente ---
+    sign_change = np.diff(np.sign(np.diff(windows, axis=1)), axis=1) != 0
+    change_idx = sample[:, :n_samples - 2]
+    crossing_left = _last_true(sign_change & (change_idx <= peak - 7), 0)
+    crossing_right = _first_true(sign_change & (change_idx >= peak + 5), n_samples - 2) + 1
+
+    amplitude = peak_value - windows[rows, crossing_left]
+    half_amplitude = -amplitude / 2
+
+    # --- Demi-largeur ---
+    above_half = windows >= half_amplitude[:, np.newaxis]
+    left_mask = above_half & (sample < peak)
+    right_mask = above_half & (sample >= peak)
+    half_width_left = _last_true(left_mask, -1)
+    half_width_right = _first_true(right_mask, -1)
+    found = left_mask.any(axis=1) & right_mask.any(axis=1)
+    half_width = np.where(found, half_width_right - half_width_left, np.nan)
+
+    # --- Pentes : extrema de la dérivée filtrée autour du pic ---
+    b, a = slope_filter(fs)
+    derivative = np.diff(windows, axis=1) / (1 / fs)
+    derivative_smoothed = lfilter(b, a, derivative, axis=1)
+    deriv_idx = sample[:, :n_samples - 1]
+
+    before_peak = (deriv_idx >= np.maximum(0, peak - 15)) & (deriv_idx <= peak)
+    negative_slope_index = np.argmin(np.where(before_peak, derivative_smoothed, np.inf), axis=1)
+    after_peak = (deriv_idx >= peak) & (deriv_idx < peak + 20)
+    positive_slope_index = np.argmax(np.where(after_peak, derivative_smoothed, -np.inf), axis=1)
+
+    return {
+        'peak_index': peak_index,
+        'peak_value': peak_value,
+        'amplitude': amplitude,
+        'half_amplitude': half_amplitude,
+        'half_width': half_width,
+        'half_width_left': half_width_left,
+        'half_width_right': half_width_right,
+        'crossing_left': crossing_left,
+        'crossing_right': crossing_right,
+        'negative_slope': derivative_smoothed[rows, negative_slope_index],
+        'positive_slope': derivative_smoothed[rows, positive_slope_index],
+        'negative_slope_index': negative_slope_index,
+        'positive_slope_index': positive_slope_index,
+        'derivative_smoothed': derivative_smoothed,
+    }
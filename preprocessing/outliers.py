@@ -0,0 +1,48 @@
+"""
+Détection d'outliers par la règle de l'écart interquartile (IQR), par groupe.
+
+Pour chaque groupe (ex. électrode × période) et chaque variable, les bornes sont
+[Q1 - k·IQR, Q3 + k·IQR] avec IQR = Q3 - Q1. Les quartiles de toutes les variables et de tous
+les groupes sont calculés en un seul passage groupby, puis ramenés sur les lignes par
+réindexation : le coût ne dépend plus du nombre de groupes, ce qui compte pour la table de
+morphologie de toute une cohorte.
+
+Exemple :
+    flags = iqr_outlier_flags(df_results, ['Amplitude', 'Half_Width'], by=['Electrode', 'Periode'])
+    df_results[flags['Amplitude']]      # outliers d'amplitude
+    df_results[flags.any(axis=1)]       # outliers pour au moins une variable
+"""
+
+import pandas as pd
+
+
+def iqr_fences(df, variables, by, k=1.5):
+    """
+    Bornes IQR de chaque variable dans chaque groupe.
+
+    :return: (lower, upper), deux DataFrames indexés par groupe, une colonne par variable
+    """
+    quartiles = df.groupby(by, observed=True, sort=False)[list(variables)].quantile([0.25, 0.75])
+    q1 = quartiles.xs(0.25, level=-1)
+    q3 = quartiles.xs(0.75, level=-1)
+    iqr = q3 - q1
+    return q1 - k * iqr, q3 + k * iqr
+
+
+def iqr_outlier_flags(df, variables, by, k=1.5):
+    """
+    Matrice booléenne des outliers, alignée sur `df` (même index, une colonne par variable).
+    Une valeur manquante, ou une ligne dont le groupe est manquant, n'est jamais un outlier.
+    """
+    variables = list(variables)
+    by = [by] if isinstance(by, str) else list(by)
+    lower, upper = iqr_fences(df, variables, by, k)
+
+    # Bornes du groupe de chaque ligne
+    keys = pd.MultiIndex.from_frame(df[by]) if len(by) > 1 else pd.Index(df[by[0]])
+    row_lower = lower.reindex(keys).to_numpy()
+    row_upper = upper.reindex(keys).to_numpy()
+
+    values = df[variables].to_numpy(dtype=float)
+    flags = (values < row_lower) | (values > row_upper)
+    return pd.DataFrame(flags, index=df.index, columns=variables)
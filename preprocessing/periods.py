@@ -0,0 +1,77 @@
+"""
+Attribution vectorisée d'un état (Eveil, Sommeil, ...) à des temps d'événements.
+
+Les périodes sont lues depuis la clé `periodes` des fichiers YAML, sous l'une des deux formes
+utilisées dans le projet :
+- dictionnaire {état: [[début, fin], ...]}             (ied_event_analysis)
+- liste [{'name': état, 'start': début, 'end': fin}]   (select_validate_ieds)
+La fin peut valoir 'max' (jusqu'à la fin de l'enregistrement).
+
+Règles communes à tous les scripts :
+- les bornes sont incluses : un événement à t = début ou t = fin appartient à la période ;
+- si des périodes se chevauchent, la première période listée l'emporte ;
+- un événement hors de toute période reçoit l'étiquette `default`.
+
+L'étiquetage se fait par recherche dichotomique dans les bornes triées : le coût est
+O(n_événements · log n_périodes) quel que soit l'ordre des périodes dans le fichier.
+
+Exemple :
+    df['Etat'] = label_periods(df['Tmu'], config['periodes'], default='REJETE')
+"""
+
+import numpy as np
+
+
+def _to_bound(value):
+    """Convertit une borne YAML en float ('max' -> +inf, 'min' -> -inf)."""
+    if isinstance(value, str):
+        if value.lower() == 'max':
+            return np.inf
+        if value.lower() == 'min':
+            return -np.inf
+    return float(value)
+
+
+def parse_periods(periodes):
+    """
+    Normalise une définition de périodes en liste [(nom, début, fin)], dans l'ordre de priorité.
+    """
+    if isinstance(periodes, dict):
+        return [(name, _to_bound(start), _to_bound(end))
+                for name, ranges in periodes.items()
+                for start, end in ranges]
+    return [(periode['name'], _to_bound(periode['start']), _to_bound(periode['end']))
+            for periode in periodes]
+
+
+def label_periods(times, periodes, default=None):
+    """
+    Étiquette chaque temps avec le nom de la période qui le contient.
+
+    :param times: temps des événements (secondes), tableau ou Series
+    :param periodes: définition des périodes (voir parse_periods)
+    :param default: étiquette des temps hors de toute période
+    :return: tableau numpy (dtype object) d'étiquettes, aligné sur `times`
+    """
+    periods = parse_periods(periodes)
+    times = np.asarray(times, dtype=float)
+    labels = np.array([name for name, _, _ in periods] + [default], dtype=object)
+    if not periods:
+        return np.full(times.shape, default, dtype=object)
+
+    starts = np.array([start for _, start, _ in periods])
+    # Fin incluse : la période couvre [début, nextafter(fin))
+    stops = np.nextafter(np.array([end for _, _, end in periods]), np.inf)
+
+    # Intervalles élémentaires délimités par toutes les bornes, et période gagnante de chacun
+    boundaries = np.unique(np.concatenate([starts, stops]))
+    winner = np.full(len(boundaries), len(periods))
+    for p in range(len(periods) - 1, -1, -1):
+        # Parcours en ordre inverse : la première période listée écrase les suivantes
+        first = np.searchsorted(boundaries, starts[p])
+        last = np.searchsorted(boundaries, stops[p])
+        winner[first:last] = p
+
+    piece = np.searchsorted(boundaries, times, side='right') - 1
+    index = np.where(piece >= 0, winner[np.maximum(piece, 0)], len(periods))
+    return labels[index]
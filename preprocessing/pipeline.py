@@ -0,0 +1,205 @@
+"""
+Exécution d'un graphe de tâches avec cache de résultats, parallélisme et reprise.
+
+Une tâche (Task) produit un ou plusieurs fichiers de sortie à partir de fichiers d'entrée, en
+appelant une fonction importable (exécutable dans un processus 'spawn'). Elle peut dépendre
+d'autres tâches, dont les sorties sont en général ses entrées.
+
+run_tasks lance les tâches dans l'ordre du graphe, dès que leurs dépendances sont terminées :
+- une tâche dont toutes les sorties sont à jour dans le cache (même contenu d'entrée, mêmes
+  paramètres, même version du code) est ignorée ;
+- la clé d'une tâche est enregistrée dans le manifeste dès qu'elle a réussi : après une
+  interruption, une nouvelle exécution reprend là où la précédente s'est arrêtée ;
+- une tâche en erreur n'arrête pas le lot, seules les tâches qui en dépendent sont bloquées.
+
+Exemple :
+    tasks = [Task('p1/clean', clean, ['p1.edf'], ['p1_clean.edf'], args=('p1.edf', 'p1_clean.edf')),
+             Task('p1/morpho', morpho, ['p1_clean.edf'], ['p1.csv'], deps=['p1/clean'], args=(...))]
+    results = run_tasks(tasks, ResultCache(manifest_path), n_jobs=4)
+"""
+
+import contextlib
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from preprocessing.instrumentation import stage
+
+# Variables d'environnement qui contrôlent le nombre de threads BLAS/FFT (numpy, scipy, MKL...)
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+class Task:
+    """
+    Tâche du graphe.
+
+    :param name: identifiant unique (ex. 'patient/etape')
+    :param func: fonction appelée avec `args` et `kwargs` (définie au niveau d'un module)
+    :param inputs: fichiers d'entrée (leur contenu entre dans la clé de cache)
+    :param outputs: fichiers produits (tous doivent être à jour pour ignorer la tâche)
+    :param deps: noms des tâches à terminer avant celle-ci
+    :param params: paramètres qui entrent dans la clé de cache
+    :param version: version du code (voir cache.code_version)
+    """
+
+    def __init__(self, name, func, inputs, outputs, deps=(), params=None, version='', args=(), kwargs=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.params = params or {}
+        self.version = version
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+
+
+def topological_order(tasks):
+    """Ordre d'exécution compatible avec les dépendances (ValueError si cycle ou dépendance inconnue)."""
+    by_name = {task.name: task for task in tasks}
+    order, state = [], {}
+
+    def visit(task, path):
+        if state.get(task.name) == 'done':
+            return
+        if state.get(task.name) == 'visiting':
+            raise ValueError(f"Dépendance circulaire : {' -> '.join(path + [task.name])}")
+        state[task.name] = 'visiting'
+        for dep in task.deps:
+            if dep not in by_name:
+                raise ValueError(f"La tâche '{task.name}' dépend d'une tâche inconnue : '{dep}'")
+            visit(by_name[dep], path + [task.name])
+        state[task.name] = 'done'
+        order.append(task)
+
+    for task in tasks:
+        visit(task, [])
+    return order
+
+
+@contextlib.contextmanager
+def process_pool(n_jobs, threads_per_job=1):
+    """
+    Groupe de processus 'spawn' dont chaque processus utilise au plus `threads_per_job`
+    threads BLAS/FFT (variables d'environnement restaurées à la sortie).
+    """
+    saved_env = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads_per_job)
+    try:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context) as executor:
+            yield executor
+    finally:
+        for var, value in saved_env.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def _execute(func, args, kwargs, name=None):
+    """Exécute une tâche et renvoie (statut, message, durée) sans laisser remonter d'exception."""
+    start = time.perf_counter()
+    try:
+        with stage('pipeline.task', task=name):
+            func(*args, **kwargs)
+        return "ok", "", time.perf_counter() - start
+    except Exception as e:
+        return "error", f"{e}\n{traceback.format_exc()}", time.perf_counter() - start
+
+
+def run_tasks(tasks, cache, n_jobs=1, threads_per_job=1, overwrite=False):
+    """
+    Exécute le graphe de tâches.
+
+    :param tasks: liste de Task
+    :param cache: ResultCache où sont enregistrées les clés des tâches réussies
+    :param n_jobs: nombre de processus (1 : exécution dans le processus courant)
+    :param threads_per_job: threads BLAS/FFT par processus lorsque n_jobs > 1
+    :param overwrite: recalculer toutes les tâches, même à jour
+    :return: liste de (nom, statut, message) avec statut 'ok', 'skipped', 'error' ou 'blocked'
+    """
+    order = topological_order(tasks)
+    status = {}
+    results = []
+    pending = list(order)
+    running = {}
+
+    def finish(task, task_status, message):
+        status[task.name] = task_status
+        results.append((task.name, task_status, message))
+
+    def start_ready(executor):
+        """Lance (ou ignore) les tâches dont toutes les dépendances sont terminées."""
+        for task in list(pending):
+            if any(status.get(dep) not in ("ok", "skipped") for dep in task.deps):
+                if any(status.get(dep) in ("error", "blocked") for dep in task.deps):
+                    pending.remove(task)
+                    failed = [dep for dep in task.deps if status.get(dep) in ("error", "blocked")]
+                    print(f"⏭️  {task.name} : bloquée ({', '.join(failed)} en échec)")
+                    finish(task, "blocked", f"dépendance en échec : {', '.join(failed)}")
+                continue
+            if executor is not None and len(running) >= n_jobs:
+                return
+            pending.remove(task)
+            try:
+                key = cache.make_key(task.inputs, task.params, task.version)
+            except OSError as e:
+                print(f"❌ {task.name} : entrée introuvable ({e})")
+                finish(task, "error", str(e))
+                continue
+            if not overwrite and all(cache.is_fresh(path, key) for path in task.outputs):
+                print(f"✅ {task.name} : à jour")
+                finish(task, "skipped", "")
+                continue
+            print(f"▶️  {task.name}")
+            for path in task.outputs:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            if executor is None:
+                complete(task, key, *_execute(task.func, task.args, task.kwargs, task.name))
+            else:
+                running[executor.submit(_execute, task.func, task.args, task.kwargs, task.name)] = (task, key)
+
+    def complete(task, key, task_status, message, elapsed):
+        if task_status == "ok":
+            # Clé enregistrée (et manifeste sauvegardé) dès la fin de la tâche : reprise possible
+            for path in task.outputs:
+                cache.record(path, key)
+            print(f"✔️  {task.name} ({elapsed:.1f} s)")
+        else:
+            print(f"❌ {task.name} : {message.splitlines()[0] if message else 'erreur'}")
+        finish(task, task_status, message)
+
+    if n_jobs <= 1:
+        while pending:
+            start_ready(None)
+        return results
+
+    with process_pool(n_jobs, threads_per_job) as executor:
+        start_ready(executor)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, key = running.pop(future)
+                complete(task, key, *future.result())
+            start_ready(executor)
+    return results
+
+
+def print_summary(results):
+    """Affiche le bilan : tâches exécutées, à jour, en erreur et bloquées."""
+    counts = {s: sum(1 for _, status, _ in results if status == s) for s in ("ok", "skipped", "error", "blocked")}
+    print(f"Bilan : {counts['ok']} exécutée(s), {counts['skipped']} à jour, "
+          f"{counts['error']} en erreur, {counts['blocked']} bloquée(s).")
+    for name, status, message in results:
+        if status == "error":
+            print(f"  - {name} : {message.splitlines()[0] if message else ''}")
@@ -0,0 +1,158 @@
+"""
+Outils de la boucle de validation manuelle des IEDs.
+
+- ReviewFigure : une seule figure matplotlib réutilisée pour tous les événements (une ligne par
+  canal, mise à jour par set_ydata), au lieu de construire un navigateur MNE par événement ;
+- WindowPrefetcher : lit en arrière-plan (thread) les N prochaines fenêtres dans le tableau
+  d'epochs et prépare les traces à afficher pendant que l'événement courant est à l'écran ;
+- DecisionLog : journal JSON lines des décisions, écrit et vidé sur disque à chaque réponse,
+  relu au démarrage pour reprendre une validation interrompue ('exit' ou plantage).
+
+Exemple :
+    log = DecisionLog('patient_decisions.jsonl')
+    figure = ReviewFigure(channels, sfreq, n_samples, n_before)
+    prefetcher = WindowPrefetcher(lambda idx: figure.prepare(epochs[idx][channel_idx]), n_ahead=8)
+    prefetcher.schedule(upcoming)
+    figure.show(prefetcher.get(idx), title)
+    log.record(idx, 'y', Electrode='F8', Tmu_seconds=12.3)
+"""
+
+import itertools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Écart vertical entre deux canaux affichés (V), proche de l'échelle EEG par défaut de MNE
+DEFAULT_SPACING = 100e-6
+
+
+class DecisionLog:
+    """Journal des décisions {indice d'événement: décision}, persistant et relu à l'ouverture."""
+
+    def __init__(self, path):
+        self.path = path
+        self.decisions = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Dernière ligne tronquée par un arrêt brutal : ignorée
+                        continue
+                    self.decisions[entry['index']] = entry['decision']
+
+    def __contains__(self, index):
+        return int(index) in self.decisions
+
+    def get(self, index):
+        return self.decisions.get(int(index))
+
+    def record(self, index, decision, **details):
+        """Ajoute une décision au journal et la vide immédiatement sur disque."""
+        index = int(index)
+        self.decisions[index] = decision
+        entry = {'index': index, 'decision': decision, **details}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class WindowPrefetcher:
+    """
+    Chargement anticipé des fenêtres dans un thread.
+
+    `load(key)` est appelé en arrière-plan pour chaque clé planifiée ; get(key) renvoie le résultat
+    (en attendant la fin du chargement si besoin, ou en le calculant directement s'il n'était pas
+    planifié). Seules les clés de la dernière planification sont gardées en mémoire.
+    """
+
+    def __init__(self, load, n_ahead=8):
+        self.load = load
+        self.n_ahead = n_ahead
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._futures = {}
+
+    def schedule(self, keys):
+        """
+        Planifie le chargement des n_ahead premières clés et oublie les autres. `keys` peut être un
+        générateur : seules les n_ahead premières clés en sont lues.
+        """
+        keys = list(itertools.islice(keys, self.n_ahead))
+        for key in list(self._futures):
+            if key not in keys:
+                self._futures.pop(key).cancel()
+        for key in keys:
+            if key not in self._futures:
+                self._futures[key] = self._executor.submit(self.load, key)
+
+    def get(self, key):
+        future = self._futures.pop(key, None)
+        if future is None:
+            return self.load(key)
+        return future.result()
+
+    def close(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ReviewFigure:
+    """
+    Figure de validation réutilisable : canaux empilés (premier canal en haut), fenêtre centrée
+    sur l'événement (t = 0). Seules les données et le titre changent d'un événement à l'autre.
+    """
+
+    def __init__(self, channels, sfreq, n_samples, n_before, spacing=DEFAULT_SPACING):
+        import matplotlib.pyplot as plt
+
+        self._plt = plt
+        self.spacing = spacing
+        self.offsets = -np.arange(len(channels))[:, np.newaxis] * spacing
+        times = (np.arange(n_samples) - n_before) / sfreq
+
+        plt.ion()
+        self.fig, self.ax = plt.subplots(figsize=(10, 0.35 * len(channels) + 1.5))
+        self.lines = self.ax.plot(times, np.repeat(self.offsets, n_samples, axis=1).T, color='k', linewidth=0.8)
+        self.ax.axvline(0, color='r', linestyle='--', linewidth=0.8)
+        self.ax.set_yticks(self.offsets[:, 0])
+        self.ax.set_yticklabels(channels)
+        self.ax.set_ylim(self.offsets[-1, 0] - spacing, spacing)
+        self.ax.set_xlim(times[0], times[-1])
+        self.ax.set_xlabel('Temps (s)')
+        self.fig.tight_layout()
+
+    def prepare(self, window):
+        """
+        Traces à afficher pour une fenêtre (n_channels, n_samples) en volts, centrées sur la moyenne
+        des échantillons présents ; les NaN (hors enregistrement) sont affichés sur la ligne de base.
+        """
+        window = np.asarray(window, dtype=float)
+        centred = window - np.nanmean(window, axis=1, keepdims=True)
+        return np.nan_to_num(centred) + self.offsets
+
+    def show(self, traces, title):
+        """Affiche des traces préparées par prepare(), sans bloquer."""
+        for line, trace in zip(self.lines, traces):
+            line.set_ydata(trace)
+        self.ax.set_title(title)
+        self.fig.canvas.draw_idle()
+        self._plt.pause(0.001)
+
+    def close(self):
+        self._plt.close(self.fig)
@@ -0,0 +1,134 @@
+"""
+Score de qualité des IEDs candidats, calculé avant la validation manuelle.
+
+Pour chaque électrode, toutes ses fenêtres sont lues en un lot dans le tableau d'epochs et
+trois mesures sont calculées de façon vectorisée :
+- Template_Corr   : corrélation (Pearson) de la fenêtre centrale (±100 ms) avec le template de
+                    l'électrode, médiane de toutes ses fenêtres ;
+- Peak_Background : pic de |signal| dans la zone [-25 ms, +20 ms] (comme ieds_morphology)
+                    rapporté à l'écart-type robuste (MAD) du fond, hors fenêtre centrale ;
+- Slope_Sharpness : pente maximale (|dérivée|) autour du pic rapportée à l'écart-type robuste
+                    de la dérivée du fond.
+
+Les trois mesures sont converties en rangs centiles au sein de l'électrode et moyennées :
+Score ∈ [0, 1], les meilleurs candidats ayant les scores les plus élevés. Les événements dont
+la fenêtre est incomplète (bord d'enregistrement) ont un score NaN.
+
+Exemple :
+    scores = score_events(epochs, meta, df_csv['Electrode'])
+    df_csv = df_csv.join(scores)
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+SCORE_COLUMNS = ['Template_Corr', 'Peak_Background', 'Slope_Sharpness', 'Score']
+
+# Demi-largeur de la fenêtre centrale (template, exclusion du fond), en secondes
+CORE_HALF_WIDTH = 0.1
+
+# Facteur MAD -> écart-type pour un bruit gaussien
+MAD_TO_SD = 1.4826
+
+
+def electrode_channels(electrode, channels):
+    """
+    Canaux associés à une étiquette d'électrode ('F8', 'F8-T4', 'T4/F8'...) : les noms séparés
+    par '-' ou '/' qui sont des canaux de l'enregistrement.
+    """
+    names = [name.strip() for name in re.split(r'[-/]', str(electrode))]
+    return [name for name in names if name in channels]
+
+
+def _robust_sd(values, axis=-1):
+    """Écart-type robuste (MAD) le long d'un axe."""
+    median = np.median(values, axis=axis, keepdims=True)
+    return MAD_TO_SD * np.median(np.abs(values - median), axis=axis)
+
+
+def _percentile_rank(values):
+    """Rang centile dans [0, 1] (NaN conservés), ex aequo au rang moyen."""
+    ranks = pd.Series(values).rank(pct=True, method='average').to_numpy()
+    return ranks
+
+
+def score_windows(windows, sfreq, n_before):
+    """
+    Mesures de qualité d'un lot de fenêtres d'une même électrode.
+
+    :param windows: tableau (n_events, n_channels, n_samples), événement à l'indice n_before
+    :return: dictionnaire de tableaux de longueur n_events : 'Template_Corr', 'Peak_Background',
+             'Slope_Sharpness' (moyennes sur les canaux de l'électrode)
+    """
+    windows = np.asarray(windows, dtype=float)
+    n_events, _, n_samples = windows.shape
+    core_half = int(CORE_HALF_WIDTH * sfreq)
+    core = slice(max(n_before - core_half, 0), min(n_before + core_half, n_samples))
+    background = np.ones(n_samples, dtype=bool)
+    background[core] = False
+    peak_zone = slice(n_before - int(0.025 * sfreq), n_before + int(0.02 * sfreq))
+
+    # --- Corrélation au template (médiane des fenêtres de l'électrode) ---
+    core_windows = windows[:, :, core]
+    template = np.median(core_windows, axis=0)
+    centered = core_windows - core_windows.mean(axis=2, keepdims=True)
+    template = template - template.mean(axis=1, keepdims=True)
+    numerator = np.einsum('ecs,cs->ec', centered, template)
+    denominator = np.linalg.norm(centered, axis=2) * np.linalg.norm(template, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = numerator / denominator
+
+    # --- Rapport pic / fond ---
+    background_sd = _robust_sd(windows[:, :, background])
+    peak = np.abs(windows[:, :, peak_zone] - np.median(windows[:, :, background], axis=2, keepdims=True)).max(axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        peak_background = peak / background_sd
+
+    # --- Raideur de la pente autour du pic ---
+    derivative = np.diff(windows, axis=2) * sfreq
+    slope = np.abs(derivative[:, :, peak_zone]).max(axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sharpness = slope / _robust_sd(derivative[:, :, background[:-1]])
+
+    return {
+        'Template_Corr': correlation.mean(axis=1),
+        'Peak_Background': peak_background.mean(axis=1),
+        'Slope_Sharpness': sharpness.mean(axis=1),
+    }
+
+
+def score_events(epochs, meta, electrodes, electrode_map=None):
+    """
+    Score de qualité de chaque événement (ligne i = epoch i).
+
+    :param epochs: tableau (n_events, n_channels, n_samples) (voir epochs.load_epochs)
+    :param meta: métadonnées des epochs ('channels', 'sfreq', 'n_before', 'valid')
+    :param electrodes: électrode de chaque événement
+    :param electrode_map: {électrode: canal ou liste de canaux} (sinon déduit de l'étiquette)
+    :return: DataFrame (colonnes SCORE_COLUMNS) aligné sur les événements
+    """
+    electrodes = np.asarray(electrodes)
+    channel_index = {ch: i for i, ch in enumerate(meta['channels'])}
+    valid = np.asarray(meta['valid'], dtype=bool)
+    scores = pd.DataFrame(np.nan, index=np.arange(len(electrodes)), columns=SCORE_COLUMNS)
+
+    for electrode in pd.unique(electrodes):
+        if electrode_map is not None and electrode in electrode_map:
+            chans = electrode_map[electrode]
+            chans = chans if isinstance(chans, list) else [chans]
+        else:
+            chans = electrode_channels(electrode, channel_index)
+        event_idx = np.flatnonzero((electrodes == electrode) & valid)
+        if not chans or len(event_idx) == 0:
+            continue
+
+        windows = epochs[event_idx][:, [channel_index[ch] for ch in chans]]
+        measures = score_windows(windows, meta['sfreq'], meta['n_before'])
+        for column, values in measures.items():
+            scores.loc[event_idx, column] = values
+        ranks = [_percentile_rank(values) for values in measures.values()]
+        scores.loc[event_idx, 'Score'] = np.nanmean(ranks, axis=0) if len(event_idx) > 1 else 1.0
+
+    return scores
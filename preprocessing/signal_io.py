@@ -0,0 +1,472 @@
+"""
+Signaux nettoyés aux formats EDF, FIF ou tableau float32, lus et écrits sans chargement complet en mémoire.
+
+- 'edf' : EDF 16 bits (edf_io.EdfReader / EdfWriter), écrit enregistrement par enregistrement ;
+- 'fif' : format MNE, lu à la demande (read_raw_fif sans préchargement). MNE n'ayant pas
+  d'écriture incrémentale, FifWriter accumule les blocs dans un memmap float32 temporaire,
+  sauvegardé à la fermeture par save_fif : MNE le relit par tranches, sans copie complète en
+  mémoire ;
+- 'npy' : tableau float32 (n_channels, n_times) en volts, projeté en mémoire à l'ouverture, et
+  en-tête JSON de même nom (<fichier>.json) : canaux, fréquence, date et champs d'en-tête EDF
+  du fichier source. Sans quantification ni conversion, l'écriture est une simple copie et
+  l'ouverture est immédiate : c'est le format compact pour l'analyse.
+
+Le format est déduit de l'extension ('.edf', '.fif', '.npy'). open_signal() renvoie un lecteur
+ayant l'interface d'EdfReader (ch_names, sfreq, n_times, meas_date, header, read, read_windows,
+to_raw), open_writer() un écrivain ayant celle d'EdfWriter (write, close, gestionnaire de contexte).
+Les fichiers sont écrits sous un nom temporaire (edf_io.partial_path) et renommés à la fermeture ;
+si une erreur survient dans le bloc `with`, l'écriture est abandonnée (abort) et aucun fichier
+partiel n'est laissé. Les lecteurs renvoient des valeurs en float64 par défaut, ou en float32 (dtype='float32') : pour
+des données 16 bits, la précision reste très supérieure au pas de quantification et la mémoire
+des étapes suivantes est divisée par deux.
+
+Exemple :
+    with open_writer('p1_clean.npy', ch_names, sfreq, n_times, phys_min, phys_max) as writer:
+        for block in blocks:
+            writer.write(block)
+    reader = open_signal('p1_clean.npy')
+    data = reader.read(['Fp1'], start=0, stop=int(10 * reader.sfreq))
+"""
+
+import datetime
+import functools
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from preprocessing.edf_io import EdfReader, EdfWriter, edf_meas_date, partial_path
+
+SIGNAL_FORMATS = ('edf', 'fif', 'npy')
+
+# Types de calcul des signaux (float64 par défaut)
+SIGNAL_DTYPES = ('float64', 'float32')
+
+# Suffixe des fichiers nettoyés de chaque format (convention de nommage MNE pour les FIF)
+FORMAT_SUFFIXES = {'edf': '.edf', 'fif': '_raw.fif', 'npy': '.npy'}
+
+# Durée (s) des blocs écrits ou parcourus en une fois
+BLOCK_SEC = 60.0
+
+
+def signal_format(path):
+    """Format ('edf', 'fif' ou 'npy') d'un fichier de signal, d'après son extension."""
+    lower = path.lower()
+    if lower.endswith('.edf'):
+        return 'edf'
+    if lower.endswith(('.fif', '.fif.gz')):
+        return 'fif'
+    if lower.endswith('.npy'):
+        return 'npy'
+    raise ValueError(f"Format de signal non reconnu : {path} (extensions acceptées : .edf, .fif, .npy).")
+
+
+def header_path(npy_path):
+    """Chemin de l'en-tête JSON d'un signal .npy."""
+    return os.path.splitext(npy_path)[0] + '.json'
+
+
+def open_signal(path, dtype=np.float64):
+    """
+    Lecteur à accès aléatoire d'un signal EDF, FIF ou .npy (voir EdfReader pour l'interface),
+    renvoyant des valeurs en `dtype` (float64 ou float32).
+    """
+    fmt = signal_format(path)
+    if fmt == 'edf':
+        return EdfReader(path, dtype)
+    if fmt == 'fif':
+        return FifReader(path, dtype)
+    return NpyReader(path, dtype)
+
+
+def open_writer(path, ch_names, sfreq, n_times, physical_min, physical_max, physical_dimension='uV',
+                patient_id='X', recording_id='X', start_date='01.01.85', start_time='00.00.00', prefiltering=''):
+    """
+    Écrivain par blocs d'un signal de n_times échantillons, au format donné par l'extension de `path`.
+    Les champs d'en-tête sont ceux d'EdfWriter ; pour FIF et .npy, la plage physique n'est
+    conservée que comme métadonnée (les valeurs ne sont pas quantifiées).
+    """
+    fmt = signal_format(path)
+    header = dict(physical_dimension=physical_dimension, patient_id=patient_id, recording_id=recording_id,
+                  start_date=start_date, start_time=start_time, prefiltering=prefiltering)
+    if fmt == 'edf':
+        return EdfWriter(path, ch_names, sfreq, physical_min, physical_max, **header)
+    if fmt == 'fif':
+        return FifWriter(path, ch_names, sfreq, n_times, start_date=start_date, start_time=start_time)
+    return NpyWriter(path, ch_names, sfreq, n_times, physical_min, physical_max, **header)
+
+
+def write_signal(path, data, ch_names, sfreq, block_sec=BLOCK_SEC, **header):
+    """
+    Sauvegarde un signal (n_channels, n_times) en volts au format donné par l'extension de `path` :
+    FIF par save_fif, EDF et .npy par blocs de block_sec secondes (voir open_writer pour les champs
+    d'en-tête).
+    """
+    if signal_format(path) == 'fif':
+        save_fif(path, data, ch_names, sfreq,
+                 edf_meas_date(header.get('start_date', ''), header.get('start_time', '')))
+        return
+    block_size = max(int(block_sec * sfreq), 1)
+    with open_writer(path, ch_names, sfreq, data.shape[1], **header) as writer:
+        for start in range(0, data.shape[1], block_size):
+            writer.write(data[:, start:start + block_size])
+
+
+@functools.lru_cache(maxsize=None)
+def _array_raw_class():
+    """
+    Classe mne.io.BaseRaw non préchargée dont les données sont lues dans un tableau (ou memmap)
+    par tranches : contrairement à RawArray, qui convertit tout le tableau en float64, la mémoire
+    utilisée par raw.save() est celle d'une tranche.
+    """
+    import mne
+
+    class ArrayRaw(mne.io.BaseRaw):
+        def __init__(self, data, info):
+            super().__init__(info, preload=False, last_samps=(data.shape[1] - 1,), raw_extras=[{'data': data}],
+                             orig_format='single' if data.dtype == np.float32 else 'double', verbose=False)
+
+        def _read_segment_file(self, data, idx, fi, start, stop, cals, mult):
+            block = np.asarray(self._raw_extras[fi]['data'][:, start:stop], dtype=data.dtype)
+            if mult is not None:
+                data[:] = mult @ block[idx]
+            else:
+                data[:] = block[idx]
+                data *= cals
+
+    return ArrayRaw
+
+
+def save_fif(path, data, ch_names, sfreq, meas_date=None, annotations=None, split_size='2GB'):
+    """
+    Sauvegarde un signal (n_channels, n_times) en volts (tableau ou memmap, float32 ou float64) au
+    format FIF, sans le copier en entier : MNE le lit par tranches pendant l'écriture.
+
+    Au-delà de `split_size`, MNE découpe l'enregistrement en plusieurs fichiers (`path`, puis
+    <nom>-1.fif, <nom>-2.fif...) qui se désignent l'un l'autre par leur nom : ils sont écrits sous
+    leur nom définitif dans un dossier temporaire, puis déplacés à côté de `path` (le premier en
+    dernier). En cas d'erreur, le dossier temporaire est supprimé avec toutes ses parties.
+
+    :param annotations: (onsets, durées, descriptions) en secondes depuis le début du signal, optionnel
+    """
+    import mne
+
+    raw = _array_raw_class()(data, mne.create_info(list(ch_names), sfreq, 'eeg'))
+    if meas_date is not None:
+        raw.set_meas_date(meas_date)
+    if annotations is not None:
+        raw.set_annotations(mne.Annotations(*annotations, orig_time=raw.info['meas_date']))
+    path = os.path.abspath(path)
+    tmp_dir = partial_path(path)
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        raw.save(os.path.join(tmp_dir, os.path.basename(path)), split_size=split_size,
+                 split_naming='neuromag', overwrite=True, verbose=False)
+        parts = sorted(os.listdir(tmp_dir), key=lambda name: name == os.path.basename(path))
+        for name in parts:
+            os.replace(os.path.join(tmp_dir, name), os.path.join(os.path.dirname(path), name))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class _SignalReader:
+    """Interface commune des lecteurs FIF et .npy (mêmes conventions qu'EdfReader : volts, `dtype`)."""
+
+    def _rows(self, channels):
+        if channels is None:
+            channels = self.ch_names
+        for ch in channels:
+            if ch not in self._index:
+                raise ValueError(f"Canal absent du fichier {self.path} : {ch}")
+        return list(channels), [self._index[ch] for ch in channels]
+
+    def _bounds(self, start, stop):
+        if stop is None:
+            stop = self.n_times
+        return max(0, int(start)), min(self.n_times, int(stop))
+
+    def to_raw(self, channels=None, start=0, stop=None):
+        """
+        Construit un mne.io.RawArray (type 'eeg') limité aux canaux et à la plage demandés.
+        `first_samp` conserve la position de la plage dans l'enregistrement d'origine.
+        """
+        import mne
+
+        if channels is None:
+            channels = self.ch_names
+        data = self.read(channels, start, stop)
+        info = mne.create_info(list(channels), self.sfreq, 'eeg')
+        raw = mne.io.RawArray(data, info, first_samp=max(0, int(start)), verbose=False)
+        if self.meas_date is not None:
+            raw.set_meas_date(self.meas_date)
+        return raw
+
+
+class NpyReader(_SignalReader):
+    """
+    Lecteur d'un signal .npy (float32, volts) et de son en-tête JSON, projeté en mémoire :
+    l'ouverture ne lit que l'en-tête, read() ne copie que les canaux et échantillons demandés.
+    """
+
+    def __init__(self, path, dtype=np.float64):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        with open(header_path(path), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._data = np.load(path, mmap_mode='r')
+        self.ch_names = list(self.meta['ch_names'])
+        self._index = {ch: i for i, ch in enumerate(self.ch_names)}
+        self.sfreq = float(self.meta['sfreq'])
+        self.n_times = int(self._data.shape[1])
+        self.header = self.meta['edf_header']
+
+    @property
+    def meas_date(self):
+        """Date de début de l'enregistrement (UTC), ou None si inconnue."""
+        date = self.meta.get('meas_date')
+        return datetime.datetime.fromisoformat(date) if date else None
+
+    def read(self, channels=None, start=0, stop=None):
+        """Lit les échantillons [start, stop) des canaux demandés : tableau (n_channels, n) en volts."""
+        channels, rows = self._rows(channels)
+        start, stop = self._bounds(start, stop)
+        data = np.empty((len(rows), max(stop - start, 0)), dtype=self.dtype)
+        for row, i in enumerate(rows):
+            data[row] = self._data[i, start:stop]
+        return data
+
+    def read_windows(self, channels, starts, n_samples):
+        """
+        Lit en une fois des fenêtres de même longueur commençant aux échantillons `starts`.
+        Les échantillons situés hors de l'enregistrement valent NaN.
+
+        :return: tableau (n_windows, n_channels, n_samples) en volts
+        """
+        channels, rows = self._rows(channels)
+        starts = np.asarray(starts, dtype=np.int64)
+        sample_idx = starts[:, np.newaxis] + np.arange(n_samples)
+        inside = (sample_idx >= 0) & (sample_idx < self.n_times)
+        clipped = np.clip(sample_idx, 0, max(self.n_times - 1, 0))
+
+        data = np.empty((len(starts), len(rows), n_samples), dtype=self.dtype)
+        for col, i in enumerate(rows):
+            data[:, col, :] = np.where(inside, self._data[i][clipped], np.nan)
+        return data
+
+
+class FifReader(_SignalReader):
+    """Lecteur d'un fichier FIF sans préchargement (mne.io.read_raw_fif, preload=False)."""
+
+    def __init__(self, path, dtype=np.float64):
+        import mne
+
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self._raw = mne.io.read_raw_fif(path, preload=False, verbose=False)
+        self.ch_names = list(self._raw.ch_names)
+        self._index = {ch: i for i, ch in enumerate(self.ch_names)}
+        self.sfreq = float(self._raw.info['sfreq'])
+        self.n_times = int(self._raw.n_times)
+        self.meas_date = self._raw.info['meas_date']
+        self._header = None
+
+    @property
+    def header(self):
+        """
+        Champs d'en-tête EDF équivalents (pour réécrire le signal en EDF) : plage physique
+        symétrique couvrant le maximum de |signal| de chaque canal, en µV (parcours du fichier
+        par blocs au premier accès).
+        """
+        if self._header is None:
+            peak = np.zeros(len(self.ch_names))
+            block_size = max(int(BLOCK_SEC * self.sfreq), 1)
+            for start in range(0, self.n_times, block_size):
+                peak = np.maximum(peak, np.abs(self.read(None, start, start + block_size)).max(axis=1))
+            physical_max = np.maximum(np.ceil(peak * 1e6), 1.0).tolist()
+            date = self.meas_date
+            self._header = {
+                'labels': list(self.ch_names),
+                'physical_dimension': ['uV'] * len(self.ch_names),
+                'physical_min': [-v for v in physical_max],
+                'physical_max': physical_max,
+                'patient_id': 'X',
+                'recording_id': 'X',
+                'start_date': date.strftime('%d.%m.%y') if date else '01.01.85',
+                'start_time': date.strftime('%H.%M.%S') if date else '00.00.00',
+            }
+        return self._header
+
+    def read(self, channels=None, start=0, stop=None):
+        """Lit les échantillons [start, stop) des canaux demandés : tableau (n_channels, n) en volts."""
+        channels, _ = self._rows(channels)
+        start, stop = self._bounds(start, stop)
+        if stop <= start:
+            return np.empty((len(channels), 0), dtype=self.dtype)
+        return self._raw.get_data(picks=channels, start=start, stop=stop).astype(self.dtype, copy=False)
+
+    def read_windows(self, channels, starts, n_samples):
+        """
+        Lit des fenêtres de même longueur commençant aux échantillons `starts` (NaN hors de
+        l'enregistrement). Chaque lecture MNE ayant un coût fixe, les fenêtres proches sont
+        regroupées et lues en une plage d'au plus BLOCK_SEC secondes.
+
+        :return: tableau (n_windows, n_channels, n_samples) en volts
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        data = np.full((len(starts), len(channels), n_samples), np.nan, dtype=self.dtype)
+        order = np.argsort(starts, kind='stable')
+        span = max(int(BLOCK_SEC * self.sfreq), n_samples)
+        first = 0
+        while first < len(order):
+            lo = starts[order[first]]
+            last = first
+            while last + 1 < len(order) and starts[order[last + 1]] + n_samples - lo <= span:
+                last += 1
+            read_lo, read_hi = self._bounds(lo, starts[order[last]] + n_samples)
+            if read_hi > read_lo:
+                block = self.read(channels, read_lo, read_hi)
+                for k in order[first:last + 1]:
+                    w_lo, w_hi = self._bounds(starts[k], starts[k] + n_samples)
+                    if w_hi > w_lo:
+                        data[k, :, w_lo - starts[k]:w_hi - starts[k]] = block[:, w_lo - read_lo:w_hi - read_lo]
+            first = last + 1
+        return data
+
+
+class NpyWriter:
+    """
+    Écriture par blocs d'un signal .npy (float32, volts) de n_times échantillons, directement
+    dans un memmap temporaire ; à la fermeture, l'en-tête JSON est écrit et les deux fichiers
+    prennent leur nom définitif. Les échantillons non écrits valent 0.
+    """
+
+    def __init__(self, path, ch_names, sfreq, n_times, physical_min, physical_max, physical_dimension='uV',
+                 patient_id='X', recording_id='X', start_date='01.01.85', start_time='00.00.00', prefiltering=''):
+        n_channels = len(ch_names)
+        if isinstance(physical_dimension, str):
+            physical_dimension = [physical_dimension] * n_channels
+        self.path = path
+        self.ch_names = list(ch_names)
+        self.sfreq = sfreq
+        self.n_written = 0
+        self.tmp_path = partial_path(path)
+        self._data = np.lib.format.open_memmap(self.tmp_path, mode='w+', dtype=np.float32,
+                                               shape=(n_channels, int(n_times)))
+        meas_date = edf_meas_date(start_date, start_time)
+        self.meta = {
+            'ch_names': self.ch_names,
+            'sfreq': float(sfreq),
+            'n_times': int(n_times),
+            'unit': 'V',
+            'dtype': 'float32',
+            'meas_date': meas_date.isoformat() if meas_date else None,
+            'prefiltering': prefiltering,
+            'edf_header': {
+                'labels': self.ch_names,
+                'physical_dimension': list(physical_dimension),
+                'physical_min': np.broadcast_to(np.asarray(physical_min, dtype=float), (n_channels,)).tolist(),
+                'physical_max': np.broadcast_to(np.asarray(physical_max, dtype=float), (n_channels,)).tolist(),
+                'patient_id': patient_id,
+                'recording_id': recording_id,
+                'start_date': start_date,
+                'start_time': start_time,
+            },
+        }
+
+    def write(self, data):
+        """Ajoute un bloc (n_channels, n_samples) en volts à la suite du signal."""
+        data = np.asarray(data)
+        if data.shape[0] != len(self.ch_names):
+            raise ValueError(f"{data.shape[0]} canaux fournis, {len(self.ch_names)} attendus.")
+        stop = self.n_written + data.shape[1]
+        if stop > self._data.shape[1]:
+            raise ValueError(f"Trop d'échantillons : {stop} pour {self._data.shape[1]} prévus.")
+        self._data[:, self.n_written:stop] = data
+        self.n_written = stop
+
+    def close(self):
+        """Vide le memmap sur disque, écrit l'en-tête JSON et renomme les deux fichiers."""
+        if self._data is None:
+            return
+        self._data.flush()
+        self._data = None
+        tmp_header = partial_path(header_path(self.path))
+        with open(tmp_header, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(self.tmp_path, self.path)
+        os.replace(tmp_header, header_path(self.path))
+
+    def abort(self):
+        """Abandonne l'écriture : supprime le memmap partiel, sans écrire d'en-tête."""
+        if self._data is None:
+            return
+        self._data = None
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class FifWriter:
+    """
+    Écriture par blocs d'un fichier FIF : les blocs sont accumulés dans un memmap float32
+    temporaire (dans le dossier de sortie), sauvegardé à la fermeture par save_fif (lecture par
+    tranches : la mémoire ne dépend pas de la durée du signal).
+    """
+
+    def __init__(self, path, ch_names, sfreq, n_times, start_date='01.01.85', start_time='00.00.00'):
+        self.path = path
+        self.ch_names = list(ch_names)
+        self.sfreq = sfreq
+        self.meas_date = edf_meas_date(start_date, start_time)
+        self.n_written = 0
+        fd, self.tmp_path = tempfile.mkstemp(suffix='.dat', dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        self._buffer = np.memmap(self.tmp_path, dtype=np.float32, mode='w+',
+                                 shape=(len(self.ch_names), max(int(n_times), 1)))
+
+    def write(self, data):
+        """Ajoute un bloc (n_channels, n_samples) en volts à la suite du signal."""
+        data = np.asarray(data)
+        if data.shape[0] != len(self.ch_names):
+            raise ValueError(f"{data.shape[0]} canaux fournis, {len(self.ch_names)} attendus.")
+        stop = self.n_written + data.shape[1]
+        if stop > self._buffer.shape[1]:
+            raise ValueError(f"Trop d'échantillons : {stop} pour {self._buffer.shape[1]} prévus.")
+        self._buffer[:, self.n_written:stop] = data
+        self.n_written = stop
+
+    def close(self):
+        """Sauvegarde le signal écrit et supprime le fichier temporaire."""
+        if self._buffer is None:
+            return
+        try:
+            if self.n_written:
+                save_fif(self.path, self._buffer[:, :self.n_written], self.ch_names, self.sfreq, self.meas_date)
+        finally:
+            self._buffer = None
+            os.remove(self.tmp_path)
+
+    def abort(self):
+        """Abandonne l'écriture : supprime le memmap temporaire, sans rien sauvegarder."""
+        if self._buffer is None:
+            return
+        self._buffer = None
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
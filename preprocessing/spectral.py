@@ -0,0 +1,159 @@
+"""
+Densité spectrale de puissance (Welch) et puissance par bande des segments de repos.
+
+Toutes les fenêtres de Welch de tous les segments et de tous les canaux sont découpées sans
+copie (vue glissante sur le signal), puis transformées par une seule FFT par lot de fenêtres :
+le résultat est celui de scipy.signal.welch (fenêtre de Hann, retrait de la moyenne, densité
+unilatérale), moyenné sur l'ensemble des fenêtres. Les fenêtres ne chevauchent jamais la
+jonction entre deux segments : dans un fichier de repos, les segments concaténés ne sont pas
+contigus dans l'enregistrement source.
+
+Exemple :
+    data, sfreq, ch_names, segments = read_resting(resting_path)
+    freqs, psd, n_windows = welch_psd(data, sfreq, segments)
+    table = band_power_table(freqs, psd, ch_names, make_bands(h_freq=80))
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import get_window
+
+# Bandes de fréquence classiques (Hz) ; la borne haute du gamma suit le h_freq du prétraitement
+BANDS = {
+    'delta': (1.0, 4.0),
+    'theta': (4.0, 8.0),
+    'alpha': (8.0, 13.0),
+    'beta': (13.0, 30.0),
+    'gamma': (30.0, 80.0),
+}
+
+# Durée des fenêtres de Welch (s) et recouvrement (fraction de la fenêtre)
+WINDOW_SEC = 2.0
+OVERLAP = 0.5
+
+# Nombre de fenêtres transformées par lot (borne la mémoire de la FFT)
+BATCH_WINDOWS = 256
+
+# Préfixe des annotations de segments écrites par extract_clean_resting_edf
+SEGMENT_PREFIX = 'segment'
+
+
+def make_bands(h_freq=None):
+    """Bandes de BANDS, la borne haute du gamma remplacée par h_freq si donné."""
+    bands = dict(BANDS)
+    if h_freq is not None:
+        bands['gamma'] = (bands['gamma'][0], float(h_freq))
+    return bands
+
+
+def read_resting(path):
+    """
+    Lit un fichier de repos (.fif ou .edf) et les bornes de ses segments propres.
+
+    Les segments sont donnés par les annotations 'segment <n> ...' ; sans annotation de segment,
+    tout le fichier forme un seul segment.
+
+    :return: (data (n_channels, n_samples) en µV, sfreq, ch_names, segments (n, 2) en échantillons)
+    """
+    import mne
+
+    with warnings.catch_warnings():
+        # Les noms '<patient>_resting.fif' ne suivent pas la convention de nommage de MNE
+        warnings.filterwarnings('ignore', message='This filename', category=RuntimeWarning)
+        raw = mne.io.read_raw(path, preload=True, verbose=False)
+    sfreq = raw.info['sfreq']
+    n_times = raw.n_times
+    segments = [(int(round((a['onset'] - raw.first_time) * sfreq)),
+                 int(round((a['onset'] - raw.first_time + a['duration']) * sfreq)))
+                for a in raw.annotations if a['description'].startswith(SEGMENT_PREFIX)]
+    if not segments:
+        segments = [(0, n_times)]
+    segments = np.clip(np.array(segments, dtype=np.int64), 0, n_times)
+    return raw.get_data(units='uV'), sfreq, list(raw.ch_names), segments
+
+
+def window_starts(segments, nperseg, step):
+    """Débuts (échantillons) des fenêtres de Welch de chaque segment, sans déborder du segment."""
+    starts = [np.arange(start, end - nperseg + 1, step) for start, end in segments]
+    return np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+
+
+def welch_psd(data, sfreq, segments=None, window_sec=WINDOW_SEC, overlap=OVERLAP, batch_windows=BATCH_WINDOWS):
+    """
+    DSP de Welch de tous les canaux, moyennée sur toutes les fenêtres de tous les segments.
+
+    :param data: signal (n_channels, n_samples)
+    :param segments: bornes [début, fin) des segments (échantillons), tout le signal si None
+    :return: (freqs, psd (n_channels, n_freqs) en unité²/Hz, nombre de fenêtres utilisées)
+    """
+    data = np.asarray(data)
+    if segments is None:
+        segments = [(0, data.shape[1])]
+    nperseg = int(round(window_sec * sfreq))
+    step = max(nperseg - int(overlap * nperseg), 1)
+    starts = window_starts(segments, nperseg, step)
+    freqs = np.fft.rfftfreq(nperseg, 1.0 / sfreq)
+    if len(starts) == 0:
+        return freqs, np.full((data.shape[0], len(freqs)), np.nan), 0
+
+    window = get_window('hann', nperseg)
+    scale = 1.0 / (sfreq * np.sum(window ** 2))
+    # Vue (n_channels, n_positions, nperseg) sur le signal, sans copie
+    frames = sliding_window_view(data, nperseg, axis=-1)
+
+    power = np.zeros((data.shape[0], len(freqs)))
+    for i in range(0, len(starts), batch_windows):
+        batch = frames[:, starts[i:i + batch_windows], :]
+        batch = batch - batch.mean(axis=-1, keepdims=True)
+        spectrum = np.fft.rfft(batch * window, axis=-1)
+        power += np.sum(spectrum.real ** 2 + spectrum.imag ** 2, axis=1)
+
+    psd = power * (scale / len(starts))
+    # Densité unilatérale : tous les bins sauf DC (et Nyquist si nperseg est pair) doublés
+    psd[:, 1:-1 if nperseg % 2 == 0 else None] *= 2
+    return freqs, psd, len(starts)
+
+
+def band_powers(freqs, psd, bands):
+    """
+    Puissance absolue (intégrale de la DSP) et relative de chaque bande.
+
+    La puissance relative est rapportée à la puissance totale entre la plus basse et la plus
+    haute borne des bandes.
+
+    :return: (absolue, relative), tableaux (n_channels, n_bands) dans l'ordre de `bands`
+    """
+    def integrate(f_min, f_max):
+        mask = (freqs >= f_min) & (freqs <= f_max)
+        if mask.sum() < 2:
+            return np.full(psd.shape[0], np.nan)
+        return np.trapezoid(psd[:, mask], freqs[mask], axis=-1)
+
+    absolute = np.stack([integrate(f_min, f_max) for f_min, f_max in bands.values()], axis=1)
+    total = integrate(min(b[0] for b in bands.values()), max(b[1] for b in bands.values()))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        relative = absolute / total[:, None]
+    return absolute, relative
+
+
+def band_power_table(freqs, psd, ch_names, bands, n_windows=None):
+    """
+    Table (une ligne par canal et par bande) : Channel, Band, F_Min, F_Max, Power (unité du
+    signal au carré, µV² avec read_resting), Relative_Power et, si donné, N_Windows.
+    """
+    absolute, relative = band_powers(freqs, psd, bands)
+    n_bands = len(bands)
+    table = pd.DataFrame({
+        'Channel': np.repeat(list(ch_names), n_bands),
+        'Band': np.tile(list(bands), len(ch_names)),
+        'F_Min': np.tile([b[0] for b in bands.values()], len(ch_names)),
+        'F_Max': np.tile([b[1] for b in bands.values()], len(ch_names)),
+        'Power': absolute.ravel(),
+        'Relative_Power': relative.ravel(),
+    })
+    if n_windows is not None:
+        table['N_Windows'] = n_windows
+    return table
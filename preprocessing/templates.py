@@ -0,0 +1,214 @@
+"""
+Templates d'IEDs : forme d'onde moyenne, écart-type et intervalle de confiance par électrode,
+canal et état (Eveil, Sommeil...).
+
+Les fenêtres sont prises dans le tableau d'epochs (voir epochs.py), extrait une fois par fichier
+et partagé avec la morphologie et la validation : les templates ne relisent pas l'enregistrement.
+Chaque fenêtre est alignée sur le pic trouvé comme dans ieds_morphology.py (maximum de |signal|
+dans la zone [-25 ms, +20 ms] autour de l'événement, voir morphology.find_peaks_batch), puis
+accumulée dans des statistiques courantes (RunningStats : moyenne et somme des carrés des écarts
+de Welford, combinées lot par lot selon Chan et al.). Le tableau d'epochs (memmap) est lu par
+lots de `batch_events` événements : la mémoire ne dépend pas du nombre d'événements, et
+le calcul se fait en une passe, sans empiler toutes les fenêtres.
+
+Les groupes (électrode, état) sont découpés en lots d'événements répartis entre processus ; les
+statistiques des lots se combinent (RunningStats.merge) dans l'ordre des lots, le résultat ne
+dépend donc pas du nombre de processus.
+
+Exemple :
+    epochs_path = get_epochs(edf_path, event_times)
+    groups = {('F8', 'Eveil'): (['F8'], event_indices), ...}
+    templates = compute_templates(epochs_path, groups, n_jobs=8)
+    table = template_table(templates, sfreq)
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from preprocessing.epochs import load_epochs
+from preprocessing.morphology import PEAK_SEARCH_BEFORE, find_peaks_batch, peak_search_bounds
+from preprocessing.pipeline import process_pool
+
+TEMPLATE_COLUMNS = ['Electrode', 'Channel', 'State', 'Time_s', 'Mean', 'SD', 'CI_Low', 'CI_High', 'N_Events']
+
+# Demi-largeur du template autour du pic (s), comme la fenêtre de ieds_morphology.py
+HALF_WIDTH_SEC = 0.2
+
+# Nombre d'événements lus à la fois dans le tableau d'epochs (borne la mémoire de travail)
+BATCH_EVENTS = 1024
+
+# Nombre d'événements par tâche lorsque le calcul est réparti entre processus
+JOB_EVENTS = 4096
+
+
+class RunningStats:
+    """
+    Moyenne et variance courantes (Welford) de tableaux de forme `shape`, mises à jour par lots.
+    Deux instances (lots ou processus différents) se combinent avec merge.
+    """
+
+    def __init__(self, shape):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def add(self, values):
+        """Ajoute un lot de valeurs (n, *shape)."""
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        batch_mean = values.mean(axis=0)
+        self._combine(len(values), batch_mean, np.sum((values - batch_mean) ** 2, axis=0))
+
+    def merge(self, other):
+        """Ajoute les statistiques d'une autre instance (même forme)."""
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+        return self
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * (count / total)
+        self.m2 += m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+
+    def std(self):
+        """Écart-type (non biaisé) ; NaN avec moins de deux valeurs."""
+        if self.count < 2:
+            return np.full(self.mean.shape, np.nan)
+        return np.sqrt(self.m2 / (self.count - 1))
+
+    def confidence_interval(self, level=0.95):
+        """Bornes (basse, haute) de l'intervalle de confiance de la moyenne (loi de Student)."""
+        if self.count < 2:
+            nan = np.full(self.mean.shape, np.nan)
+            return nan, nan
+        half = stats.t.ppf(0.5 + level / 2, self.count - 1) * self.std() / np.sqrt(self.count)
+        return self.mean - half, self.mean + half
+
+
+def aligned_windows(epochs, meta, channels, event_idx, half_samples):
+    """
+    Fenêtres de 2 * half_samples échantillons centrées sur le pic de chaque événement et canal,
+    prises dans le tableau d'epochs (lignes event_idx).
+
+    :return: (windows, valid) : tableau (n_valid, n_channels, 2 * half_samples) en volts et masque
+             des événements conservés (fenêtre entièrement dans l'enregistrement)
+    """
+    fs = int(meta['sfreq'])
+    n_channels = len(channels)
+    # Marge couvrant le décalage maximal du pic par rapport à l'événement
+    pad = int(np.ceil(PEAK_SEARCH_BEFORE * fs)) + 1
+    length = 2 * (half_samples + pad)
+    offset = meta['n_before'] - half_samples - pad
+    if offset < 0 or offset + length > epochs.shape[2]:
+        raise ValueError(f"Epochs trop courtes pour des templates de ±{half_samples / fs} s "
+                         f"(fenêtre des epochs : [{meta['tmin']}, {meta['tmax']}] s).")
+
+    event_idx = np.asarray(event_idx, dtype=np.int64)
+    channel_index = {ch: i for i, ch in enumerate(meta['channels'])}
+    rows = [channel_index[ch] for ch in channels]
+    data = np.asarray(epochs[event_idx[:, np.newaxis], rows, offset:offset + length])
+    # Échantillons hors enregistrement : NaN dans les epochs
+    valid = ~np.isnan(data).any(axis=(1, 2))
+    data, event_idx = data[valid], event_idx[valid]
+
+    center_idx = (meta['event_times'][event_idx] * fs).astype(int)
+    start_idx = center_idx - half_samples - pad
+    restricted_start, restricted_end = peak_search_bounds(center_idx, start_idx, fs)
+    flat = data.reshape(-1, length)
+    peak_index, _ = find_peaks_batch(flat, np.repeat(restricted_start, n_channels),
+                                     np.repeat(restricted_end, n_channels))
+    sample_idx = (peak_index - half_samples)[:, np.newaxis] + np.arange(2 * half_samples)
+    windows = np.take_along_axis(flat, sample_idx, axis=1)
+    return windows.reshape(len(data), n_channels, 2 * half_samples), valid
+
+
+def template_stats(epochs_path, channels, event_idx, half_width_sec=HALF_WIDTH_SEC, batch_events=BATCH_EVENTS):
+    """
+    Statistiques courantes des fenêtres alignées d'un groupe d'événements (lignes event_idx du
+    tableau d'epochs ; exécutable dans un processus 'spawn').
+
+    :return: (RunningStats de forme (n_channels, n_samples), nombre d'événements ignorés)
+    """
+    epochs, meta = load_epochs(epochs_path)
+    half_samples = int(half_width_sec * int(meta['sfreq']))
+    running = RunningStats((len(channels), 2 * half_samples))
+    n_skipped = 0
+    for first in range(0, len(event_idx), batch_events):
+        windows, valid = aligned_windows(epochs, meta, channels, event_idx[first:first + batch_events], half_samples)
+        running.add(windows)
+        n_skipped += int((~valid).sum())
+    return running, n_skipped
+
+
+def compute_templates(epochs_path, groups, half_width_sec=HALF_WIDTH_SEC, batch_events=BATCH_EVENTS,
+                      job_events=JOB_EVENTS, n_jobs=1, executor=None):
+    """
+    Templates de plusieurs groupes d'événements d'un tableau d'epochs (voir epochs.get_epochs).
+
+    :param groups: {clé: (canaux, indices des événements dans les epochs)}, par exemple
+                   clé = (électrode, état)
+    :param n_jobs: nombre de processus ; les groupes (et les grands groupes, par lots de
+                   job_events événements) sont répartis entre eux
+    :param executor: groupe de processus existant (voir pipeline.process_pool)
+    :return: {clé: (canaux, RunningStats, nombre d'événements ignorés)}
+    """
+    jobs = [(key, list(channels), np.asarray(event_idx, dtype=np.int64)[first:first + job_events])
+            for key, (channels, event_idx) in groups.items()
+            for first in range(0, max(len(event_idx), 1), job_events)]
+
+    if executor is None and n_jobs > 1 and len(jobs) > 1:
+        with process_pool(n_jobs) as executor:
+            return compute_templates(epochs_path, groups, half_width_sec, batch_events, job_events, n_jobs, executor)
+
+    if executor is None:
+        results = [template_stats(epochs_path, channels, event_idx, half_width_sec, batch_events)
+                   for _, channels, event_idx in jobs]
+    else:
+        futures = [executor.submit(template_stats, epochs_path, channels, event_idx, half_width_sec, batch_events)
+                   for _, channels, event_idx in jobs]
+        results = [future.result() for future in futures]
+
+    # Lots combinés dans leur ordre : résultat indépendant de la répartition
+    templates = {}
+    for (key, channels, _), (running, n_skipped) in zip(jobs, results):
+        if key in templates:
+            templates[key][1].merge(running)
+            templates[key][2] += n_skipped
+        else:
+            templates[key] = [channels, running, n_skipped]
+    return {key: tuple(value) for key, value in templates.items()}
+
+
+def template_table(templates, sfreq, confidence=0.95):
+    """
+    Table des templates (une ligne par groupe, canal et échantillon), en µV :
+    Electrode, Channel, State, Time_s (0 = pic), Mean, SD, CI_Low, CI_High, N_Events.
+
+    :param templates: sortie de compute_templates, clés (électrode, état)
+    """
+    fs = int(sfreq)
+    frames = []
+    for (electrode, state), (channels, running, _) in templates.items():
+        n_samples = running.mean.shape[1]
+        time_s = (np.arange(n_samples) - n_samples // 2) / fs
+        ci_low, ci_high = running.confidence_interval(confidence)
+        sd = running.std()
+        for c, channel in enumerate(channels):
+            frames.append(pd.DataFrame({
+                'Electrode': electrode,
+                'Channel': channel,
+                'State': state,
+                'Time_s': time_s,
+                'Mean': running.mean[c] * 1e6,
+                'SD': sd[c] * 1e6,
+                'CI_Low': ci_low[c] * 1e6,
+                'CI_High': ci_high[c] * 1e6,
+                'N_Events': running.count,
+            }))
+    if not frames:
+        return pd.DataFrame(columns=TEMPLATE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[TEMPLATE_COLUMNS]
@@ -1,64 +1,75 @@
+import os
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
 
-# Charger les données
-df_results = pd.read_csv(r'C:/Users/boyer/github/ECOFEC/Results/ied_morphology_results.csv')
+from preprocessing.instrumentation import profiled, stage
+from preprocessing.outliers import iqr_outlier_flags
+from preprocessing.periods import label_periods
+
+# Fichier de résultats de morphologie par défaut (sortie de ieds_morphology.py)
+RESULTS_PATH = r'C:/Users/boyer/github/ECOFEC/Results/ied_morphology_results.csv'
 
 # Définir les périodes
 eveil_periods = [[0, 169], [278, 600], [2248, 2404]]
 sommeil_periods = [[960, 2248]]
 
-def get_etat(tmu):
-    for start, end in eveil_periods:
-        if start <= tmu <= end:
-            return 'Eveil'
-    for start, end in sommeil_periods:
-        if start <= tmu <= end:
-            return 'Sommeil'
-    return 'Hors_Periode'
-
-df_results['Periode'] = df_results['Tmu'].apply(get_etat)
-df_results = df_results[df_results['Periode'] != 'Hors_Periode']
-
 # Variables morphologiques à analyser
 morpho_vars = ['Amplitude', 'Half_Width', 'Negative_Slope', 'Positive_Slope']
 
-# Fonction pour détecter les outliers par électrode et période
-def detect_outliers_iqr(sub_df, var):
-    Q1 = sub_df[var].quantile(0.25)
-    Q3 = sub_df[var].quantile(0.75)
-    IQR = Q3 - Q1
-    lower = Q1 - 1.5 * IQR
-    upper = Q3 + 1.5 * IQR
-    return sub_df[(sub_df[var] < lower) | (sub_df[var] > upper)]
+def figure_paths(save_folder):
+    """Chemins des figures sauvegardées par analyser_morphologie (une par variable)."""
+    return [os.path.join(save_folder, f'{var}_par_electrode_et_periode.png') for var in morpho_vars]
+
+@profiled(file_arg='results_path')
+def analyser_morphologie(results_path, periodes=None, save_folder=None, show=True):
+    """
+    Violin plots des variables morphologiques par électrode et période, outliers (IQR) en overlay.
+
+    :param results_path: CSV de résultats de morphologie (colonnes Tmu en secondes, Electrode, variables)
+    :param periodes: {'Eveil': [[début, fin], ...], 'Sommeil': [...]} (périodes par défaut si None)
+    :param save_folder: dossier où sauvegarder les figures (aucune sauvegarde si None)
+    :param show: afficher les figures
+    :return: DataFrame des outliers
+    """
+    if periodes is None:
+        periodes = {'Eveil': eveil_periods, 'Sommeil': sommeil_periods}
+
+    # Charger les données
+    df_results = pd.read_csv(results_path)
+
+    df_results['Periode'] = label_periods(df_results['Tmu'], periodes, default='Hors_Periode')
+    df_results = df_results[df_results['Periode'] != 'Hors_Periode']
+
+    # Outliers (règle IQR) de toutes les variables, par électrode et période, en un seul passage
+    with stage('Stats_morpho_results.outliers', file=results_path):
+        flags = iqr_outlier_flags(df_results, morpho_vars, by=['Electrode', 'Periode'])
+    outliers_dict = {var: df_results[flags[var]].assign(Variable=var) for var in morpho_vars}
+
+    # Fusionner tous les outliers
+    df_outliers = pd.concat(outliers_dict.values(), ignore_index=True)
 
-# Dictionnaire pour stocker les outliers
-outliers_dict = {}
+    if save_folder is not None:
+        os.makedirs(save_folder, exist_ok=True)
 
-# Boucle pour chaque variable
-for var in morpho_vars:
-    outliers_list = []
-    for (elec, per), group in df_results.groupby(['Electrode', 'Periode']):
-        out = detect_outliers_iqr(group, var)
-        out['Variable'] = var
-        out['Electrode'] = elec
-        out['Periode'] = per
-        outliers_list.append(out)
-    outliers_dict[var] = pd.concat(outliers_list) if outliers_list else pd.DataFrame()
+    # 🖼️ Violin + outliers en overlay
+    for var, figure_path in zip(morpho_vars, figure_paths(save_folder or '.')):
+        plt.figure(figsize=(14, 6))
+        sns.violinplot(x='Electrode', y=var, hue='Periode', data=df_results, inner=None)
+        sns.stripplot(x='Electrode', y=var, hue='Periode', data=outliers_dict[var],
+                      dodge=True, marker='x', color='red', alpha=0.7, jitter=0.2, linewidth=1.2)
+        plt.title(f'{var} par électrode et période (Outliers en rouge)')
+        plt.xticks(rotation=45)
+        plt.tight_layout()
+        plt.legend(title='Période')
+        if save_folder is not None:
+            plt.savefig(figure_path)
+        if show:
+            plt.show()
+        plt.close()
 
-# Fusionner tous les outliers
-df_outliers = pd.concat(outliers_dict.values(), ignore_index=True)
+    return df_outliers
 
-# 🖼️ Violin + outliers en overlay
-for var in morpho_vars:
-    plt.figure(figsize=(14, 6))
-    sns.violinplot(x='Electrode', y=var, hue='Periode', data=df_results, inner=None)
-    sns.stripplot(x='Electrode', y=var, hue='Periode', data=outliers_dict[var], 
-                  dodge=True, marker='x', color='red', alpha=0.7, jitter=0.2, linewidth=1.2)
-    plt.title(f'{var} par électrode et période (Outliers en rouge)')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.legend(title='Période')
-    plt.show()
+if __name__ == "__main__":
+    analyser_morphologie(RESULTS_PATH)
@@ -0,0 +1,466 @@
+"""
+benchmark_pipeline.py
+
+Banc d'essai des étapes de la chaîne sur des données synthétiques : un enregistrement EDF (durée, nombre de
+canaux et fréquence d'échantillonnage au choix) contenant des pointes simulées, et le CSV d'IEDs correspondant
+(colonnes 'Tmu' en µs et 'Electrode'). Aucune donnée patient ni accès réseau n'est nécessaire.
+
+Chaque étape est exécutée dans un processus neuf ('spawn'), ce qui isole sa mémoire :
+- preprocess_stream : clean_and_save_edf en flux (block_sec=60)
+- preprocess_mne    : clean_and_save_edf en mémoire (signal complet filtré puis écrit en EDF)
+- csv_to_mat        : conversion CSV -> .mat (dont la création du stock Parquet des événements)
+- morphology        : morphologie des IEDs (ieds_morphology.morphology_from_files, epochs compris)
+- extract_clean     : extraction des segments propres (extract_clean_segments)
+Les caches dérivés (stock d'événements, epochs) sont effacés avant chaque mesure.
+
+Les étapes sont calculées en float64, ou en float32 avec --dtype float32 (comparer les pics de mémoire
+de deux bancs avec --compare).
+
+Avec --check_float32, la chaîne est aussi exécutée en float64 et en float32 sur les mêmes entrées, et les
+résultats sont comparés étape par étape (contrôle de précision du mode float32, code de sortie 1 si un
+écart dépasse sa tolérance) :
+- signal nettoyé (en mémoire) : écart maximal et RMS, en pas de quantification de l'EDF source (LSB) ;
+- epochs et segments propres lus dans l'EDF nettoyé : écart maximal en LSB ;
+- morphologie : écart relatif maximal des mesures continues (amplitude, pentes, rapporté à l'échelle de
+  la colonne) ; mesures en échantillons (demi-largeur, passages) : proportion de valeurs identiques
+  et écart maximal (en échantillons).
+
+Pour chaque étape et chaque répétition sont mesurés : temps écoulé, temps CPU, pic de mémoire résidente
+(RSS) et mémoire du processus avant l'étape (imports compris), ainsi que le débit (secondes de signal ou
+événements traités par seconde). Les résultats sont écrits en JSON, avec l'environnement (versions, commit).
+
+---------------------
+🔧 Utilisation :
+python -m scripts.benchmark_pipeline --duration_sec 3600 --n_channels 21 --sfreq 256 --output bench/v1.json
+
+Enregistrement de 24 h, étapes en flux seulement, comparaison avec une version précédente :
+python -m scripts.benchmark_pipeline --duration_sec 86400 --stages preprocess_stream csv_to_mat morphology extract_clean --output bench/v2.json --compare bench/v1.json
+
+Mode float32 : précision par rapport au float64 et mémoire par rapport au banc v1 :
+python -m scripts.benchmark_pipeline --dtype float32 --check_float32 --output bench/v1_f32.json --compare bench/v1.json
+
+📌 Options disponibles :
+--duration_sec   Durée de l'enregistrement synthétique (s) [défaut: 600]
+--n_channels     Nombre de canaux (montage 10-20, puis canaux annexes 'AUXn' ignorés par le prétraitement) [défaut: 21]
+--sfreq          Fréquence d'échantillonnage (Hz) [défaut: 256]
+--ied_rate       Nombre moyen d'IEDs par seconde [défaut: 0.2]
+--stages         Étapes mesurées (toutes par défaut)
+--repeat         Nombre de répétitions de chaque étape [défaut: 1]
+--workdir        Dossier des fichiers synthétiques (temporaire, supprimé à la fin, sinon)
+--output         Fichier JSON des résultats [défaut: benchmark_results.json]
+--compare        JSON d'un banc précédent : écarts affichés, code de sortie 1 si une étape est plus lente
+--tolerance      Ralentissement toléré par --compare (fraction) [défaut: 0.2]
+--profile        Fichier JSON lines des mesures détaillées par sous-étape (voir preprocessing/instrumentation.py)
+--dtype          Type des calculs des étapes mesurées : float64 ou float32 [défaut: float64]
+--check_float32  Compare la chaîne en float32 à la chaîne en float64 (précision), code de sortie 1 si hors tolérance
+---------------------
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from preprocessing import instrumentation
+from preprocessing.edf_cleaning import DEFAULT_CHANNELS
+from preprocessing.edf_io import EdfWriter, read_edf_header, unit_scale
+from preprocessing.events import set_store_root
+from preprocessing.pipeline import process_pool
+from preprocessing.signal_io import SIGNAL_DTYPES
+
+STAGES = ['preprocess_stream', 'preprocess_mne', 'csv_to_mat', 'morphology', 'extract_clean']
+
+# Électrodes des IEDs synthétiques (clés de ieds_morphology.Electrode_map) et canaux qui portent la pointe
+IED_ELECTRODES = {
+    'C4': ['C4'],
+    'F8': ['F8'],
+    'T4': ['T4'],
+    'F8-T4': ['F8', 'T4'],
+    'F7/F3': ['F7', 'F3'],
+}
+
+# Durée des blocs écrits lors de la génération (s) : mémoire bornée même pour 24 h
+GENERATION_BLOCK_SEC = 60
+
+# Tolérances du contrôle float32 / float64 (--check_float32)
+FLOAT32_MAX_ERROR_LSB = 0.1          # signaux : fraction du pas de quantification de l'EDF source
+FLOAT32_MORPHOLOGY_RTOL = 1e-4       # mesures continues : écart rapporté au maximum de la colonne
+# Mesures en échantillons : un point à la limite d'un seuil (demi-amplitude) peut basculer d'un
+# échantillon sous l'effet de l'arrondi ; proportion minimale de valeurs identiques et écart maximal
+FLOAT32_MORPHOLOGY_AGREEMENT = 0.99
+FLOAT32_MAX_SAMPLE_SHIFT = 1
+
+
+# --- Données synthétiques ---
+
+def synthetic_channels(n_channels):
+    """Canaux du montage 10-20 (DEFAULT_CHANNELS), complétés par des canaux annexes 'AUX1', 'AUX2'..."""
+    return list(DEFAULT_CHANNELS[:n_channels]) + [f'AUX{i + 1}' for i in range(max(n_channels - len(DEFAULT_CHANNELS), 0))]
+
+
+def spike_waveform(sfreq, amplitude=150e-6):
+    """Pointe biphasique (pic négatif aigu puis onde lente), en volts, centrée sur le pic."""
+    t = np.arange(-int(0.2 * sfreq), int(0.3 * sfreq)) / sfreq
+    spike = -amplitude * np.exp(-0.5 * (t / 0.012) ** 2)
+    slow_wave = 0.4 * amplitude * np.exp(-0.5 * ((t - 0.12) / 0.05) ** 2)
+    return spike + slow_wave, int(0.2 * sfreq)
+
+
+def generate_synthetic_recording(edf_path, csv_path, duration_sec=600, n_channels=21, sfreq=256, ied_rate=0.2, seed=0):
+    """
+    Écrit un EDF synthétique (bruit de fond 1/f approché, rythme alpha, secteur 50 Hz, pointes) et
+    le CSV des IEDs qu'il contient. La génération est faite par blocs : la mémoire ne dépend pas
+    de la durée.
+
+    :return: nombre d'IEDs
+    """
+    rng = np.random.default_rng(seed)
+    channels = synthetic_channels(n_channels)
+    channel_index = {ch: i for i, ch in enumerate(channels)}
+    n_times = int(duration_sec * sfreq)
+
+    # IEDs : instants uniformes (à au moins 1 s des bords), électrodes portées par le montage
+    electrodes = [e for e, chans in IED_ELECTRODES.items() if all(ch in channel_index for ch in chans)]
+    n_ieds = rng.poisson(ied_rate * duration_sec) if electrodes else 0
+    times = np.sort(rng.uniform(1.0, max(duration_sec - 1.0, 1.0), n_ieds))
+    labels = rng.choice(electrodes, n_ieds) if n_ieds else np.array([], dtype=str)
+    pd.DataFrame({'Tmu': np.round(times * 1e6).astype(np.int64), 'Electrode': labels}).to_csv(csv_path, index=False)
+
+    waveform, peak = spike_waveform(sfreq)
+    peaks = np.round(times * sfreq).astype(np.int64)
+    block = int(GENERATION_BLOCK_SEC * sfreq)
+    state = np.zeros((n_channels, 1))
+    with EdfWriter(edf_path, channels, sfreq, -1000.0, 1000.0) as writer:
+        for start in range(0, n_times, block):
+            stop = min(start + block, n_times)
+            t = np.arange(start, stop) / sfreq
+            # Bruit brun filtré (AR(1)) + bruit blanc, état du filtre conservé d'un bloc à l'autre
+            noise, state = lfilter([1.0], [1.0, -0.98], rng.standard_normal((n_channels, stop - start)) * 4e-6,
+                                   axis=1, zi=state)
+            data = noise + rng.standard_normal(noise.shape) * 5e-6
+            data += 15e-6 * np.sin(2 * np.pi * 10 * t + rng.uniform(0, 2 * np.pi, (n_channels, 1)))
+            data += 20e-6 * np.sin(2 * np.pi * 50 * t)
+
+            # Pointes dont la forme chevauche le bloc
+            first, last = np.searchsorted(peaks, [start - len(waveform), stop + peak])
+            for i in range(first, last):
+                lo = peaks[i] - peak
+                seg = slice(max(lo, start), min(lo + len(waveform), stop))
+                if seg.stop <= seg.start:
+                    continue
+                rows = [channel_index[ch] for ch in IED_ELECTRODES[labels[i]]]
+                data[rows, seg.start - start:seg.stop - start] += waveform[seg.start - lo:seg.stop - lo]
+            writer.write(data)
+    return n_ieds
+
+
+# --- Mesure d'une étape ---
+
+def current_rss_mb():
+    """Mémoire résidente actuelle du processus (Mo), ou NaN si /proc n'est pas disponible."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return float('nan')
+
+
+def _remove(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def run_stage(stage, files, duration_sec, dtype='float64'):
+    """Exécute une étape et mesure temps et mémoire (dans un processus 'spawn' dédié)."""
+    from preprocessing import edf_cleaning
+    from preprocessing.events import event_store_path
+    from scripts import convert_csv_to_mat, extract_clean_resting_edf, ieds_morphology
+
+    epochs_files = glob.glob(glob.escape(os.path.splitext(files['clean'])[0]) + '_epochs*')
+    if stage == 'preprocess_stream':
+        run = lambda: edf_cleaning.clean_and_save_edf(files['edf'], files['clean'], block_sec=60, dtype=dtype)
+        clear = [files['clean']]
+    elif stage == 'preprocess_mne':
+        run = lambda: edf_cleaning.clean_and_save_edf(files['edf'], files['clean_mne'], dtype=dtype)
+        clear = [files['clean_mne']]
+    elif stage == 'csv_to_mat':
+        run = lambda: convert_csv_to_mat.csv_to_mat(files['csv'], files['mat'])
+        clear = [files['mat'], event_store_path(files['csv'])]
+    elif stage == 'morphology':
+        run = lambda: ieds_morphology.morphology_from_files(files['csv'], files['clean'], files['morphology'],
+                                                            dtype=dtype)
+        clear = [files['morphology'], event_store_path(files['csv'])] + epochs_files
+    elif stage == 'extract_clean':
+        run = lambda: extract_clean_resting_edf.extract_clean_segments(
+            files['clean'], files['mat'], files['resting'], min_seg_sec=2, total_duration_sec=duration_sec,
+            dtype=dtype)
+        clear = [files['resting']]
+    else:
+        raise ValueError(f"Étape inconnue : {stage}")
+
+    _remove(clear)
+    baseline = current_rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    run()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return {
+        'wall_s': wall,
+        'cpu_s': cpu,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'baseline_rss_mb': baseline,
+    }
+
+
+def measure(stage, files, duration_sec, dtype='float64'):
+    """Mesure d'une étape dans un processus neuf (un seul processus à la fois)."""
+    with process_pool(1) as executor:
+        return executor.submit(run_stage, stage, files, duration_sec, dtype).result()
+
+
+# --- Précision du mode float32 ---
+
+def source_lsb(edf_path):
+    """Plus petit pas de quantification (en volts) des canaux d'un EDF."""
+    header = read_edf_header(edf_path)
+    return min((pmax - pmin) / (dmax - dmin) * unit_scale(unit)
+               for pmin, pmax, dmin, dmax, unit in zip(header['physical_min'], header['physical_max'],
+                                                       header['digital_min'], header['digital_max'],
+                                                       header['physical_dimension']))
+
+
+def float32_accuracy(files, duration_sec):
+    """
+    Exécute chaque étape en float64 puis en float32 sur les mêmes entrées et mesure les écarts
+    (exécutable dans un processus 'spawn'). Le prétraitement est comparé en mémoire ; epochs,
+    morphologie et segments propres sont calculés à partir du même EDF nettoyé.
+
+    :return: dictionnaire des écarts, des tolérances et 'passed'
+    """
+    from preprocessing import edf_cleaning
+    from preprocessing.epochs import extract_epochs
+    from preprocessing.events import load_events
+    from preprocessing.signal_io import open_signal
+    from scripts import convert_csv_to_mat, extract_clean_resting_edf, ieds_morphology
+
+    lsb = source_lsb(files['edf'])
+    if not os.path.exists(files['clean']):
+        edf_cleaning.clean_and_save_edf(files['edf'], files['clean'], block_sec=60)
+    if not os.path.exists(files['mat']):
+        convert_csv_to_mat.csv_to_mat(files['csv'], files['mat'])
+    event_times = load_events(files['csv'], columns=['time'])['time'].to_numpy()
+
+    signals, epochs, morphologies, resting = {}, {}, {}, {}
+    workdir = os.path.dirname(files['clean'])
+    for dtype in SIGNAL_DTYPES:
+        signals[dtype] = edf_cleaning.clean_signal(files['edf'], dtype=dtype)[0]
+
+        # Epochs et morphologie : copie de l'EDF nettoyé par type (les epochs sont stockées à côté)
+        clean = os.path.join(workdir, f'check_{dtype}_clean.edf')
+        shutil.copyfile(files['clean'], clean)
+        epochs[dtype] = np.load(extract_epochs(clean, event_times, dtype=dtype))
+        morphologies[dtype] = ieds_morphology.morphology_from_files(
+            files['csv'], clean, os.path.join(workdir, f'check_{dtype}_morphology.csv'), dtype=dtype)
+
+        resting_path = os.path.join(workdir, f'check_{dtype}_resting_raw.fif')
+        extract_clean_resting_edf.extract_clean_segments(files['clean'], files['mat'], resting_path, min_seg_sec=2,
+                                                         total_duration_sec=duration_sec, dtype=dtype)
+        resting[dtype] = open_signal(resting_path).read()
+
+    def max_error_lsb(values):
+        return float(np.nanmax(np.abs(values['float64'] - values['float32'].astype(np.float64)))) / lsb
+
+    report = {
+        'source_lsb_uv': lsb * 1e6,
+        'signal_max_error_lsb': max_error_lsb(signals),
+        'signal_rms_error_lsb': float(np.sqrt(np.mean((signals['float64'] - signals['float32']) ** 2))) / lsb,
+        'epochs_max_error_lsb': max_error_lsb(epochs) if epochs['float64'].size else 0.0,
+        'resting_max_error_lsb': max_error_lsb(resting) if resting['float64'].size else 0.0,
+        'signal_bytes': {dtype: int(signals[dtype].nbytes) for dtype in SIGNAL_DTYPES},
+    }
+    reference, compact = morphologies['float64'], morphologies['float32']
+    for column in ('Amplitude', 'Negative_Slope', 'Positive_Slope'):
+        scale = np.nanmax(np.abs(reference[column])) if len(reference) else 1.0
+        report[f'{column}_max_rel_error'] = float(np.nanmax(np.abs(reference[column] - compact[column])) / scale) \
+            if len(reference) else 0.0
+    for column in ('Half_Width', 'Crossing_Left', 'Crossing_Right'):
+        same = (reference[column] == compact[column]) | (reference[column].isna() & compact[column].isna())
+        report[f'{column}_agreement'] = float(same.mean()) if len(reference) else 1.0
+        shift = np.abs(reference[column] - compact[column])
+        report[f'{column}_max_shift'] = float(shift.max()) if shift.notna().any() else 0.0
+
+    report['passed'] = bool(
+        max(report['signal_max_error_lsb'], report['epochs_max_error_lsb'], report['resting_max_error_lsb'])
+        <= FLOAT32_MAX_ERROR_LSB
+        and all(report[f'{c}_max_rel_error'] <= FLOAT32_MORPHOLOGY_RTOL
+                for c in ('Amplitude', 'Negative_Slope', 'Positive_Slope'))
+        and all(report[f'{c}_agreement'] >= FLOAT32_MORPHOLOGY_AGREEMENT
+                and report[f'{c}_max_shift'] <= FLOAT32_MAX_SAMPLE_SHIFT
+                for c in ('Half_Width', 'Crossing_Left', 'Crossing_Right')))
+    return report
+
+
+def print_accuracy(report):
+    """Affiche le contrôle float32 / float64."""
+    print(f"Précision float32 / float64 (LSB de l'EDF source = {report['source_lsb_uv']:.4f} µV) :")
+    for key, value in report.items():
+        if key not in ('source_lsb_uv', 'signal_bytes', 'passed'):
+            print(f"  {key:28s} {value:.3g}")
+    memory = report['signal_bytes']
+    print(f"  signal nettoyé en mémoire    {memory['float64'] / 2 ** 20:.1f} Mo (float64) -> "
+          f"{memory['float32'] / 2 ** 20:.1f} Mo (float32)")
+    print("✅ Écarts dans les tolérances." if report['passed'] else "❌ Écart(s) hors tolérance.")
+
+
+# --- Résultats ---
+
+def environment():
+    """Versions et machine, pour comparer des bancs entre versions."""
+    import mne
+    import scipy
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'pandas': pd.__version__,
+        'mne': mne.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def summarize(results):
+    """{étape: médiane des mesures sur les répétitions}."""
+    df = pd.DataFrame(results)
+    return df.groupby('stage', sort=False).median(numeric_only=True).drop(columns='run').to_dict('index')
+
+
+def compare(summary, baseline_path, tolerance):
+    """Affiche les écarts de temps avec un banc précédent ; renvoie les étapes trop lentes."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['summary']
+    slower = []
+    for stage, values in summary.items():
+        if stage not in baseline:
+            continue
+        ratio = values['wall_s'] / baseline[stage]['wall_s']
+        memory = values['peak_rss_mb'] / baseline[stage]['peak_rss_mb']
+        flag = '⚠️' if ratio > 1 + tolerance else '  '
+        print(f"{flag} {stage:18s} temps x{ratio:.2f}  pic mémoire x{memory:.2f}")
+        if ratio > 1 + tolerance:
+            slower.append(stage)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai de la chaîne sur un EDF synthétique")
+    parser.add_argument("--duration_sec", type=float, default=600, help="Durée de l'enregistrement (s)")
+    parser.add_argument("--n_channels", type=int, default=21, help="Nombre de canaux")
+    parser.add_argument("--sfreq", type=int, default=256, help="Fréquence d'échantillonnage (Hz)")
+    parser.add_argument("--ied_rate", type=float, default=0.2, help="Nombre moyen d'IEDs par seconde")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du générateur")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES, help="Étapes mesurées")
+    parser.add_argument("--repeat", type=int, default=1, help="Répétitions de chaque étape")
+    parser.add_argument("--workdir", default=None, help="Dossier des fichiers synthétiques (conservé)")
+    parser.add_argument("--output", default="benchmark_results.json", help="Fichier JSON des résultats")
+    parser.add_argument("--compare", default=None, help="JSON d'un banc précédent")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Ralentissement toléré par --compare")
+    parser.add_argument("--profile", default=None, help="Fichier JSON lines des mesures par sous-étape")
+    parser.add_argument("--dtype", choices=SIGNAL_DTYPES, default="float64", help="Type des calculs des étapes")
+    parser.add_argument("--check_float32", action="store_true", help="Contrôle de précision float32 / float64")
+    args = parser.parse_args()
+    if args.profile:
+        instrumentation.enable(args.profile)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ecofec_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    # Stock d'événements dans le dossier de travail (hérité par les processus de mesure)
+    set_store_root(os.path.join(workdir, 'event_store'))
+    files = {name: os.path.join(workdir, filename) for name, filename in {
+        'edf': 'synthetic.edf', 'csv': 'synthetic_ieds.csv', 'clean': 'synthetic_clean.edf',
+        'clean_mne': 'synthetic_clean_mne.edf', 'mat': 'synthetic_ieds.mat',
+        'morphology': 'synthetic_morphology.csv', 'resting': 'synthetic_resting_raw.fif'}.items()}
+
+    try:
+        print(f"Génération : {args.duration_sec} s, {args.n_channels} canaux, {args.sfreq} Hz -> {workdir}")
+        start = time.perf_counter()
+        n_ieds = generate_synthetic_recording(files['edf'], files['csv'], args.duration_sec, args.n_channels,
+                                              args.sfreq, args.ied_rate, args.seed)
+        print(f"{n_ieds} IEDs, EDF de {os.path.getsize(files['edf']) / 2 ** 20:.1f} Mo ({time.perf_counter() - start:.1f} s)")
+
+        # Entrées des étapes non mesurées mais nécessaires aux étapes demandées
+        needs_clean = {'morphology', 'extract_clean'} & set(args.stages)
+        if needs_clean and 'preprocess_stream' not in args.stages:
+            measure('preprocess_stream', files, args.duration_sec, args.dtype)
+        if 'extract_clean' in args.stages and 'csv_to_mat' not in args.stages:
+            measure('csv_to_mat', files, args.duration_sec)
+
+        results = []
+        for stage in [s for s in STAGES if s in args.stages]:
+            for run in range(args.repeat):
+                values = measure(stage, files, args.duration_sec, args.dtype)
+                units = n_ieds if stage in ('csv_to_mat', 'morphology') else args.duration_sec
+                values['throughput'] = units / values['wall_s'] if values['wall_s'] > 0 else float('nan')
+                values['throughput_unit'] = 'events/s' if stage in ('csv_to_mat', 'morphology') else 'signal_s/s'
+                results.append({'stage': stage, 'run': run, **values})
+                print(f"{stage:18s} {values['wall_s']:8.2f} s  CPU {values['cpu_s']:8.2f} s  "
+                      f"pic RSS {values['peak_rss_mb']:7.0f} Mo  ({values['throughput']:.0f} {values['throughput_unit']})")
+
+        accuracy = None
+        if args.check_float32:
+            with process_pool(1) as executor:
+                accuracy = executor.submit(float32_accuracy, files, args.duration_sec).result()
+            print_accuracy(accuracy)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize(results)
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'parameters': {key: getattr(args, key) for key in ('duration_sec', 'n_channels', 'sfreq', 'ied_rate',
+                                                           'seed', 'stages', 'repeat', 'dtype')},
+        'n_ieds': int(n_ieds),
+        'results': results,
+        'summary': summary,
+        'float32_check': accuracy,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print(f"Résultats sauvegardés dans : {args.output}")
+
+    failed = accuracy is not None and not accuracy['passed']
+    if args.compare:
+        slower = compare(summary, args.compare, args.tolerance)
+        if slower:
+            print(f"Étape(s) plus lente(s) que la référence de plus de {args.tolerance:.0%} : {', '.join(slower)}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
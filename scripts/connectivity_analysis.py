@@ -0,0 +1,124 @@
+"""
+connectivity_analysis.py
+
+Ce script mesure la connectivité fonctionnelle (cohérence, PLV, wPLI) entre toutes les paires de canaux d'un EDF
+nettoyé, sur les segments propres (sans pointes) de chaque état (Eveil, Sommeil...). Les segments propres sont
+définis comme dans extract_clean_resting_edf.py : complément des pointes du fichier .mat ('onsets' en secondes),
+de durée au moins --min_seg_sec, puis intersectés avec les périodes de chaque état.
+
+Les segments sont lus par blocs depuis l'EDF et chaque fenêtre n'est transformée qu'une fois pour toutes les
+paires (voir preprocessing/connectivity.py) : la mémoire reste bornée quelle que soit la durée analysée.
+
+Le résultat est une table CSV, une ligne par état, paire de canaux et bande :
+Patient, State, Channel_1, Channel_2, Band, Coherence, PLV, wPLI, N_Windows
+
+---------------------
+🔧 Utilisation (en ligne de commande) :
+python -m scripts.connectivity_analysis chemin/fichier_clean.edf chemin/fichier.mat chemin/sortie.csv [OPTIONS]
+
+📌 Options disponibles :
+--config        Fichier YAML contenant les périodes par état ('periodes'), tout l'enregistrement sinon
+--min_seg_sec   Durée minimale (en secondes) d'un segment propre [défaut: 2]
+--window_sec    Durée des fenêtres d'analyse (s) [défaut: 2]
+--h_freq        Borne haute de la bande gamma (Hz) [défaut: 80]
+--jobs          Nombre de processus (les blocs de segments sont répartis entre eux)
+
+💡 Exemple :
+python -m scripts.connectivity_analysis data/cleaned/d3bd_f29d_clean.edf data/raw/mat_file/d3bd_f29d.mat data/connectivity/d3bd_f29d_connectivity.csv --config data/config/d3bd_f29d_event_analysis.yaml --jobs 8
+---------------------
+"""
+
+import argparse
+import contextlib
+import os
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from preprocessing import connectivity, spectral
+from preprocessing.signal_io import open_signal
+from preprocessing.instrumentation import profiled, stage
+from preprocessing.intervals import filter_min_length, intersect
+from preprocessing.periods import parse_periods
+from preprocessing.pipeline import process_pool
+from scripts.extract_clean_resting_edf import load_onsets, spike_free_intervals
+
+# État attribué à tout l'enregistrement lorsque aucune période n'est donnée
+ALL_STATE = 'Tout'
+
+
+def state_segments(clean, periodes, sfreq, n_samples, min_samples):
+    """
+    Segments propres de chaque état : intersection avec les périodes de l'état (en secondes,
+    'max' = fin de l'enregistrement), de durée au moins min_samples.
+
+    :return: {état: tableau (n, 2) de bornes [début, fin) en échantillons}
+    """
+    if not periodes:
+        return {ALL_STATE: clean}
+    bounds = {}
+    for name, start, end in parse_periods(periodes):
+        interval = np.clip(np.round(np.array([start, end]) * sfreq), 0, n_samples).astype(np.int64)
+        bounds.setdefault(name, []).append(interval)
+    return {name: filter_min_length(intersect(clean, np.array(intervals)), min_samples)
+            for name, intervals in bounds.items()}
+
+
+@profiled(file_arg='edf_path')
+def connectivity_by_state(edf_path, mat_path, output_path, periodes=None, patient=None, min_seg_sec=2,
+                          window_sec=connectivity.WINDOW_SEC, h_freq=80.0, n_jobs=1):
+    """
+    Connectivité de toutes les paires de canaux sur les segments propres de chaque état, sauvegardée en CSV.
+
+    :return: DataFrame (une ligne par état, paire de canaux et bande)
+    """
+    reader = open_signal(edf_path)
+    sfreq = reader.sfreq
+    clean = spike_free_intervals(load_onsets(mat_path), sfreq, reader.n_times, min_seg_sec)
+    segments = state_segments(clean, periodes, sfreq, reader.n_times, int(min_seg_sec * sfreq))
+
+    bands = spectral.make_bands(h_freq)
+    f_min = min(b[0] for b in bands.values())
+    f_max = max(b[1] for b in bands.values())
+    tables = []
+    # Un seul groupe de processus pour tous les états
+    with process_pool(n_jobs) if n_jobs > 1 else contextlib.nullcontext() as executor:
+        for state, state_intervals in segments.items():
+            with stage('connectivity_analysis.state', file=edf_path, state=state):
+                sums, freqs, ch_names = connectivity.compute_connectivity(
+                    edf_path, state_intervals, window_sec=window_sec, f_min=f_min, f_max=f_max,
+                    n_jobs=n_jobs, executor=executor)
+            print(f"{state} : {len(state_intervals)} segment(s) propre(s), {sums.n_windows} fenêtres de {window_sec} s.")
+            table = connectivity.connectivity_table(sums, freqs, ch_names, bands)
+            table.insert(0, 'State', state)
+            tables.append(table)
+
+    result = pd.concat(tables, ignore_index=True)
+    result.insert(0, 'Patient', patient or os.path.splitext(os.path.basename(edf_path))[0])
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    result.to_csv(output_path, index=False)
+    print(f"Connectivité sauvegardée dans : {output_path}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Connectivité (cohérence, PLV, wPLI) sur les segments propres")
+    parser.add_argument("edf_path", help="Chemin vers le fichier .edf nettoyé")
+    parser.add_argument("pointes_mat_path", help="Fichier .mat contenant 'onsets' (en secondes)")
+    parser.add_argument("output_path", help="Fichier .csv de sortie")
+    parser.add_argument("--config", help="Fichier YAML contenant 'periodes' (états)")
+    parser.add_argument("--min_seg_sec", type=float, default=2, help="Durée minimale des segments (s)")
+    parser.add_argument("--window_sec", type=float, default=connectivity.WINDOW_SEC, help="Durée des fenêtres (s)")
+    parser.add_argument("--h_freq", type=float, default=80.0, help="Borne haute de la bande gamma (Hz)")
+    parser.add_argument("--jobs", type=int, default=1, help="Nombre de processus")
+    args = parser.parse_args()
+
+    periodes = None
+    if args.config:
+        with open(args.config, 'r') as f:
+            periodes = yaml.safe_load(f).get('periodes')
+
+    connectivity_by_state(args.edf_path, args.pointes_mat_path, args.output_path, periodes=periodes,
+                          min_seg_sec=args.min_seg_sec, window_sec=args.window_sec, h_freq=args.h_freq,
+                          n_jobs=args.jobs)
@@ -1,7 +1,7 @@
 """
 convert_csv_to_mat.py
 
-Ce script convertit un fichier .csv d'événements (extrait d'annotations EEG, comme des décharges épileptiformes interictales) 
+Ce script convertit un fichier .csv d'événements (extrait d'annotations EEG, comme des décharges épileptiformes interictales)
 en un fichier .mat compatible avec Brainstorm. Il extrait les temps d'occurrence des événements (colonne 'Tmu') et les étiquettes
 de canal (colonne 'Electrode').
 
@@ -9,48 +9,145 @@ Les temps sont convertis de microsecondes en secondes et sauvegardés dans un di
 - 'onsets' : vecteur numpy de temps (en secondes)
 - 'descriptions' : vecteur numpy de chaînes de caractères (nom de canal associé)
 
+Avec --format 7.3, le fichier est écrit au format MAT v7.3 (HDF5) et les étiquettes sont stockées
+sous forme d'index plutôt que d'une chaîne par événement :
+- 'onsets' : temps (en secondes)
+- 'electrode_index' : numéro (à partir de 1) de l'électrode de chaque événement dans le dictionnaire
+- 'electrode_codebook' : dictionnaire des électrodes (matrice de caractères, cellstr(...) sous MATLAB)
+Sous MATLAB : descriptions = cellstr(electrode_codebook); descriptions = descriptions(electrode_index);
+
 ---------------------
 🔧 Utilisation (en ligne de commande) :
-python convert_csv_to_mat.py chemin/vers/fichier.csv chemin/vers/sortie.mat
+python -m scripts.convert_csv_to_mat chemin/vers/fichier.csv chemin/vers/sortie.mat
+
+Conversion d'un dossier (ou d'un motif glob) de CSV vers un dossier de .mat, sur 8 processus :
+python -m scripts.convert_csv_to_mat "data/raw/csv_file/*.csv" data/raw/mat_file --jobs 8 --format 7.3
 
 💡 Exemple :
-python convert_csv_to_mat.py C:/Users/boyer/github/ECOFEC/data/raw/csv_file/f29d_19ICA_FINAL.csv C:/Users/boyer/github/ECOFEC/data/raw/mat_file/f29d_19ICA_FINAL.mat
+python -m scripts.convert_csv_to_mat C:/Users/boyer/github/ECOFEC/data/raw/csv_file/f29d_19ICA_FINAL.csv C:/Users/boyer/github/ECOFEC/data/raw/mat_file/f29d_19ICA_FINAL.mat
 ---------------------
 
 Format attendu du fichier .csv : colonnes 'Tmu' (en µs) et 'Electrode'
+En mode lot, un .mat n'est reconverti que si son CSV, le format ou ce script ont changé
+(manifeste .ecofec_cache.json dans le dossier de sortie) ; --overwrite force la conversion.
 """
 
-import pandas as pd
+import argparse
+import glob
 import numpy as np
 from scipy.io import savemat
 import os
 import sys
 
-def csv_to_mat(csv_path, mat_path):
-    # Lire le CSV
-    df = pd.read_csv(csv_path)
+from preprocessing.cache import ResultCache, MANIFEST_NAME, code_version
+from preprocessing.events import load_events
+from preprocessing.instrumentation import profiled, stage
+from preprocessing.pipeline import Task, run_tasks, print_summary
+
+MAT_FORMATS = ('5', '7.3')
 
-    # Conversion du temps de microsecondes à secondes
-    times = df['Tmu'] / 1e6
+def write_mat73(mat_path, variables):
+    """
+    Écrit des variables numériques dans un fichier MAT v7.3 (HDF5 avec l'en-tête MATLAB de 512 octets).
+    Les tableaux 1-D sont enregistrés en vecteurs ligne, les tableaux de caractères (dtype 'U')
+    en matrices de caractères MATLAB.
+    """
+    import h5py  # dépendance optionnelle, seulement pour le format 7.3
 
-    # Description des événements (électrode)
-    descriptions = df['Electrode']
+    classes = {np.dtype('float64'): 'double', np.dtype('int32'): 'int32', np.dtype('uint32'): 'uint32'}
+    with h5py.File(mat_path, 'w', userblock_size=512) as f:
+        for name, value in variables.items():
+            value = np.asarray(value)
+            if value.dtype.kind == 'U':
+                # Matrice de caractères (n_chaînes x longueur) en UTF-16, ordre colonne de MATLAB
+                width = max(value.dtype.itemsize // 4, 1)
+                codes = np.array([[ord(c) for c in s.ljust(width)] for s in value], dtype=np.uint16).reshape(-1, width)
+                dataset = f.create_dataset(name, data=codes.T)
+                dataset.attrs['MATLAB_class'] = np.bytes_('char')
+                dataset.attrs['MATLAB_int_decode'] = np.int32(2)
+                continue
+            matlab_class = classes[value.dtype]
+            data = value.reshape(1, -1) if value.ndim == 1 else value
+            dataset = f.create_dataset(name, data=data.T, compression='gzip', compression_opts=4, chunks=True)
+            dataset.attrs['MATLAB_class'] = np.bytes_(matlab_class)
 
-    # Construire la structure pour Brainstorm
-    events = {
-        'onsets': np.array(times),
-        'descriptions': np.array(descriptions, dtype=np.object_)
-    }
+    # En-tête texte MATLAB dans le bloc utilisateur HDF5
+    header = b'MATLAB 7.3 MAT-file, Platform: GLNXA64, Created by: ECOFEC HDF5 schema 1.00 .'
+    header = header.ljust(116, b' ') + b'\x00' * 8 + b'\x00\x02' + b'IM'
+    with open(mat_path, 'r+b') as f:
+        f.write(header.ljust(512, b'\x00'))
+
+@profiled(file_arg='csv_path')
+def csv_to_mat(csv_path, mat_path, mat_format='5'):
+    # Lire les temps (déjà en secondes) et les électrodes depuis le stock Parquet du CSV
+    with stage('convert_csv_to_mat.load_events', file=csv_path):
+        events = load_events(csv_path, columns=['time', 'electrode'])
+    # float64 même pour un CSV sans événement (colonne vide de type objet)
+    times = np.asarray(events['time'].to_numpy(), dtype=np.float64)
 
     # Créer dossier de sortie si besoin
-    os.makedirs(os.path.dirname(mat_path), exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(mat_path)), exist_ok=True)
+
+    if mat_format == '7.3':
+        # Électrodes : index (1-based) dans un dictionnaire au lieu d'une chaîne par événement
+        electrodes = events['electrode'].cat.remove_unused_categories()
+        write_mat73(mat_path, {
+            'onsets': times,
+            'electrode_index': (electrodes.cat.codes.to_numpy() + 1).astype(np.int32),
+            'electrode_codebook': np.array(electrodes.cat.categories.astype(str), dtype=str),
+        })
+    else:
+        # Description des événements (électrode)
+        descriptions = events['electrode'].astype(object)
 
-    # Sauvegarder le .mat
-    savemat(mat_path, events)
+        # Construire la structure pour Brainstorm
+        events = {
+            'onsets': np.array(times),
+            'descriptions': np.array(descriptions, dtype=np.object_)
+        }
+
+        # Sauvegarder le .mat
+        savemat(mat_path, events)
     print(f"Fichier .mat sauvegardé dans : {mat_path}")
 
+def find_csv_files(input_path):
+    """Fichiers CSV d'un chemin : fichier, dossier (tous ses .csv) ou motif glob."""
+    if os.path.isdir(input_path):
+        return sorted(glob.glob(os.path.join(input_path, '*.csv')))
+    return sorted(glob.glob(input_path))
+
+def convert_batch(csv_files, output_dir, mat_format='5', n_jobs=1, overwrite=False):
+    """Convertit une liste de CSV vers output_dir/<nom>.mat (en parallèle, avec cache)."""
+    os.makedirs(output_dir, exist_ok=True)
+    cache = ResultCache(os.path.join(output_dir, MANIFEST_NAME))
+    version = code_version(sys.modules[__name__])
+    tasks = []
+    for csv_path in csv_files:
+        mat_path = os.path.join(output_dir, os.path.splitext(os.path.basename(csv_path))[0] + '.mat')
+        tasks.append(Task(csv_path, csv_to_mat, [csv_path], [mat_path], params={'format': mat_format},
+                          version=version, args=(csv_path, mat_path, mat_format)))
+    results = run_tasks(tasks, cache, n_jobs=n_jobs, overwrite=overwrite)
+    cache.save()
+    print_summary(results)
+    return results
+
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage : python convert_csv_to_mat.py chemin/fichier.csv chemin/sortie.mat")
-        sys.exit(1)
-    csv_to_mat(sys.argv[1], sys.argv[2])
+    parser = argparse.ArgumentParser(description="Conversion de CSV d'événements en .mat (Brainstorm)")
+    parser.add_argument("input", help="Fichier .csv, dossier de .csv ou motif glob (entre guillemets)")
+    parser.add_argument("output", help="Fichier .mat (un seul CSV) ou dossier de sortie (lot)")
+    parser.add_argument("--format", dest="mat_format", choices=MAT_FORMATS, default='5',
+                        help="Format MAT : 5 (scipy, défaut) ou 7.3 (HDF5, électrodes indexées)")
+    parser.add_argument("--jobs", type=int, default=1, help="Nombre de fichiers convertis en parallèle")
+    parser.add_argument("--overwrite", action="store_true", help="Reconvertir même les fichiers à jour (mode lot)")
+    args = parser.parse_args()
+
+    if args.output.endswith('.mat'):
+        csv_to_mat(args.input, args.output, args.mat_format)
+    else:
+        csv_files = find_csv_files(args.input)
+        if not csv_files:
+            print(f"Aucun fichier .csv trouvé pour : {args.input}")
+            sys.exit(1)
+        results = convert_batch(csv_files, args.output, args.mat_format, args.jobs, args.overwrite)
+        if any(status == "error" for _, status, _ in results):
+            sys.exit(1)
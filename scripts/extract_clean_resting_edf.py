@@ -6,11 +6,12 @@ des événements pathologiques (par exemple, des pointes épileptiformes), défi
 Il permet aussi une **sélection interactive** des segments via affichage graphique avec validation manuelle (option `--visualize`).
 
 Le résultat est sauvegardé sous forme d’un nouveau fichier .edf ou .fif contenant une durée totale de données propres définie
-par l’utilisateur.
+par l’utilisateur. Les segments sont écrits un par un dès leur sélection (mémoire bornée par la taille d'un segment) et
+chacun est repéré par une annotation 'segment <n> src=<début dans l'EDF source>s'.
 
 ---------------------
 🔧 Utilisation (en ligne de commande) :
-python extract_clean_resting_edf.py chemin/fichier.edf chemin/fichier.mat [OPTIONS]
+python -m scripts.extract_clean_resting_edf chemin/fichier.edf chemin/fichier.mat [OPTIONS]
 
 📌 Options disponibles :
 --output_path            Chemin du fichier de sortie (.edf ou .fif)
@@ -18,150 +19,234 @@ python extract_clean_resting_edf.py chemin/fichier.edf chemin/fichier.mat [OPTIO
 --total_duration_sec     Durée totale souhaitée des données propres à extraire [défaut: 60]
 --visualize              Active l’affichage graphique et la sélection interactive (o/n)
 --wake_periods           Plage(s) temporelle(s) d’éveil, ex : --wake_periods "15 600 2248 2407"
+--overwrite              Recalcule la sortie même si elle est à jour dans le cache
+--dtype                  Type des segments lus et accumulés : float64 (défaut) ou float32 (mémoire divisée par deux)
 
 💡 Exemple simple sans visualisation :
-python extract_clean_resting_edf.py C:/dossier/fichier_clean.edf C:/dossier/fichier.mat --output_path C:/sortie/output.edf
+python -m scripts.extract_clean_resting_edf C:/dossier/fichier_clean.edf C:/dossier/fichier.mat --output_path C:/sortie/output.edf
 
 💡 Exemple avec visualisation interactive :
-python extract_clean_resting_edf.py C:/dossier/fichier_clean.edf C:/dossier/fichier.mat --output_path C:/sortie/output.edf --min_seg_sec 2 --total_duration_sec 60 --visualize
+python -m scripts.extract_clean_resting_edf C:/dossier/fichier_clean.edf C:/dossier/fichier.mat --output_path C:/sortie/output.edf --min_seg_sec 2 --total_duration_sec 60 --visualize
 
 ⚠️ Le fichier .mat doit contenir un champ 'onsets' (vecteur de temps en secondes).
+
+Sans --visualize, la sortie n'est recalculée que si les fichiers d'entrée, les options ou le code
+ont changé (manifeste .ecofec_cache.json dans le dossier de sortie).
 ---------------------
 """
 
-import mne
+import os
+import sys
+import tempfile
 import numpy as np
 import scipy.io as sio
 import argparse
 import matplotlib.pyplot as plt
 
-print("Début script")
+from preprocessing.cache import ResultCache, MANIFEST_NAME, code_version
+from preprocessing.edf_io import EdfWriter
+from preprocessing.signal_io import SIGNAL_DTYPES, open_signal, save_fif
+from preprocessing.instrumentation import profiled, stage
+from preprocessing.intervals import merge_intervals, complement, filter_min_length, contained_in
+
+# Durée moyenne d'une pointe en secondes (à adapter si besoin)
+SPIKE_DURATION = 0.3
+
+
+class SegmentOutput:
+    """
+    Écriture au fil de l'eau des segments retenus dans le fichier de sortie (.edf ou .fif).
+
+    Chaque segment est écrit dès qu'il est accepté : la mémoire utilisée est celle d'un segment,
+    quelle que soit la durée totale extraite. Une annotation 'segment <n> src=<t>s' marque le
+    début et la durée de chaque segment dans la sortie, avec son temps d'origine dans l'EDF source.
+
+    - .edf : écriture directe par enregistrements (EDF+C, canal d'annotations), plage physique
+      identique à celle du fichier source (pas de requantification) ;
+    - .fif : MNE n'ayant pas d'écriture incrémentale, les segments sont accumulés dans un memmap
+      float32 temporaire sur disque, sauvegardé à la fermeture par signal_io.save_fif (comme FifWriter).
 
-def is_in_wake_period(start_sec, end_sec, wake_periods):
+    En cas d'erreur, abort() supprime la sortie partielle.
     """
-    Vérifie si un segment (start_sec, end_sec) est entièrement inclus dans une période d'éveil.
+
+    def __init__(self, output_path, reader, max_samples):
+        self.output_path = output_path
+        self.reader = reader
+        self.sfreq = reader.sfreq
+        self.n_written = 0
+        self.onsets, self.durations, self.descriptions = [], [], []
+        self.is_edf = output_path.lower().endswith('.edf')
+
+        if self.is_edf:
+            header = reader.header
+            header_index = {label: i for i, label in enumerate(header['labels'])}
+            indices = [header_index[ch] for ch in reader.ch_names]
+            self.writer = EdfWriter(output_path, reader.ch_names, self.sfreq,
+                                    [header['physical_min'][i] for i in indices],
+                                    [header['physical_max'][i] for i in indices],
+                                    physical_dimension=[header['physical_dimension'][i] for i in indices],
+                                    patient_id=header['patient_id'], recording_id=header['recording_id'],
+                                    start_date=header['start_date'], start_time=header['start_time'],
+                                    annotations=True)
+        else:
+            fd, self.tmp_path = tempfile.mkstemp(suffix='.dat', dir=os.path.dirname(os.path.abspath(output_path)))
+            os.close(fd)
+            self.buffer = np.memmap(self.tmp_path, dtype=np.float32, mode='w+',
+                                    shape=(len(reader.ch_names), max(int(max_samples), 1)))
+
+    def add(self, start, end):
+        """Lit le segment [start, end) (échantillons) de l'EDF source et l'ajoute à la sortie."""
+        data = self.reader.read(start=start, stop=end)
+        n = data.shape[1]
+        onset = self.n_written / self.sfreq
+        description = f"segment {len(self.onsets) + 1} src={start / self.sfreq:.3f}s"
+        if self.is_edf:
+            self.writer.add_annotation(onset, n / self.sfreq, description)
+            self.writer.write(data)
+        else:
+            self.buffer[:, self.n_written:self.n_written + n] = data
+        self.onsets.append(onset)
+        self.durations.append(n / self.sfreq)
+        self.descriptions.append(description)
+        self.n_written += n
+
+    def close(self):
+        """Finalise le fichier de sortie (et supprime le fichier temporaire éventuel)."""
+        if self.is_edf:
+            self.writer.close()
+            return
+        try:
+            if self.n_written:
+                save_fif(self.output_path, self.buffer[:, :self.n_written], self.reader.ch_names, self.sfreq,
+                         self.reader.meas_date, annotations=(self.onsets, self.durations, self.descriptions))
+        finally:
+            del self.buffer
+            os.remove(self.tmp_path)
+
+    def abort(self):
+        """Abandonne la sortie : supprime les fichiers partiels, rien n'est écrit sous output_path."""
+        if self.is_edf:
+            self.writer.abort()
+            return
+        del self.buffer
+        os.remove(self.tmp_path)
+
+
+def load_onsets(pointes_mat_path):
+    """Onsets des pointes (en secondes) du champ 'onsets' d'un fichier .mat."""
+    mat = sio.loadmat(pointes_mat_path)
+    return np.atleast_1d(mat['onsets'].squeeze()).astype(float)
+
+
+def spike_free_intervals(onsets, sfreq, n_samples, min_seg_sec, spike_duration=SPIKE_DURATION):
     """
-    for wstart, wend in wake_periods:
-        if start_sec >= wstart and end_sec <= wend:
-            return True
-    return False
+    Segments propres d'un enregistrement : complément des pointes [onset, onset + spike_duration],
+    de durée au moins min_seg_sec.
 
+    :return: tableau (n, 2) de bornes [début, fin) en échantillons
+    """
+    # Création de pointes [début, fin], en échantillons et fusionnées
+    pointes = np.stack([onsets, onsets + spike_duration], axis=1)
+    artifacts = np.clip(np.round(pointes * sfreq), 0, n_samples).astype(np.int64)
+    artifacts = merge_intervals(artifacts)
+
+    min_samples = int(min_seg_sec * sfreq)
+    return filter_min_length(complement(artifacts, 0, n_samples), min_samples)
+
+
+@profiled(file_arg='edf_path')
 def extract_clean_segments(edf_path, pointes_mat_path, output_path,
                            min_seg_sec=1, total_duration_sec=60,
                            wake_periods=None,
-                           visualize_segments=False):
-    # --- Charger les données EEG .edf ---
-    raw = mne.io.read_raw_edf(edf_path, preload=True)
-    sfreq = raw.info['sfreq']
-    n_samples = raw.n_times
+                           visualize_segments=False, dtype=np.float64):
+    # --- Ouvrir les données EEG .edf (seuls les segments retenus seront lus, en dtype) ---
+    reader = open_signal(edf_path, dtype)
+    sfreq = reader.sfreq
+    n_samples = reader.n_times
     duration_sec = n_samples / sfreq
     print(f"EDF loaded: {edf_path}, Fs = {sfreq} Hz, Duration = {duration_sec:.1f} s")
 
     # --- Charger les pointes depuis .mat ---
-    mat = sio.loadmat(pointes_mat_path)
-    onsets = mat['onsets'].squeeze()  # en secondes
-    duration = 0.3  # durée moyenne d'une pointe en secondes (à adapter si besoin)
+    with stage('extract_clean_resting_edf.load_onsets', file=pointes_mat_path):
+        onsets = load_onsets(pointes_mat_path)
+    print(f"{len(onsets)} pointes reconstruites à partir des onsets.")
 
-    # Création de pointes [début, fin]
-    pointes = np.stack([onsets, onsets + duration], axis=1)
-    print(f"{pointes.shape[0]} pointes reconstruites à partir des onsets.")
-
-    # --- Vecteur binaire d'artéfacts ---
-    artifact_vector = np.zeros(n_samples, dtype=int)
-    for start_sec, end_sec in pointes:
-        start_idx = max(0, int(round(start_sec * sfreq)))
-        end_idx = min(n_samples, int(round(end_sec * sfreq)))
-        artifact_vector[start_idx:end_idx] = 1
-
-    # --- Détection des segments clean ---
-    min_samples = int(min_seg_sec * sfreq)
-    clean_segments = []
-    current_start = None
-    for i in range(n_samples):
-        if artifact_vector[i] == 0 and current_start is None:
-            current_start = i
-        elif artifact_vector[i] == 1 and current_start is not None:
-            if i - current_start >= min_samples:
-                clean_segments.append((current_start, i))
-            current_start = None
-    if current_start is not None and (n_samples - current_start) >= min_samples:
-        clean_segments.append((current_start, n_samples))
+    # --- Détection des segments clean : complément des pointes, durée minimale ---
+    clean_intervals = spike_free_intervals(onsets, sfreq, n_samples, min_seg_sec)
+    clean_segments = [(int(start), int(end)) for start, end in clean_intervals]
 
     print(f"{len(clean_segments)} segments propres trouvés (≥ {min_seg_sec}s).")
 
-    # --- Filtrer les segments dans les périodes d'éveil ---
+    # --- Filtrer les segments entièrement inclus dans les périodes d'éveil ---
     if wake_periods is not None:
-        wake_segments = []
-        for seg_start, seg_end in clean_segments:
-            start_sec = seg_start / sfreq
-            end_sec = seg_end / sfreq
-            if is_in_wake_period(start_sec, end_sec, wake_periods):
-                wake_segments.append((seg_start, seg_end))
+        in_wake = contained_in(clean_intervals / sfreq, wake_periods)
+        wake_segments = [seg for seg, keep in zip(clean_segments, in_wake) if keep]
         print(f"{len(wake_segments)} segments propres dans les périodes d'éveil.")
     else:
         wake_segments = clean_segments
 
-    # --- Sélection interactive avec visualisation ---
-    selected_data = []
+    # --- Sélection (interactive ou non) et écriture segment par segment ---
+    target_samples = total_duration_sec * sfreq
+    max_samples = min(sum(end - start for start, end in wake_segments),
+                      target_samples + max((end - start for start, end in wake_segments), default=0))
+    output = SegmentOutput(output_path, reader, max_samples)
     total_samples = 0
     segment_count = 0
 
-    for start, end in wake_segments:
-        seg_len = end - start
-        segment_count += 1
-
-        if visualize_segments:
-            data_plot = raw.get_data(start=start, stop=end)
-            times = np.arange(data_plot.shape[1]) / sfreq
-            plt.figure(figsize=(10, 4))
-            plt.title(f'Segment {segment_count}: {start/sfreq:.1f}s - {end/sfreq:.1f}s')
-            plt.plot(times, data_plot[0, :])  # Affiche le canal 0 (modifiable)
-            plt.xlabel('Temps (s)')
-            plt.ylabel('Amplitude (uV)')
-            plt.show()
-
-            # Interaction utilisateur pour garder/rejeter
-            keep = input("Garder ce segment ? (o/n) : ").strip().lower()
-            while keep not in ('o', 'n'):
-                keep = input("Réponse invalide, taper 'o' pour garder ou 'n' pour rejeter : ").strip().lower()
-
-            if keep == 'n':
-                print(f"Segment {segment_count} rejeté.")
-                continue  # passe au segment suivant
-
-        # Ajouter segment gardé
-        selected_data.append(raw.get_data(start=start, stop=end))
-        total_samples += seg_len
-
-        if total_samples >= total_duration_sec * sfreq:
-            print(f"Durée totale atteinte avec {segment_count} segments.")
-            break
-
-    if total_samples < total_duration_sec * sfreq:
+    try:
+        for start, end in wake_segments:
+            seg_len = end - start
+            segment_count += 1
+
+            if visualize_segments:
+                data_plot = reader.read(start=start, stop=end)
+                times = np.arange(data_plot.shape[1]) / sfreq
+                plt.figure(figsize=(10, 4))
+                plt.title(f'Segment {segment_count}: {start/sfreq:.1f}s - {end/sfreq:.1f}s')
+                plt.plot(times, data_plot[0, :])  # Affiche le canal 0 (modifiable)
+                plt.xlabel('Temps (s)')
+                plt.ylabel('Amplitude (uV)')
+                plt.show()
+
+                # Interaction utilisateur pour garder/rejeter
+                keep = input("Garder ce segment ? (o/n) : ").strip().lower()
+                while keep not in ('o', 'n'):
+                    keep = input("Réponse invalide, taper 'o' pour garder ou 'n' pour rejeter : ").strip().lower()
+
+                if keep == 'n':
+                    print(f"Segment {segment_count} rejeté.")
+                    continue  # passe au segment suivant
+
+            # Écrire le segment gardé
+            output.add(start, end)
+            total_samples += seg_len
+
+            if total_samples >= target_samples:
+                print(f"Durée totale atteinte avec {segment_count} segments.")
+                break
+    except BaseException:
+        output.abort()
+        raise
+    output.close()
+
+    if total_samples < target_samples:
         print(f"⚠️ Moins de {total_duration_sec} secondes de données propres sélectionnées après rejet.")
     else:
         print(f"✅ {total_duration_sec} secondes de données propres sélectionnées.")
 
-    # --- Concaténer et créer nouveau RawArray ---
-    if len(selected_data) == 0:
+    if total_samples == 0:
         print("Aucun segment sélectionné, sortie annulée.")
+        if os.path.exists(output_path) and output.is_edf:
+            os.remove(output_path)
         return
 
-    concat_data = np.concatenate(selected_data, axis=1)
-    info = raw.info.copy()
-    clean_raw = mne.io.RawArray(concat_data, info)
-
-    # --- Sauvegarde ---
-    if output_path.endswith('.edf'):
-        clean_raw.export(output_path, fmt='edf', overwrite=True)
-    else:
-        clean_raw.save(output_path, overwrite=True)
-
     print(f"✅ Données sauvegardées : {output_path}")
+    return output_path
 
 
 # --- Exécution en ligne de commande ---
 if __name__ == "__main__":
+    print("Début script")
     parser = argparse.ArgumentParser(description="Extraction de segments EEG propres (sans pointes)")
     parser.add_argument("edf_path", help="Chemin vers le fichier .edf")
     parser.add_argument("pointes_mat_path", help="Fichier .mat contenant 'onsets' (en secondes)")
@@ -171,6 +256,8 @@ if __name__ == "__main__":
     parser.add_argument("--visualize", action='store_true', help="Afficher les segments sélectionnés")
     parser.add_argument("--wake_periods", type=str,
                         help="Périodes d'éveil (paires start end en secondes) séparées par espace, ex: --wake_periods \"15 600 2248 2407\"")
+    parser.add_argument("--overwrite", action='store_true', help="Recalculer même si la sortie est à jour")
+    parser.add_argument("--dtype", choices=SIGNAL_DTYPES, default="float64", help="Type des segments (float64 ou float32)")
 
     args = parser.parse_args()
 
@@ -185,8 +272,24 @@ if __name__ == "__main__":
     else:
         wake_periods = None
 
-    extract_clean_segments(args.edf_path, args.pointes_mat_path, args.output_path,
-                           min_seg_sec=args.min_seg_sec,
-                           total_duration_sec=args.total_duration_sec,
-                           wake_periods=wake_periods,
-                           visualize_segments=args.visualize)
+    # La sélection interactive dépend des réponses de l'utilisateur : elle n'est pas mise en cache
+    cache = ResultCache(os.path.join(os.path.dirname(os.path.abspath(args.output_path)), MANIFEST_NAME))
+    params = {
+        "min_seg_sec": args.min_seg_sec,
+        "total_duration_sec": args.total_duration_sec,
+        "wake_periods": wake_periods,
+        "dtype": args.dtype,
+    }
+    key = cache.make_key([args.edf_path, args.pointes_mat_path], params, code_version(sys.modules[__name__]))
+    if not args.visualize and not args.overwrite and cache.is_fresh(args.output_path, key):
+        print(f"✅ Sortie déjà à jour : {args.output_path}")
+        sys.exit(0)
+
+    saved_path = extract_clean_segments(args.edf_path, args.pointes_mat_path, args.output_path,
+                                        min_seg_sec=args.min_seg_sec,
+                                        total_duration_sec=args.total_duration_sec,
+                                        wake_periods=wake_periods,
+                                        visualize_segments=args.visualize, dtype=args.dtype)
+
+    if saved_path is not None and not args.visualize:
+        cache.record(saved_path, key)
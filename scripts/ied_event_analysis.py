@@ -1,10 +1,18 @@
+import argparse
+import hashlib
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import sys
 import yaml
 
+from preprocessing.cache import FolderCaches, code_version
+from preprocessing.events import load_events
+from preprocessing.instrumentation import profiled, stage
+from preprocessing.pipeline import Task, run_tasks, print_summary
+
 """
 ### ⚠️ Configuration Reminder
 
@@ -13,98 +21,229 @@ Each time you use this script, make sure to update the `.yaml` configuration fil
 - **Line 19**: path to the input CSV file (`input_csv`)
 - **Line 22**: path to the output folder (`save_folder`)
 
+The configuration file can also be given on the command line:
+python -m scripts.ied_event_analysis path/to/config.yaml
+
+Report mode (no display needed, e.g. on compute nodes): figures of one or several
+configurations are rendered with the Agg backend by a pool of processes, and figures whose
+data did not change are skipped:
+python -m scripts.ied_event_analysis configs/*.yaml --report --jobs 8
+
 """
 
-# Charger le fichier de configuration YAML
-with open('C:/Users/boyer/github/ECOFEC/data/config/d3bd_f29d_event_analysis.yaml', 'r') as f:
-    config = yaml.safe_load(f)
-
-yaml_filename_prefix = os.path.splitext(os.path.basename('C:/Users/boyer/github/ECOFEC/data/config/d3bd_f29d_event_analysis.yaml'))[0][:9]
-
-# Définir les chemins
-save_folder = config['save_folder']
-os.makedirs(save_folder, exist_ok=True)
-csv_file = config['input_csv']  # corriger 'csv_file' → 'input_csv'
-
-# Lire le fichier CSV
-df = pd.read_csv(csv_file)
-
-# Supprimer les colonnes spécifiées
-df.drop(columns=config['drop_columns'], inplace=True)
-
-# Convertir Tmu en secondes
-df['Tmu'] = df['Tmu'] / 1e6
-
-# Définir les périodes d’état
-periodes = config['periodes']
-
-def definir_periode(Tmu):
-    for etat, ranges in periodes.items():
-        for start, end in ranges:
-            if start <= Tmu <= end:
-                return etat.upper()
-    return 'REJETE'
-
-df['Etat'] = df['Tmu'].apply(definir_periode)
-
-# Comptage des événements par état
-comptage_eveil = df[df['Etat'] == 'EVEIL']['Electrode'].value_counts()
-comptage_sommeil = df[df['Etat'] == 'SOMMEIL']['Electrode'].value_counts()
-
-# --- CAMEMBERTS ---
-def creer_et_sauvegarder_camembert(data, titre, nom_fichier):
-    plt.figure(figsize=(8, 8))
-    plt.pie(data, labels=data.index, autopct='%1.1f%%', startangle=140)
-    plt.title(titre)
-    plt.axis('equal')
-    plt.savefig(os.path.join(save_folder, nom_fichier))
-    plt.close()
-
-creer_et_sauvegarder_camembert(comptage_eveil, 'Répartition des pointes par électrode durant l\'éveil', f'{yaml_filename_prefix}_repartition_eveil.png')
-creer_et_sauvegarder_camembert(comptage_sommeil, 'Répartition des pointes par électrode durant le sommeil', f'{yaml_filename_prefix}_repartition_sommeil.png')
-
-# --- BARRES : Comptage brut éveil/sommeil ---
-comptage_total = pd.DataFrame({'EVEIL': comptage_eveil, 'SOMMEIL': comptage_sommeil}).fillna(0)
-comptage_total.plot(kind='bar', figsize=(12, 8), color=['blue', 'orange'])
-plt.xlabel('Électrode')
-plt.ylabel('Comptage des événements')
-plt.title('Comptage des événements par électrode et par état')
-plt.legend(title='État')
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, f'{yaml_filename_prefix}_ratios_par_electrode_et_periode.png'))
-plt.show()
-
-# --- NORMALISATION ---
-durees = config['durees']
-duree_eveil = durees['eveil']
-duree_sommeil = durees['sommeil']
-
-comptage_eveil_normalise = comptage_eveil / duree_eveil
-comptage_sommeil_normalise = comptage_sommeil / duree_sommeil
-
-ratios_normalises = comptage_eveil_normalise / comptage_sommeil_normalise
-
-# --- BARRES : Ratios normalisés ---
-ratios_normalises.plot(kind='bar', title='Ratios normalisés des événements (éveil/sommeil) par électrode')
-plt.ylabel('Ratio normalisé')
-plt.xlabel('Électrode')
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, f'{yaml_filename_prefix}_ratios_normalises.png'))
-plt.show()
-
-# --- BARRES : Fréquence normalisée par électrode ---
-df_comptage = pd.DataFrame({
-    'Éveil': comptage_eveil_normalise,
-    'Sommeil': comptage_sommeil_normalise
-}).fillna(0)
-
-df_comptage.plot(kind='bar', figsize=(12, 6), color=['blue', 'orange'])
-plt.title('Fréquence normalisée des événements par électrode (Éveil vs Sommeil)')
-plt.ylabel('Fréquence normalisée')
-plt.xlabel('Électrode')
-plt.xticks(rotation=45)
-plt.legend(title='Période')
-plt.tight_layout()
-plt.savefig(os.path.join(save_folder, f'{yaml_filename_prefix}_frequence_normalisee_par_electrode.png'))
-plt.show()
+# Fichier de configuration par défaut (peut être passé en argument de la ligne de commande)
+CONFIG_PATH = 'C:/Users/boyer/github/ECOFEC/data/config/d3bd_f29d_event_analysis.yaml'
+
+# Figures produites, préfixées par les 9 premiers caractères du nom du fichier YAML
+FIGURE_NAMES = [
+    'repartition_eveil.png',
+    'repartition_sommeil.png',
+    'ratios_par_electrode_et_periode.png',
+    'ratios_normalises.png',
+    'frequence_normalisee_par_electrode.png',
+]
+
+# Figures affichées en mode interactif (les camemberts sont seulement sauvegardés)
+FIGURES_AFFICHEES = FIGURE_NAMES[2:]
+
+
+def figure_paths(save_folder, prefix):
+    """Chemins des figures produites par analyser_evenements."""
+    return [os.path.join(save_folder, f'{prefix}_{name}') for name in FIGURE_NAMES]
+
+
+@profiled()
+def compter_evenements(config):
+    """
+    Comptage des IEDs par électrode et par état : données de chaque figure.
+
+    :param config: dictionnaire de configuration (input_csv, drop_columns, periodes, durees)
+    :return: {nom de figure: Series ou DataFrame tracé dans cette figure}
+    """
+    csv_file = config['input_csv']  # corriger 'csv_file' → 'input_csv'
+
+    # Lire les événements depuis le stock Parquet du CSV (colonnes utiles seulement) : temps en
+    # secondes et état précalculé (bornes incluses, la première période listée l'emporte)
+    events = load_events(csv_file, columns=['time', 'electrode', 'state'],
+                         periodes=config['periodes'], drop_columns=config['drop_columns'])
+    df = pd.DataFrame({
+        'Tmu': events['time'],
+        'Electrode': events['electrode'].astype(str),
+        'Etat': events['state'].astype(object).str.upper().fillna('REJETE'),
+    })
+
+    # Comptage des événements par état
+    comptage_eveil = df[df['Etat'] == 'EVEIL']['Electrode'].value_counts()
+    comptage_sommeil = df[df['Etat'] == 'SOMMEIL']['Electrode'].value_counts()
+
+    # --- NORMALISATION ---
+    durees = config['durees']
+    duree_eveil = durees['eveil']
+    duree_sommeil = durees['sommeil']
+
+    comptage_eveil_normalise = comptage_eveil / duree_eveil
+    comptage_sommeil_normalise = comptage_sommeil / duree_sommeil
+
+    ratios_normalises = comptage_eveil_normalise / comptage_sommeil_normalise
+
+    return {
+        'repartition_eveil.png': comptage_eveil,
+        'repartition_sommeil.png': comptage_sommeil,
+        'ratios_par_electrode_et_periode.png':
+            pd.DataFrame({'EVEIL': comptage_eveil, 'SOMMEIL': comptage_sommeil}).fillna(0),
+        'ratios_normalises.png': ratios_normalises,
+        'frequence_normalisee_par_electrode.png': pd.DataFrame({
+            'Éveil': comptage_eveil_normalise,
+            'Sommeil': comptage_sommeil_normalise
+        }).fillna(0),
+    }
+
+
+def tracer_figure(nom_fichier, data):
+    """Trace une figure (sans la sauvegarder) à partir de ses données."""
+    # --- CAMEMBERTS ---
+    if nom_fichier.startswith('repartition_'):
+        etat = 'l\'éveil' if nom_fichier == 'repartition_eveil.png' else 'le sommeil'
+        plt.figure(figsize=(8, 8))
+        plt.pie(data, labels=data.index, autopct='%1.1f%%', startangle=140)
+        plt.title(f'Répartition des pointes par électrode durant {etat}')
+        plt.axis('equal')
+
+    # --- BARRES : Comptage brut éveil/sommeil ---
+    elif nom_fichier == 'ratios_par_electrode_et_periode.png':
+        data.plot(kind='bar', figsize=(12, 8), color=['blue', 'orange'])
+        plt.xlabel('Électrode')
+        plt.ylabel('Comptage des événements')
+        plt.title('Comptage des événements par électrode et par état')
+        plt.legend(title='État')
+        plt.xticks(rotation=45)
+        plt.tight_layout()
+
+    # --- BARRES : Ratios normalisés ---
+    elif nom_fichier == 'ratios_normalises.png':
+        data.plot(kind='bar', title='Ratios normalisés des événements (éveil/sommeil) par électrode')
+        plt.ylabel('Ratio normalisé')
+        plt.xlabel('Électrode')
+        plt.tight_layout()
+
+    # --- BARRES : Fréquence normalisée par électrode ---
+    elif nom_fichier == 'frequence_normalisee_par_electrode.png':
+        data.plot(kind='bar', figsize=(12, 6), color=['blue', 'orange'])
+        plt.title('Fréquence normalisée des événements par électrode (Éveil vs Sommeil)')
+        plt.ylabel('Fréquence normalisée')
+        plt.xlabel('Électrode')
+        plt.xticks(rotation=45)
+        plt.legend(title='Période')
+        plt.tight_layout()
+
+    else:
+        raise ValueError(f"Figure inconnue : {nom_fichier}")
+
+
+def rendre_figure(nom_fichier, data, figure_path):
+    """Trace et sauvegarde une figure avec le backend non interactif Agg (processus de rendu)."""
+    with stage('ied_event_analysis.render_figure', file=figure_path):
+        plt.switch_backend('Agg')
+        tracer_figure(nom_fichier, data)
+        plt.savefig(figure_path)
+        plt.close('all')
+
+
+def data_hash(data):
+    """Hash du contenu d'une Series / d'un DataFrame (index, colonnes et valeurs)."""
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    names = data.columns if isinstance(data, pd.DataFrame) else [data.name]
+    digest.update(repr(list(names)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def generer_rapport(analyses, n_jobs=1, overwrite=False):
+    """
+    Mode rapport (non interactif) : figures de plusieurs analyses rendues par un groupe de
+    processus avec le backend Agg. Une figure n'est retracée que si ses données (hash du
+    contenu) ou ce script ont changé, ou si le fichier a disparu (manifeste .ecofec_cache.json
+    dans chaque dossier de sortie). Les figures de tous les dossiers sont rendues par un seul
+    groupe de processus.
+
+    :param analyses: liste de (config, préfixe des noms de figures)
+    :param n_jobs: nombre de processus de rendu
+    :param overwrite: retracer toutes les figures
+    :return: liste de (nom, statut, message) (voir pipeline.run_tasks)
+    """
+    version = code_version(sys.modules[__name__])
+    tasks = []
+    for config, prefix in analyses:
+        save_folder = config['save_folder']
+        os.makedirs(save_folder, exist_ok=True)
+        donnees = compter_evenements(config)
+        for nom_fichier, figure_path in zip(FIGURE_NAMES, figure_paths(save_folder, prefix)):
+            data = donnees[nom_fichier]
+            tasks.append(Task(
+                f'{prefix}/{nom_fichier}', rendre_figure, [], [figure_path],
+                params={'data': data_hash(data)}, version=version,
+                args=(nom_fichier, data, figure_path)))
+
+    # Un seul graphe (et un seul groupe de processus) pour tous les dossiers de sortie
+    cache = FolderCaches()
+    results = run_tasks(tasks, cache, n_jobs=n_jobs, overwrite=overwrite)
+    cache.save()
+    return results
+
+
+def analyser_evenements(config, yaml_filename_prefix, show=True, n_jobs=1):
+    """
+    Comptage des IEDs par électrode et par état, et figures associées.
+
+    :param config: dictionnaire de configuration (input_csv, save_folder, drop_columns, periodes, durees)
+    :param yaml_filename_prefix: préfixe des noms de figures
+    :param show: afficher les figures ; False : mode rapport (voir generer_rapport)
+    :param n_jobs: nombre de processus de rendu en mode rapport
+    :return: liste des chemins des figures sauvegardées
+    """
+    if not show:
+        results = generer_rapport([(config, yaml_filename_prefix)], n_jobs=n_jobs)
+        failed = [name for name, status, _ in results if status == 'error']
+        if failed:
+            raise RuntimeError(f"Échec du rendu des figures : {', '.join(failed)}")
+        return figure_paths(config['save_folder'], yaml_filename_prefix)
+
+    save_folder = config['save_folder']
+    os.makedirs(save_folder, exist_ok=True)
+    donnees = compter_evenements(config)
+    for nom_fichier, figure_path in zip(FIGURE_NAMES, figure_paths(save_folder, yaml_filename_prefix)):
+        tracer_figure(nom_fichier, donnees[nom_fichier])
+        plt.savefig(figure_path)
+        if nom_fichier in FIGURES_AFFICHEES:
+            plt.show()
+        plt.close()
+
+    return figure_paths(save_folder, yaml_filename_prefix)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Répartition des IEDs par électrode et par état")
+    parser.add_argument("configs", nargs="*", default=[CONFIG_PATH],
+                        help="Fichier(s) de configuration YAML (un par patient)")
+    parser.add_argument("--report", action="store_true",
+                        help="Mode rapport : rendu sans affichage (Agg), en parallèle, figures à jour ignorées")
+    parser.add_argument("--jobs", type=int, default=1, help="Nombre de processus de rendu (mode rapport)")
+    parser.add_argument("--overwrite", action="store_true", help="Retracer toutes les figures (mode rapport)")
+    args = parser.parse_args()
+
+    analyses = []
+    for config_path in args.configs:
+        # Charger le fichier de configuration YAML
+        with open(config_path, 'r') as f:
+            config = yaml.safe_load(f)
+        yaml_filename_prefix = os.path.splitext(os.path.basename(config_path))[0][:9]
+        analyses.append((config, yaml_filename_prefix))
+
+    if args.report:
+        results = generer_rapport(analyses, n_jobs=args.jobs, overwrite=args.overwrite)
+        print_summary(results)
+        if any(status == "error" for _, status, _ in results):
+            sys.exit(1)
+    else:
+        for config, yaml_filename_prefix in analyses:
+            analyser_evenements(config, yaml_filename_prefix)
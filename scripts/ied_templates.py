@@ -0,0 +1,189 @@
+"""
+ied_templates.py
+
+Ce script calcule le template (forme d'onde moyenne) des IEDs de chaque électrode et de chaque état (Eveil, Sommeil...)
+à partir d'un EDF nettoyé : moyenne, écart-type et intervalle de confiance de la moyenne, échantillon par échantillon,
+sur des fenêtres alignées sur le pic trouvé par ieds_morphology.py (maximum de |signal| dans [-25 ms, +20 ms]).
+
+Les événements sont lus :
+- dans un CSV d'événements (colonnes 'Tmu' en µs et 'Electrode', stock Parquet de preprocessing/events.py),
+- ou dans un fichier .mat ('onsets' en secondes, 'descriptions' = électrodes), par exemple les événements validés
+  enregistrés par select_validate_ieds.py, pour comparer leurs templates à ceux de tous les événements.
+
+Les fenêtres sont prises dans le tableau d'epochs de l'EDF (preprocessing/epochs.py, partagé avec ieds_morphology.py
+pour un même CSV), lues par lots et accumulées en une passe (moyenne et variance courantes, voir
+preprocessing/templates.py) : la mémoire ne dépend pas du nombre d'événements. Les électrodes et états sont
+calculés en parallèle avec --jobs.
+
+Le résultat est une table CSV, une ligne par électrode, canal, état et échantillon (en µV) :
+Patient, Electrode, Channel, State, Time_s, Mean, SD, CI_Low, CI_High, N_Events
+
+---------------------
+🔧 Utilisation (en ligne de commande) :
+python -m scripts.ied_templates chemin/fichier_clean.edf chemin/evenements.csv chemin/templates.csv [OPTIONS]
+
+📌 Options disponibles :
+--config          Fichier YAML contenant les périodes par état ('periodes') et, optionnellement, 'electrode_map'
+--half_width_sec  Demi-largeur du template autour du pic (s) [défaut: 0.2]
+--confidence      Niveau de l'intervalle de confiance de la moyenne [défaut: 0.95]
+--jobs            Nombre de processus
+--figures         Dossier où sauvegarder une figure par électrode (moyenne et intervalle de confiance par état)
+--dtype           Type du tableau d'epochs : float64 (défaut) ou float32
+
+💡 Exemple :
+python -m scripts.ied_templates data/cleaned/d3bd_f29d_clean.edf d3bd_f29d_evenements_valides_Eveil.mat data/templates/d3bd_f29d_valides.csv --config data/config/d3bd_f29d_event_analysis.yaml --figures data/templates/figures
+---------------------
+
+Sans 'electrode_map', les canaux d'une électrode sont les noms séparés par '-' ou '/' de son étiquette
+('F8-T4' -> F8 et T4) présents dans l'EDF.
+"""
+
+import argparse
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import scipy.io as sio
+import yaml
+
+from preprocessing import templates
+from preprocessing.epochs import get_epochs, load_epochs
+from preprocessing.events import load_events
+from preprocessing.signal_io import SIGNAL_DTYPES
+from preprocessing.instrumentation import profiled, stage
+from preprocessing.periods import label_periods
+from preprocessing.scoring import electrode_channels
+
+# État attribué à tous les événements lorsque aucune période n'est donnée
+ALL_STATE = 'Tout'
+
+
+def load_template_events(events_path, periodes=None):
+    """
+    Temps (s), électrodes et états de tous les événements d'un CSV (stock Parquet) ou d'un .mat
+    ('onsets', 'descriptions'), dans l'ordre du fichier (ligne i = epoch i). L'état des événements
+    hors de toute période est manquant.
+
+    :return: (event_times, electrodes, states), tableaux numpy
+    """
+    if events_path.lower().endswith('.mat'):
+        mat = sio.loadmat(events_path)
+        event_times = np.atleast_1d(mat['onsets'].squeeze()).astype(float)
+        electrodes = np.array([str(np.squeeze(d)) for d in mat['descriptions'].ravel()], dtype=object)
+    else:
+        events = load_events(events_path, columns=['time', 'electrode'])
+        event_times = events['time'].to_numpy()
+        electrodes = events['electrode'].astype(str).to_numpy(dtype=object)
+
+    if not periodes:
+        return event_times, electrodes, np.full(len(event_times), ALL_STATE, dtype=object)
+    return event_times, electrodes, label_periods(event_times, periodes)
+
+
+def template_groups(electrodes, states, ch_names, electrode_map=None):
+    """
+    Groupes {(électrode, état): (canaux, indices des événements)} ; les électrodes sans canal dans
+    l'EDF et les événements sans état sont ignorés.
+    """
+    labelled = pd.notna(states)
+    groups = {}
+    for electrode in dict.fromkeys(electrodes[labelled]):
+        if electrode_map is not None and electrode in electrode_map:
+            chans = electrode_map[electrode]
+            chans = chans if isinstance(chans, list) else [chans]
+        else:
+            chans = electrode_channels(electrode, ch_names)
+        if not chans:
+            print(f"⚠️ Électrode {electrode} : aucun canal correspondant dans l'EDF, ignorée.")
+            continue
+        in_electrode = labelled & (electrodes == electrode)
+        for state in dict.fromkeys(states[in_electrode]):
+            groups[(electrode, state)] = (chans, np.flatnonzero(in_electrode & (states == state)))
+    return groups
+
+
+def plot_templates(table, figures_dir):
+    """Une figure par électrode : moyenne et intervalle de confiance par état, un panneau par canal."""
+    os.makedirs(figures_dir, exist_ok=True)
+    plt.switch_backend('Agg')
+    paths = []
+    for electrode, df_electrode in table.groupby('Electrode', sort=False):
+        channels = list(dict.fromkeys(df_electrode['Channel']))
+        fig, axes = plt.subplots(len(channels), 1, figsize=(8, 3 * len(channels)), squeeze=False, sharex=True)
+        for ax, channel in zip(axes[:, 0], channels):
+            for state, df in df_electrode[df_electrode['Channel'] == channel].groupby('State', sort=False):
+                line, = ax.plot(df['Time_s'] * 1000, df['Mean'], label=f"{state} (n = {df['N_Events'].iloc[0]})")
+                ax.fill_between(df['Time_s'] * 1000, df['CI_Low'], df['CI_High'], color=line.get_color(), alpha=0.25)
+            ax.axvline(0, color='gray', linestyle='--', linewidth=0.5)
+            ax.set_title(f'Électrode {electrode}, canal {channel}')
+            ax.set_ylabel('Amplitude (µV)')
+            ax.legend(loc='upper right')
+        axes[-1, 0].set_xlabel('Temps par rapport au pic (ms)')
+        fig.tight_layout()
+        path = os.path.join(figures_dir, f"template_{str(electrode).replace('/', '_')}.png")
+        fig.savefig(path)
+        plt.close(fig)
+        paths.append(path)
+    return paths
+
+
+@profiled(file_arg='edf_path')
+def templates_from_files(edf_path, events_path, output_path, periodes=None, electrode_map=None, patient=None,
+                         half_width_sec=templates.HALF_WIDTH_SEC, confidence=0.95, n_jobs=1, figures_dir=None,
+                         dtype=np.float64):
+    """
+    Templates des IEDs par électrode et par état, sauvegardés en CSV.
+    Les fenêtres viennent du tableau d'epochs de l'EDF pour ces événements (epochs.get_epochs).
+
+    :return: DataFrame (une ligne par électrode, canal, état et échantillon)
+    """
+    with stage('ied_templates.load_events', file=events_path):
+        event_times, electrodes, states = load_template_events(events_path, periodes)
+    with stage('ied_templates.epochs', file=edf_path):
+        epochs_path = get_epochs(edf_path, event_times, dtype=dtype)
+    _, meta = load_epochs(epochs_path)
+    groups = template_groups(electrodes, states, meta['channels'], electrode_map)
+
+    with stage('ied_templates.compute', file=edf_path):
+        results = templates.compute_templates(epochs_path, groups, half_width_sec=half_width_sec, n_jobs=n_jobs)
+    for (electrode, state), (_, running, n_skipped) in results.items():
+        message = f"{electrode} / {state} : {running.count} événement(s)"
+        if n_skipped:
+            message += f", {n_skipped} en bord d'enregistrement ignoré(s)"
+        print(message)
+
+    table = templates.template_table(results, meta['sfreq'], confidence)
+    table.insert(0, 'Patient', patient or os.path.splitext(os.path.basename(edf_path))[0])
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    table.to_csv(output_path, index=False)
+    print(f"Templates sauvegardés dans : {output_path}")
+
+    if figures_dir is not None:
+        with stage('ied_templates.plot', file=figures_dir):
+            plot_templates(table, figures_dir)
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Templates des IEDs (moyenne, écart-type, IC) par électrode et état")
+    parser.add_argument("edf_path", help="Chemin vers le fichier .edf nettoyé")
+    parser.add_argument("events_path", help="CSV d'événements ('Tmu' en µs, 'Electrode') ou .mat ('onsets', 'descriptions')")
+    parser.add_argument("output_path", help="Fichier .csv de sortie")
+    parser.add_argument("--config", help="Fichier YAML contenant 'periodes' (états) et éventuellement 'electrode_map'")
+    parser.add_argument("--half_width_sec", type=float, default=templates.HALF_WIDTH_SEC,
+                        help="Demi-largeur du template autour du pic (s)")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Niveau de l'intervalle de confiance")
+    parser.add_argument("--jobs", type=int, default=1, help="Nombre de processus")
+    parser.add_argument("--figures", default=None, help="Dossier des figures (une par électrode)")
+    parser.add_argument("--dtype", choices=SIGNAL_DTYPES, default="float64", help="Type des epochs (float64 ou float32)")
+    args = parser.parse_args()
+
+    config = {}
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = yaml.safe_load(f) or {}
+
+    templates_from_files(args.edf_path, args.events_path, args.output_path, periodes=config.get('periodes'),
+                         electrode_map=config.get('electrode_map'), half_width_sec=args.half_width_sec,
+                         confidence=args.confidence, n_jobs=args.jobs, figures_dir=args.figures, dtype=args.dtype)
@@ -1,23 +1,29 @@
+import os
+import sys
 import numpy as np
 import pandas as pd
-import mne
 import matplotlib.pyplot as plt
-from scipy.signal import butter, lfilter
 
-# Charger le fichier CSV contenant les temps et les électrodes
-df_csv = pd.read_csv('C:/Users/boyer/github/ECOFEC/data/raw/csv_file/7dcf931_19ICA_FINAL.csv')
-# Convertir les Tmu en secondes
-df_csv['Tmu'] = df_csv['Tmu'] / 1e6
+from preprocessing.cache import ResultCache, MANIFEST_NAME, code_version
+from preprocessing.epochs import get_epochs, load_epochs
+from preprocessing.events import load_events
+from preprocessing.instrumentation import profiled, stage
+from preprocessing.morphology import compute_morphology_batch, peak_search_bounds
+
+# Fichier CSV contenant les temps et les électrodes
+csv_path = 'C:/Users/boyer/github/ECOFEC/data/raw/csv_file/7dcf931_19ICA_FINAL.csv'
 
 # Définir le chemin du fichier EDF
 edf_path = 'C:/Users/boyer/github/ECOFEC/data/cleaned/7dcf931af56bfa58ad45079194a0235b_clean.edf'
 
-# Charger les données EDF avec MNE
-raw = mne.io.read_raw_edf(edf_path, preload=True, verbose=False)
-fs = int(raw.info['sfreq'])  # fréquence d'échantillonnage récupérée automatiquement
+# Fichier de résultats
+results_path = 'C:/Users/boyer/github/ECOFEC/Results/ied_morphology_results.csv'
+
+# Type des epochs et des calculs : 'float64' ou 'float32'
+dtype = 'float64'
 
 # Dictionnaire des canaux EDF pour chaque électrode (indices MNE, 0-based)
-# Ici tu dois adapter selon les noms dans raw.ch_names
+# Ici tu dois adapter selon les noms de canaux du fichier EDF
 Electrode_map = {
     'C4': 'C4',
     'F8': 'F8',
@@ -27,105 +33,152 @@ Electrode_map = {
     'F7/F3': ['F7', 'F3']
 }
 
-def low_pass_filter_derivative(data, sfreq, cutoff=80, order=2):
-    nyquist = 0.5 * sfreq
-    norm_cutoff = cutoff / nyquist
-    b, a = butter(order, norm_cutoff, btype='low', analog=False)
-    return lfilter(b, a, data)
-
-def compute_slopes(window, peak_index, fs):
-    derivative = np.diff(window) / (1/fs)
-    derivative_smoothed = low_pass_filter_derivative(derivative, fs)
-    max_negative_slope_idx = np.argmin(derivative_smoothed[max(0, peak_index - 15):peak_index + 1]) + max(0, peak_index - 15)
-    negative_slope = derivative_smoothed[max_negative_slope_idx]
-    max_positive_slope_idx = np.argmax(derivative_smoothed[peak_index:min(len(derivative_smoothed), peak_index + 20)]) + peak_index
-    positive_slope = derivative_smoothed[max_positive_slope_idx]
-    return negative_slope, positive_slope, derivative_smoothed, max_negative_slope_idx, max_positive_slope_idx
-
-results = []
-
-# Parcourir chaque électrode et chaque temps
-for electrode in df_csv['Electrode'].unique():
-    df_electrode = df_csv[df_csv['Electrode'] == electrode]
-    chans = Electrode_map[electrode]
-    if not isinstance(chans, list):
-        chans = [chans]
-
-    for tmu in df_electrode['Tmu']:
-        center_idx = int(tmu * fs)
-        start_idx = center_idx - int(0.2 * fs)
-        end_idx = center_idx + int(0.2 * fs)
+MORPHOLOGY_COLUMNS = ['Tmu', 'Electrode', 'Channel', 'Amplitude', 'Half_Width', 'Crossing_Left', 'Crossing_Right', 'Negative_Slope', 'Positive_Slope']
+
+def plot_morphology(window, features, i, title):
+    """Plot optionnel d'une fenêtre et de ses points caractéristiques (features : sortie de compute_morphology_batch)."""
+    half_amplitude = features['half_amplitude'][i]
+    derivative_smoothed = features['derivative_smoothed'][i]
+    max_negative_slope_idx = features['negative_slope_index'][i]
+    max_positive_slope_idx = features['positive_slope_index'][i]
+
+    plt.figure()
+    plt.subplot(2, 1, 1)
+    plt.plot(window, label='Signal')
+    plt.axhline(y=half_amplitude, color='orange', linestyle='--', label='Half Amplitude')
+    plt.axvline(x=features['peak_index'][i], color='g', linestyle='--', label='Peak')
+    plt.axvline(x=features['crossing_left'][i], color='purple', linestyle='--', label='Crossing Left')
+    plt.axvline(x=features['crossing_right'][i], color='purple', linestyle='--', label='Crossing Right')
+    plt.scatter(features['half_width_left'][i], half_amplitude, color='blue', label='Left Half Width Point')
+    plt.scatter(features['half_width_right'][i], half_amplitude, color='red', label='Right Half Width Point')
+    plt.gca().invert_yaxis()
+    plt.title(title)
+    plt.xlabel('Index')
+    plt.ylabel('Amplitude')
+    plt.legend()
+
+    plt.subplot(2, 1, 2)
+    plt.plot(np.arange(len(derivative_smoothed)), derivative_smoothed, label='Dérivée filtrée', color='red')
+    plt.gca().invert_yaxis()
+    plt.axhline(y=0, color='gray', linestyle='--', linewidth=0.5)
+    plt.scatter(max_positive_slope_idx, derivative_smoothed[max_positive_slope_idx], color='blue', label='Max Positive Slope')
+    plt.scatter(max_negative_slope_idx, derivative_smoothed[max_negative_slope_idx], color='green', label='Max Negative Slope')
+    plt.title(f'Dérivée de l\'IED {title}')
+    plt.xlabel('Index')
+    plt.ylabel('Dérivée (µV/s)')
+    plt.legend(loc='upper left')
+    plt.show()
+
+def compute_morphology(epochs, meta, df_csv, plot=False, electrode_map=None):
+    """
+    Calcule les caractéristiques morphologiques (amplitude, demi-largeur, passages, pentes)
+    de chaque IED du CSV (colonne 'Tmu' en secondes) sur les canaux associés à son électrode.
+    Les fenêtres de ±0.2 s sont prises dans le tableau d'epochs (ligne i = événement i du CSV)
+    et traitées par lots (un lot par électrode et par canal) avec compute_morphology_batch.
+    `electrode_map` associe chaque électrode du CSV à un ou plusieurs canaux (Electrode_map par défaut).
+    """
+    if electrode_map is None:
+        electrode_map = Electrode_map
+    fs = int(meta['sfreq'])  # fréquence d'échantillonnage récupérée automatiquement
+    half_window = int(0.2 * fs)
+    channel_index = {ch: i for i, ch in enumerate(meta['channels'])}
+    # Début de la fenêtre de ±0.2 s à l'intérieur de l'epoch
+    offset = meta['n_before'] - half_window
+    tmus = df_csv['Tmu'].to_numpy()
+    electrodes = df_csv['Electrode'].to_numpy()
+    frames = []
+
+    # Parcourir chaque électrode : tous ses événements sont traités en un lot par canal
+    for electrode in df_csv['Electrode'].unique():
+        chans = electrode_map[electrode]
+        if not isinstance(chans, list):
+            chans = [chans]
+
+        event_idx = np.flatnonzero(electrodes == electrode)
+        center_idx = (tmus[event_idx] * fs).astype(int)
+        start_idx = center_idx - half_window
+        end_idx = center_idx + half_window
 
         # Vérifier validité de la fenêtre
-        if start_idx < 0 or end_idx > len(raw.times):
-            continue
-
-        for ch_name in chans:
-            window = raw.get_data(picks=ch_name)[:, start_idx:end_idx].flatten()
-
-            restricted_start_idx = int(center_idx - 0.025 * fs)
-            restricted_end_idx = int(center_idx + 0.02 * fs)
-            restricted_window = window[restricted_start_idx - start_idx : restricted_end_idx - start_idx]
-
-            peak_value = np.max(np.abs(restricted_window))
-            peak_index = np.argmax(np.abs(restricted_window)) + (restricted_start_idx - start_idx)
-
-            crossing_left_candidates = np.where(np.diff(np.sign(np.diff(window[:peak_index]))))[0]
-            crossing_left_candidates = [idx for idx in crossing_left_candidates if idx <= (peak_index - 7)]
-            crossing_left = crossing_left_candidates[-1] if len(crossing_left_candidates) > 0 else 0
-
-            crossing_right_candidates = np.where(np.diff(np.sign(np.diff(window[peak_index:]))))[0]
-            crossing_right_candidates = [idx for idx in crossing_right_candidates if idx >= 5]
-            crossing_right = crossing_right_candidates[0] + peak_index + 1 if len(crossing_right_candidates) > 0 else len(window) - 1
-
-            amplitude = peak_value - window[crossing_left]
-
-            half_amplitude = -amplitude / 2
-
-            left_idx = np.where(window[:peak_index] >= half_amplitude)[0]
-            right_idx = np.where(window[peak_index:] >= half_amplitude)[0]
-
-            if len(left_idx) > 0 and len(right_idx) > 0:
-                left_half_width_point = left_idx[-1]
-                right_half_width_point = peak_index + right_idx[0]
-                half_width = right_half_width_point - left_half_width_point
-            else:
-                half_width = np.nan
-
-            negative_slope, positive_slope, derivative_smoothed, max_negative_slope_idx, max_positive_slope_idx = compute_slopes(window, peak_index, fs)
-
-            results.append([tmu, electrode, ch_name, amplitude, half_width, crossing_left, crossing_right, negative_slope, positive_slope])
-
-            # Plot optionnel (tu peux commenter pour gagner du temps)
-            #plt.figure()
-            #plt.subplot(2, 1, 1)
-            #plt.plot(window, label='Signal')
-            #plt.axhline(y=half_amplitude, color='orange', linestyle='--', label='Half Amplitude')
-            #plt.axvline(x=peak_index, color='g', linestyle='--', label='Peak')
-            #plt.axvline(x=crossing_left, color='purple', linestyle='--', label='Crossing Left')
-            #plt.axvline(x=crossing_right, color='purple', linestyle='--', label='Crossing Right')
-            #plt.scatter(left_half_width_point, half_amplitude, color='blue', label='Left Half Width Point')
-            #plt.scatter(right_half_width_point, half_amplitude, color='red', label='Right Half Width Point')
-            #plt.gca().invert_yaxis()
-            #plt.title(f'Electrode: {electrode}, Channel: {ch_name}, Tmu: {tmu}')
-            #plt.xlabel('Index')
-            #plt.ylabel('Amplitude')
-            #plt.legend()
-
-            #plt.subplot(2, 1, 2)
-            #plt.plot(np.arange(len(derivative_smoothed)), derivative_smoothed, label='Dérivée filtrée', color='red')
-            #plt.gca().invert_yaxis()
-            #plt.axhline(y=0, color='gray', linestyle='--', linewidth=0.5)
-            #plt.scatter(max_positive_slope_idx, derivative_smoothed[max_positive_slope_idx], color='blue', label='Max Positive Slope')
-            #plt.scatter(max_negative_slope_idx, derivative_smoothed[max_negative_slope_idx], color='green', label='Max Negative Slope')
-            #plt.title(f'Dérivée de l\'IED {electrode} {ch_name}')
-            #plt.xlabel('Index')
-            #plt.ylabel('Dérivée (µV/s)')
-            #plt.legend(loc='upper left')
-            #plt.show()
-
-# Convertir en DataFrame et sauvegarder
-df_results = pd.DataFrame(results, columns=['Tmu', 'Electrode', 'Channel', 'Amplitude', 'Half_Width', 'Crossing_Left', 'Crossing_Right', 'Negative_Slope', 'Positive_Slope'])
-df_results.to_csv('C:/Users/boyer/github/ECOFEC/Results/ied_morphology_results.csv', index=False)
-
-print(df_results.head())
+        keep = (start_idx >= 0) & (end_idx <= meta['n_times'])
+        event_idx, center_idx, start_idx = event_idx[keep], center_idx[keep], start_idx[keep]
+
+        # Zone de recherche du pic : [-25 ms, +20 ms] autour de l'événement
+        restricted_start, restricted_end = peak_search_bounds(center_idx, start_idx, fs)
+
+        for k, ch_name in enumerate(chans):
+            windows = np.asarray(epochs[event_idx, channel_index[ch_name], offset:offset + 2 * half_window])
+            features = compute_morphology_batch(windows, fs, restricted_start, restricted_end)
+
+            frame = pd.DataFrame({
+                'Tmu': tmus[event_idx],
+                'Electrode': electrode,
+                'Channel': ch_name,
+                'Amplitude': features['amplitude'],
+                'Half_Width': features['half_width'],
+                'Crossing_Left': features['crossing_left'],
+                'Crossing_Right': features['crossing_right'],
+                'Negative_Slope': features['negative_slope'],
+                'Positive_Slope': features['positive_slope'],
+            })
+            # Ordre des lignes : événement par événement, puis canal par canal
+            frame['_order'] = np.arange(len(event_idx)) * len(chans) + k
+            frames.append(frame)
+
+            # Plot optionnel (désactivé par défaut pour gagner du temps)
+            if plot:
+                for i in range(len(windows)):
+                    plot_morphology(windows[i], features, i, f'Electrode: {electrode}, Channel: {ch_name}, Tmu: {tmus[event_idx[i]]}')
+
+        if frames and len(chans) > 1:
+            n_chans = len(chans)
+            frames[-n_chans:] = [pd.concat(frames[-n_chans:]).sort_values('_order', kind='stable')]
+
+    # Convertir en DataFrame
+    if not frames:
+        return pd.DataFrame(columns=MORPHOLOGY_COLUMNS)
+    df_results = pd.concat(frames, ignore_index=True)[MORPHOLOGY_COLUMNS]
+    # Demi-largeur en nombre d'échantillons : entière si elle a été trouvée pour tous les événements
+    if df_results['Half_Width'].notna().all():
+        df_results['Half_Width'] = df_results['Half_Width'].astype(int)
+    return df_results
+
+@profiled(file_arg='csv_path')
+def morphology_from_files(csv_path, edf_path, results_path, electrode_map=None, dtype=np.float64):
+    """
+    Calcule la morphologie des IEDs d'un CSV d'événements (Tmu en µs) sur un EDF nettoyé
+    et écrit le CSV de résultats. Renvoie le DataFrame des résultats.
+    `dtype` : type des epochs et des calculs (float64, ou float32 pour diviser la mémoire par deux).
+    """
+    # Temps (s) et électrodes lus dans le stock Parquet du CSV (ligne i = événement i du CSV)
+    with stage('ieds_morphology.load_events', file=csv_path):
+        events = load_events(csv_path, columns=['time', 'electrode'])
+    df_csv = pd.DataFrame({'Tmu': events['time'], 'Electrode': events['electrode']})
+
+    # Fenêtres péri-événementielles extraites une fois et stockées à côté de l'EDF
+    with stage('ieds_morphology.epochs', file=edf_path):
+        epochs, meta = load_epochs(get_epochs(edf_path, df_csv['Tmu'], dtype=dtype))
+
+    with stage('ieds_morphology.compute', file=csv_path):
+        df_results = compute_morphology(epochs, meta, df_csv, electrode_map=electrode_map)
+    os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+    with stage('ieds_morphology.write_csv', file=results_path):
+        df_results.to_csv(results_path, index=False)
+    return df_results
+
+
+if __name__ == "__main__":
+    # Ne recalculer que si le CSV, l'EDF, la correspondance électrodes/canaux, le type ou le code
+    # (ce script et les modules morphology, epochs et events) ont changé
+    cache = ResultCache(os.path.join(os.path.dirname(results_path), MANIFEST_NAME))
+    key = cache.make_key([csv_path, edf_path], {'Electrode_map': Electrode_map, 'dtype': dtype},
+                         code_version(sys.modules[__name__], compute_morphology_batch, get_epochs, load_events))
+
+    if cache.is_fresh(results_path, key):
+        print(f"Résultats déjà à jour : {results_path}")
+        df_results = pd.read_csv(results_path)
+    else:
+        df_results = morphology_from_files(csv_path, edf_path, results_path, dtype=dtype)
+        cache.record(results_path, key)
+
+    print(df_results.head())
@@ -1,10 +1,11 @@
-"""
+r"""
 Script de prétraitement des fichiers EEG au format EDF.
 
 Ce script permet de nettoyer et filtrer des fichiers EDF (électroencéphalogrammes) en appliquant :
 - une sélection optionnelle des canaux d'intérêt,
 - un filtrage passe-bande (avec coupures basses et hautes fréquences paramétrables),
-- un filtre en peigne (notch) pour supprimer le bruit à une fréquence spécifique (par défaut 50 Hz).
+- un filtre en peigne (notch) pour supprimer le bruit à une fréquence spécifique (par défaut 50 Hz),
+combinés en un seul filtre appliqué en une passe (FIR par défaut, ou IIR Butterworth en phase nulle avec --filter_method iir).
 
 Il peut traiter un fichier EDF unique ou un dossier contenant plusieurs fichiers EDF, 
 et sauvegarde les fichiers nettoyés dans un dossier de sortie spécifié.
@@ -13,16 +14,36 @@ Options disponibles :
 - Choix des canaux à conserver
 - Fréquences de filtrage ajustables
 - Possibilité de forcer l'écrasement des fichiers déjà traités
+- Cache des résultats : un fichier n'est retraité que si son contenu, les paramètres de filtrage
+  ou le code de prétraitement ont changé (manifeste .ecofec_cache.json dans le dossier de sortie)
 - Option pour afficher un tracé des signaux nettoyés
+- Traitement en flux par blocs (--block_sec), à mémoire bornée pour les enregistrements longs
+- Rééchantillonnage polyphase après le filtrage (--resample 256), pour réduire le nombre d'échantillons
+  des étapes suivantes (le passe-bas à h_freq sert de filtre anti-repliement ; fréquence cible > 2 * h_freq)
+- Format du fichier nettoyé (--format) : EDF 16 bits écrit par blocs (défaut), FIF (MNE), ou tableau float32
+  .npy projetable en mémoire avec un en-tête JSON, sans quantification et immédiat à ouvrir pour l'analyse
+  (les scripts suivants lisent les trois formats, voir preprocessing/signal_io.py)
+- Calculs en float32 (--dtype float32) : lecture, filtrage et rééchantillonnage avec deux fois moins de
+  mémoire qu'en float64, pour des données 16 bits sans perte de précision utile
+- Traitement parallèle de plusieurs fichiers (--jobs N), avec limitation des threads BLAS/FFT par worker
+- Mesure du temps, de la mémoire et des E/S de chaque sous-étape (--profile fichier.jsonl)
 
 Usage typique en ligne de commande :
 (venv) PS C:\Users\boyer\github\ECOFEC> python -m scripts.preprocess_edf data/raw/edf_file --output_dir data/cleaned --plot  
 
+Traitement parallèle d'une cohorte sur 16 processus :
+python -m scripts.preprocess_edf data/raw/edf_file --output_dir data/cleaned --jobs 16
+
 """
 
 import os
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from preprocessing import edf_cleaning, edf_io, filtering, instrumentation, signal_io
+from preprocessing.cache import ResultCache, MANIFEST_NAME, code_version
 from preprocessing.edf_cleaning import clean_and_save_edf
+from preprocessing.pipeline import THREAD_ENV_VARS
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Preprocess EDF EEG files")
@@ -32,12 +53,96 @@ def parse_args():
     parser.add_argument("--l_freq", type=float, default=1.5, help="Low frequency cutoff for filtering")
     parser.add_argument("--h_freq", type=float, default=80.0, help="High frequency cutoff for filtering")
     parser.add_argument("--notch_freq", type=float, default=50.0, help="Notch filter frequency")
-    parser.add_argument("--overwrite", action="store_true", help="Overwrite existing cleaned files")
+    parser.add_argument("--overwrite", action="store_true", help="Recompute all files, even if their cached output is up to date")
     parser.add_argument("--plot", action="store_true", help="Plot cleaned signals after preprocessing")
+    parser.add_argument("--block_sec", type=float, default=None,
+                        help="Stream the file in blocks of this many seconds (bounded memory) instead of loading it whole")
+    parser.add_argument("--filter_method", choices=filtering.FILTER_METHODS, default="fir",
+                        help="Combined notch + bandpass filter: 'fir' (MNE firwin design) or 'iir' (zero-phase Butterworth SOS)")
+    parser.add_argument("--resample", type=float, default=None,
+                        help="Resample the cleaned signal to this sampling rate (Hz) after filtering; must exceed 2 * h_freq")
+    parser.add_argument("--format", choices=signal_io.SIGNAL_FORMATS, default="edf",
+                        help="Cleaned file format: 'edf' (16-bit EDF), 'fif' (MNE) or 'npy' (float32 memmap + JSON header)")
+    parser.add_argument("--dtype", choices=signal_io.SIGNAL_DTYPES, default="float64",
+                        help="Computation dtype: 'float64' or 'float32' (half the memory, ample precision for 16-bit EEG)")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of files processed in parallel (process pool)")
+    parser.add_argument("--threads_per_job", type=int, default=1,
+                        help="BLAS/FFT threads allowed per worker when --jobs > 1")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="Append per-stage timing, memory and I/O measurements to this JSON lines file")
     return parser.parse_args()
 
+def process_file(edf_path, output_path, channels_of_interest, l_freq, h_freq, notch_freq, block_sec=None,
+                 resample_sfreq=None, filter_method="fir", dtype="float64"):
+    """
+    Nettoie un fichier EDF et renvoie un tuple (edf_path, statut, message).
+    Les exceptions sont capturées pour qu'un fichier en erreur n'interrompe pas le lot.
+    """
+    try:
+        clean_and_save_edf(
+            edf_path,
+            output_path,
+            channels_of_interest=channels_of_interest,
+            l_freq=l_freq,
+            h_freq=h_freq,
+            notch_freq=notch_freq,
+            block_sec=block_sec,
+            resample_sfreq=resample_sfreq,
+            filter_method=filter_method,
+            dtype=dtype
+        )
+        return edf_path, "ok", output_path
+    except Exception as e:
+        return edf_path, "error", str(e)
+
+def run_parallel(tasks, n_jobs, threads_per_job=1, on_result=None):
+    """
+    Exécute les tâches (arguments de process_file) dans un pool de processus.
+
+    Les workers sont démarrés en mode 'spawn' après avoir fixé les variables THREAD_ENV_VARS,
+    de sorte que numpy/scipy chargés dans chaque worker n'utilisent que `threads_per_job` threads.
+    `on_result` est appelé dans le processus principal avec chaque résultat, dès qu'il est disponible.
+    """
+    saved_env = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads_per_job)
+
+    results = []
+    try:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context) as executor:
+            futures = [executor.submit(process_file, *task) for task in tasks]
+            for future in as_completed(futures):
+                edf_path, status, message = future.result()
+                if status == "ok":
+                    print(f"Saved cleaned file to: {message}")
+                else:
+                    print(f"Error processing {edf_path}: {message}")
+                if on_result is not None:
+                    on_result(edf_path, status, message)
+                results.append((edf_path, status, message))
+    finally:
+        for var, value in saved_env.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+    return results
+
+def print_summary(results):
+    """Affiche le bilan du lot : fichiers traités, ignorés et en erreur."""
+    n_ok = sum(1 for _, status, _ in results if status == "ok")
+    n_skipped = sum(1 for _, status, _ in results if status == "skipped")
+    errors = [(path, message) for path, status, message in results if status == "error"]
+
+    print(f"Summary: {n_ok} processed, {n_skipped} skipped, {len(errors)} failed.")
+    for path, message in errors:
+        print(f"  - {path}: {message}")
+
 def main():
     args = parse_args()
+    if args.profile:
+        instrumentation.enable(args.profile)
 
     input_files = []
     if os.path.isdir(args.input_path):
@@ -50,27 +155,58 @@ def main():
 
     os.makedirs(args.output_dir, exist_ok=True)
 
+    # Clé de cache : contenu du fichier source + paramètres + version du code de prétraitement
+    cache = ResultCache(os.path.join(args.output_dir, MANIFEST_NAME))
+    version = code_version(edf_cleaning, edf_io, filtering, signal_io)
+    params = {
+        "channels": args.channels,
+        "l_freq": args.l_freq,
+        "h_freq": args.h_freq,
+        "notch_freq": args.notch_freq,
+        "streamed": args.block_sec is not None,
+        "resample": args.resample,
+        "filter_method": args.filter_method,
+        "dtype": args.dtype,
+    }
+
+    results = []
+    tasks = []
+    keys = {}
     for edf_path in input_files:
         file_name = os.path.splitext(os.path.basename(edf_path))[0]
-        output_path = os.path.join(args.output_dir, f"{file_name}_clean.edf")
+        output_path = os.path.join(args.output_dir, f"{file_name}_clean{signal_io.FORMAT_SUFFIXES[args.format]}")
 
-        if os.path.exists(output_path) and not args.overwrite:
-            print(f"File already exists: {output_path}. Use --overwrite to force overwrite.")
+        key = cache.make_key([edf_path], params, version)
+        if cache.is_fresh(output_path, key) and not args.overwrite:
+            print(f"Up to date: {output_path}. Use --overwrite to force recomputation.")
+            results.append((edf_path, "skipped", output_path))
             continue
 
-        print(f"Processing: {edf_path}")
-        try:
-            clean_and_save_edf(
-                edf_path,
-                output_path,
-                channels_of_interest=args.channels,
-                l_freq=args.l_freq,
-                h_freq=args.h_freq,
-                notch_freq=args.notch_freq
-            )
-            print(f"Saved cleaned file to: {output_path}\n")
-        except Exception as e:
-            print(f"Error processing {edf_path}: {e}")
+        keys[output_path] = key
+        tasks.append((edf_path, output_path, args.channels, args.l_freq, args.h_freq, args.notch_freq, args.block_sec,
+                      args.resample, args.filter_method, args.dtype))
+
+    # Les clés ne sont enregistrées qu'après succès : un fichier en erreur sera retraité
+    def record_result(edf_path, status, message):
+        if status == "ok":
+            cache.record(message, keys[message])
+
+    if args.jobs > 1 and len(tasks) > 1:
+        print(f"Processing {len(tasks)} files with {args.jobs} workers...")
+        results.extend(run_parallel(tasks, args.jobs, args.threads_per_job, on_result=record_result))
+    else:
+        for task in tasks:
+            print(f"Processing: {task[0]}")
+            edf_path, status, message = process_file(*task)
+            if status == "ok":
+                print(f"Saved cleaned file to: {message}\n")
+            else:
+                print(f"Error processing {edf_path}: {message}")
+            record_result(edf_path, status, message)
+            results.append((edf_path, status, message))
+
+    cache.save()
+    print_summary(results)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,118 @@
+"""
+resting_spectra.py
+
+Ce script calcule le spectre de puissance (Welch) et la puissance par bande (delta à gamma) de tous les
+canaux des segments propres produits par extract_clean_resting_edf.py (.fif ou .edf). Les fenêtres de
+Welch de tous les segments sont transformées ensemble (voir preprocessing/spectral.py) ; elles ne
+chevauchent jamais la jonction entre deux segments (annotations 'segment <n> ...').
+
+Le résultat est une table CSV par patient, une ligne par canal et par bande :
+Patient, Channel, Band, F_Min, F_Max, Power (µV²), Relative_Power, N_Windows
+
+---------------------
+🔧 Utilisation (en ligne de commande) :
+python -m scripts.resting_spectra chemin/patient_resting.fif chemin/patient_bandpower.csv
+
+Calcul pour un dossier (ou un motif glob) de fichiers de repos, sur 8 processus :
+python -m scripts.resting_spectra "data/cohort/*/*_resting.fif" data/spectra --jobs 8 --h_freq 80
+
+📌 Options disponibles :
+--h_freq       Borne haute de la bande gamma (Hz), en général le h_freq du prétraitement [défaut: 80]
+--window_sec   Durée des fenêtres de Welch (s), recouvrement de 50 % [défaut: 2]
+--jobs         Nombre de fichiers traités en parallèle (mode lot)
+--overwrite    Recalculer même les tables à jour (mode lot)
+---------------------
+
+En mode lot, une table n'est recalculée que si son fichier de repos, les options ou le code ont changé
+(manifeste .ecofec_cache.json dans le dossier de sortie).
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+from preprocessing import spectral
+from preprocessing.cache import ResultCache, MANIFEST_NAME, code_version
+from preprocessing.instrumentation import profiled, stage
+from preprocessing.pipeline import Task, run_tasks, print_summary
+
+RESTING_EXTENSIONS = ('.fif', '.edf')
+
+
+def patient_id(resting_path):
+    """Identifiant du patient : nom du fichier sans extension ni suffixe '_resting'."""
+    name = os.path.splitext(os.path.basename(resting_path))[0]
+    return name[:-len('_resting')] if name.endswith('_resting') else name
+
+
+@profiled(file_arg='resting_path')
+def resting_band_powers(resting_path, output_path, patient=None, h_freq=80.0, window_sec=spectral.WINDOW_SEC):
+    """
+    Puissance par bande de tous les canaux d'un fichier de repos, sauvegardée en CSV.
+
+    :return: DataFrame (une ligne par canal et par bande)
+    """
+    with stage('resting_spectra.read', file=resting_path):
+        data, sfreq, ch_names, segments = spectral.read_resting(resting_path)
+    with stage('resting_spectra.welch', file=resting_path):
+        freqs, psd, n_windows = spectral.welch_psd(data, sfreq, segments, window_sec=window_sec)
+    if n_windows == 0:
+        print(f"⚠️ {resting_path} : aucun segment d'au moins {window_sec} s, puissances indéfinies.")
+
+    table = spectral.band_power_table(freqs, psd, ch_names, spectral.make_bands(h_freq), n_windows)
+    table.insert(0, 'Patient', patient or patient_id(resting_path))
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    table.to_csv(output_path, index=False)
+    print(f"Puissances par bande sauvegardées dans : {output_path} ({len(segments)} segment(s), {n_windows} fenêtres)")
+    return table
+
+
+def find_resting_files(input_path):
+    """Fichiers de repos d'un chemin : fichier, dossier (tous ses .fif / .edf) ou motif glob."""
+    if os.path.isdir(input_path):
+        paths = [p for ext in RESTING_EXTENSIONS for p in glob.glob(os.path.join(input_path, '*' + ext))]
+    else:
+        paths = glob.glob(input_path)
+    return sorted(p for p in paths if p.lower().endswith(RESTING_EXTENSIONS))
+
+
+def compute_batch(resting_files, output_dir, h_freq=80.0, window_sec=spectral.WINDOW_SEC, n_jobs=1, overwrite=False):
+    """Calcule output_dir/<patient>_bandpower.csv pour chaque fichier (en parallèle, avec cache)."""
+    os.makedirs(output_dir, exist_ok=True)
+    cache = ResultCache(os.path.join(output_dir, MANIFEST_NAME))
+    version = code_version(sys.modules[__name__], spectral)
+    tasks = []
+    for resting_path in resting_files:
+        patient = patient_id(resting_path)
+        output_path = os.path.join(output_dir, f'{patient}_bandpower.csv')
+        tasks.append(Task(resting_path, resting_band_powers, [resting_path], [output_path],
+                          params={'h_freq': h_freq, 'window_sec': window_sec}, version=version,
+                          args=(resting_path, output_path, patient, h_freq, window_sec)))
+    results = run_tasks(tasks, cache, n_jobs=n_jobs, overwrite=overwrite)
+    cache.save()
+    print_summary(results)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spectre de Welch et puissance par bande des segments de repos")
+    parser.add_argument("input", help="Fichier de repos (.fif / .edf), dossier ou motif glob (entre guillemets)")
+    parser.add_argument("output", help="Fichier .csv (un seul fichier) ou dossier de sortie (lot)")
+    parser.add_argument("--h_freq", type=float, default=80.0, help="Borne haute de la bande gamma (Hz)")
+    parser.add_argument("--window_sec", type=float, default=spectral.WINDOW_SEC, help="Durée des fenêtres de Welch (s)")
+    parser.add_argument("--jobs", type=int, default=1, help="Nombre de fichiers traités en parallèle")
+    parser.add_argument("--overwrite", action="store_true", help="Recalculer même les tables à jour (mode lot)")
+    args = parser.parse_args()
+
+    if args.output.endswith('.csv'):
+        resting_band_powers(args.input, args.output, h_freq=args.h_freq, window_sec=args.window_sec)
+    else:
+        resting_files = find_resting_files(args.input)
+        if not resting_files:
+            print(f"Aucun fichier de repos (.fif / .edf) trouvé pour : {args.input}")
+            sys.exit(1)
+        results = compute_batch(resting_files, args.output, args.h_freq, args.window_sec, args.jobs, args.overwrite)
+        if any(status == "error" for _, status, _ in results):
+            sys.exit(1)
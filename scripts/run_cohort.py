@@ -0,0 +1,351 @@
+"""
+run_cohort.py
+
+Exécute toute la chaîne de traitement d'une cohorte à partir d'un manifeste YAML, sans modifier
+les scripts patient par patient.
+
+Étapes (par patient) et dépendances :
+- events          : CSV d'événements -> stock Parquet (temps en s, électrodes, états), dans <output_dir>/event_store
+- preprocess      : EDF brut -> signal nettoyé (filtrage, sélection des canaux), en EDF, FIF ou .npy float32
+- onsets          : événements -> .mat d'onsets (format Brainstorm)               (après events)
+- morphology      : EDF nettoyé + événements -> CSV de morphologie des IEDs      (après preprocess, events)
+- event_analysis  : événements -> figures de répartition des IEDs par état       (après events)
+- stats           : CSV de morphologie -> violin plots par électrode/période (après morphology)
+- templates       : EDF nettoyé + événements -> templates des IEDs par électrode et état (après preprocess, events)
+- resting         : EDF nettoyé + .mat -> segments de repos sans pointes     (après preprocess, onsets)
+- spectra         : segments de repos -> puissance par bande (Welch) par canal (après resting)
+- connectivity    : EDF nettoyé + .mat -> cohérence, PLV, wPLI par état et paire (après preprocess, onsets)
+
+Les étapes indépendantes (et les patients) sont exécutées en parallèle sur --jobs processus.
+Chaque résultat est enregistré dans le manifeste de cache (.ecofec_cache.json du dossier de
+sortie) dès qu'il est produit : une sortie à jour est ignorée, et après une interruption il
+suffit de relancer la même commande pour reprendre.
+
+---------------------
+🔧 Utilisation :
+python -m scripts.run_cohort chemin/cohorte.yaml [--jobs 8] [--patients p1 p2] [--stages preprocess morphology] [--overwrite]
+
+Mesure du temps, de la mémoire et des E/S de chaque tâche et sous-étape (une ligne JSON par mesure) :
+python -m scripts.run_cohort chemin/cohorte.yaml --profile data/cohort/profile.jsonl
+
+📄 Manifeste (exemple) :
+output_dir: data/cohort              # sorties dans data/cohort/<patient>/
+jobs: 4                              # nombre de processus (remplacé par --jobs)
+stages: [events, preprocess, onsets, morphology, event_analysis, stats, templates, resting, spectra, connectivity]   # optionnel
+defaults:                            # paramètres communs, remplaçables patient par patient
+  l_freq: 1.5
+  h_freq: 80                         # aussi borne haute de la bande gamma (spectra)
+  notch_freq: 50
+  block_sec: 60                      # prétraitement en flux (optionnel)
+  resample: 256                      # rééchantillonnage après filtrage, en Hz (optionnel, > 2 * h_freq)
+  filter_method: fir                 # fir (défaut) ou iir
+  clean_format: edf                  # format du signal nettoyé : edf (défaut), fif ou npy (float32 + en-tête JSON)
+  dtype: float64                     # calculs en float64 (défaut) ou float32 : prétraitement, epochs, morphologie, templates, repos
+  drop_columns: []
+  min_seg_sec: 2
+  total_duration_sec: 60
+  resting_format: fif                # fif ou edf
+patients:
+  d3bd_f29d:
+    edf: data/raw/edf_file/d3bd_f29d.edf
+    csv: data/raw/csv_file/d3bd_f29d_19ICA_FINAL.csv
+    periodes: {Eveil: [[0, 169], [278, 600]], Sommeil: [[960, 2248]]}
+    durees: {eveil: 491, sommeil: 1288}           # optionnel : somme des périodes sinon
+    electrode_map: {F8: F8, F8-T4: [F8, T4]}      # optionnel : Electrode_map de ieds_morphology (templates : canaux de l'étiquette) sinon
+    wake_periods: [[0, 169], [278, 600]]          # optionnel : périodes 'Eveil' sinon
+---------------------
+"""
+
+import argparse
+import os
+import sys
+
+import matplotlib
+matplotlib.use('Agg')  # Figures sauvegardées sans affichage (exécution sur un nœud de calcul)
+import yaml
+
+from preprocessing import (edf_cleaning, edf_io, filtering, epochs, events, morphology, periods, intervals, spectral,
+                           connectivity, instrumentation, signal_io, templates)
+from preprocessing.cache import ResultCache, MANIFEST_NAME, code_version
+from preprocessing.edf_io import EdfReader
+from preprocessing.periods import parse_periods
+from preprocessing.pipeline import Task, run_tasks, print_summary
+from scripts import (connectivity_analysis, convert_csv_to_mat, extract_clean_resting_edf, ied_event_analysis,
+                     ied_templates, ieds_morphology, resting_spectra, Stats_morpho_results)
+
+STAGES = ['events', 'preprocess', 'onsets', 'morphology', 'event_analysis', 'stats', 'templates', 'resting',
+          'spectra', 'connectivity']
+
+DEFAULTS = {
+    'channels': None,
+    'l_freq': 1.5,
+    'h_freq': 80.0,
+    'notch_freq': 50.0,
+    'block_sec': None,
+    'resample': None,
+    'filter_method': 'fir',
+    'clean_format': 'edf',
+    'dtype': 'float64',
+    'drop_columns': [],
+    'min_seg_sec': 2,
+    'total_duration_sec': 60,
+    'resting_format': 'fif',
+}
+
+
+# --- Étapes (fonctions de module, exécutables dans un processus 'spawn') ---
+
+def etape_events(csv_path, periodes, drop_columns):
+    # Stock avec les états (event_analysis) et stock par défaut (onsets, morphology, templates) :
+    # créés ici avant les étapes qui les lisent, jamais par plusieurs processus à la fois
+    events.get_event_store(csv_path, periodes=periodes, drop_columns=drop_columns)
+    events.get_event_store(csv_path)
+
+
+def etape_preprocess(edf_path, output_path, channels, l_freq, h_freq, notch_freq, block_sec, resample_sfreq,
+                     filter_method, dtype):
+    edf_cleaning.clean_and_save_edf(edf_path, output_path, channels_of_interest=channels,
+                                    l_freq=l_freq, h_freq=h_freq, notch_freq=notch_freq, block_sec=block_sec,
+                                    resample_sfreq=resample_sfreq, filter_method=filter_method, dtype=dtype)
+
+
+def etape_onsets(csv_path, mat_path):
+    convert_csv_to_mat.csv_to_mat(csv_path, mat_path)
+
+
+def etape_morphology(csv_path, edf_path, results_path, electrode_map, dtype):
+    ieds_morphology.morphology_from_files(csv_path, edf_path, results_path, electrode_map=electrode_map, dtype=dtype)
+
+
+def etape_event_analysis(config, prefix):
+    ied_event_analysis.analyser_evenements(config, prefix, show=False)
+
+
+def etape_stats(results_path, periodes, save_folder):
+    Stats_morpho_results.analyser_morphologie(results_path, periodes, save_folder=save_folder, show=False)
+
+
+def etape_templates(edf_path, csv_path, output_path, periodes, electrode_map, patient_id, figures_dir, dtype):
+    ied_templates.templates_from_files(edf_path, csv_path, output_path, periodes=periodes, electrode_map=electrode_map,
+                                       patient=patient_id, figures_dir=figures_dir, dtype=dtype)
+
+
+def etape_resting(edf_path, mat_path, output_path, min_seg_sec, total_duration_sec, wake_periods, dtype):
+    if extract_clean_resting_edf.extract_clean_segments(edf_path, mat_path, output_path,
+                                                        min_seg_sec=min_seg_sec,
+                                                        total_duration_sec=total_duration_sec,
+                                                        wake_periods=wake_periods, dtype=dtype) is None:
+        raise RuntimeError("aucun segment propre sélectionné")
+
+
+def etape_spectra(resting_path, output_path, patient_id, h_freq):
+    resting_spectra.resting_band_powers(resting_path, output_path, patient_id, h_freq=h_freq)
+
+
+def etape_connectivity(edf_path, mat_path, output_path, periodes, patient_id, min_seg_sec, h_freq):
+    connectivity_analysis.connectivity_by_state(edf_path, mat_path, output_path, periodes=periodes,
+                                                patient=patient_id, min_seg_sec=min_seg_sec, h_freq=h_freq)
+
+
+# --- Manifeste de cohorte -> graphe de tâches ---
+
+def load_manifest(path):
+    """Charge le manifeste YAML de la cohorte (clés 'patients', 'output_dir', 'defaults'...)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = yaml.safe_load(f)
+    if not manifest or not manifest.get('patients'):
+        raise ValueError(f"Aucun patient défini dans le manifeste {path}")
+    return manifest
+
+
+def durees_periodes(periodes, edf_path):
+    """Durée totale (s) de chaque état, 'max' remplacé par la durée de l'enregistrement."""
+    duration = None
+    durees = {}
+    for name, start, end in parse_periods(periodes):
+        if end == float('inf'):
+            if duration is None:
+                reader = EdfReader(edf_path)
+                duration = reader.n_times / reader.sfreq
+            end = duration
+        durees[name.lower()] = durees.get(name.lower(), 0.0) + max(end - start, 0.0)
+    return durees
+
+
+def patient_tasks(patient_id, patient, output_dir, stages):
+    """Tâches d'un patient (seules les étapes de `stages` sont créées)."""
+    out = os.path.join(output_dir, patient_id)
+    edf_path = patient['edf']
+    csv_path = patient['csv']
+    clean_format = patient['clean_format']
+    if clean_format not in signal_io.SIGNAL_FORMATS:
+        raise ValueError(f"Format nettoyé inconnu pour {patient_id} : {clean_format} "
+                         f"(disponibles : {', '.join(signal_io.SIGNAL_FORMATS)})")
+    clean_path = os.path.join(out, f"{patient_id}_clean{signal_io.FORMAT_SUFFIXES[clean_format]}")
+    if patient['dtype'] not in signal_io.SIGNAL_DTYPES:
+        raise ValueError(f"Type de calcul inconnu pour {patient_id} : {patient['dtype']} "
+                         f"(disponibles : {', '.join(signal_io.SIGNAL_DTYPES)})")
+    mat_path = os.path.join(out, f"{patient_id}_events.mat")
+    morpho_path = os.path.join(out, f"{patient_id}_morphology.csv")
+    resting_path = os.path.join(out, f"{patient_id}_resting.{patient['resting_format']}")
+    spectra_path = os.path.join(out, f"{patient_id}_bandpower.csv")
+    connectivity_path = os.path.join(out, f"{patient_id}_connectivity.csv")
+    templates_path = os.path.join(out, f"{patient_id}_templates.csv")
+    periodes = patient.get('periodes', {})
+
+    def name(stage):
+        return f"{patient_id}/{stage}"
+
+    def deps(*names):
+        return [name(stage) for stage in names if stage in stages]
+
+    tasks = []
+    if 'events' in stages:
+        patient_store = events.default_patient(csv_path)
+        store_files = [events.patient_file(events.event_store_path(csv_path, periodes, patient['drop_columns']),
+                                           patient_store),
+                       events.patient_file(events.event_store_path(csv_path), patient_store)]
+        tasks.append(Task(name('events'), etape_events, [csv_path], store_files,
+                          params={'periodes': periodes, 'drop_columns': patient['drop_columns']},
+                          version=code_version(events, periods),
+                          args=(csv_path, periodes, patient['drop_columns'])))
+
+    if 'preprocess' in stages:
+        params = {key: patient[key] for key in ('channels', 'l_freq', 'h_freq', 'notch_freq', 'resample',
+                                                       'filter_method', 'dtype')}
+        params['streamed'] = patient['block_sec'] is not None
+        # Signal .npy : l'en-tête JSON fait partie de la sortie
+        outputs = [clean_path] + ([signal_io.header_path(clean_path)] if clean_format == 'npy' else [])
+        tasks.append(Task(name('preprocess'), etape_preprocess, [edf_path], outputs,
+                          params=params, version=code_version(edf_cleaning, edf_io, filtering, signal_io),
+                          args=(edf_path, clean_path, patient['channels'], patient['l_freq'],
+                                patient['h_freq'], patient['notch_freq'], patient['block_sec'],
+                                patient['resample'], patient['filter_method'], patient['dtype'])))
+
+    if 'onsets' in stages:
+        tasks.append(Task(name('onsets'), etape_onsets, [csv_path], [mat_path], deps=deps('events'),
+                          version=code_version(convert_csv_to_mat), args=(csv_path, mat_path)))
+
+    if 'morphology' in stages:
+        electrode_map = patient.get('electrode_map') or ieds_morphology.Electrode_map
+        tasks.append(Task(name('morphology'), etape_morphology, [csv_path, clean_path], [morpho_path],
+                          deps=deps('preprocess', 'events'),
+                          params={'Electrode_map': electrode_map, 'dtype': patient['dtype']},
+                          version=code_version(ieds_morphology, epochs, morphology),
+                          args=(csv_path, clean_path, morpho_path, electrode_map, patient['dtype'])))
+
+    if 'event_analysis' in stages:
+        folder = os.path.join(out, 'event_analysis')
+        config = {
+            'input_csv': csv_path,
+            'save_folder': folder,
+            'drop_columns': patient['drop_columns'],
+            'periodes': periodes,
+            'durees': patient.get('durees') or durees_periodes(periodes, edf_path),
+        }
+        tasks.append(Task(name('event_analysis'), etape_event_analysis, [csv_path],
+                          ied_event_analysis.figure_paths(folder, patient_id[:9]), deps=deps('events'),
+                          params=config, version=code_version(ied_event_analysis, periods),
+                          args=(config, patient_id[:9])))
+
+    if 'stats' in stages:
+        folder = os.path.join(out, 'stats')
+        tasks.append(Task(name('stats'), etape_stats, [morpho_path], Stats_morpho_results.figure_paths(folder),
+                          deps=deps('morphology'), params={'periodes': periodes},
+                          version=code_version(Stats_morpho_results, periods),
+                          args=(morpho_path, periodes, folder)))
+
+    if 'templates' in stages:
+        electrode_map = patient.get('electrode_map')
+        tasks.append(Task(name('templates'), etape_templates, [clean_path, csv_path], [templates_path],
+                          deps=deps('preprocess', 'events'),
+                          params={'periodes': periodes, 'electrode_map': electrode_map, 'dtype': patient['dtype']},
+                          version=code_version(ied_templates, templates, epochs, morphology, periods),
+                          args=(clean_path, csv_path, templates_path, periodes, electrode_map, patient_id,
+                                os.path.join(out, 'templates'), patient['dtype'])))
+
+    if 'resting' in stages:
+        wake_periods = patient.get('wake_periods', periodes.get('Eveil'))
+        if wake_periods is not None:
+            wake_periods = [(start, end) for _, start, end in parse_periods({'Eveil': wake_periods})]
+        params = {key: patient[key] for key in ('min_seg_sec', 'total_duration_sec', 'dtype')}
+        params['wake_periods'] = wake_periods
+        tasks.append(Task(name('resting'), etape_resting, [clean_path, mat_path], [resting_path],
+                          deps=deps('preprocess', 'onsets'), params=params,
+                          version=code_version(extract_clean_resting_edf, edf_io, intervals),
+                          args=(clean_path, mat_path, resting_path, patient['min_seg_sec'],
+                                patient['total_duration_sec'], wake_periods, patient['dtype'])))
+
+    if 'spectra' in stages:
+        tasks.append(Task(name('spectra'), etape_spectra, [resting_path], [spectra_path],
+                          deps=deps('resting'), params={'h_freq': patient['h_freq']},
+                          version=code_version(resting_spectra, spectral),
+                          args=(resting_path, spectra_path, patient_id, patient['h_freq'])))
+
+    if 'connectivity' in stages:
+        params = {key: patient[key] for key in ('min_seg_sec', 'h_freq')}
+        params['periodes'] = periodes
+        tasks.append(Task(name('connectivity'), etape_connectivity, [clean_path, mat_path], [connectivity_path],
+                          deps=deps('preprocess', 'onsets'), params=params,
+                          version=code_version(connectivity_analysis, connectivity, spectral, extract_clean_resting_edf,
+                                               intervals, periods),
+                          args=(clean_path, mat_path, connectivity_path, periodes, patient_id,
+                                patient['min_seg_sec'], patient['h_freq'])))
+    return tasks
+
+
+def build_tasks(manifest, stages=None, patient_ids=None):
+    """Graphe de tâches de toute la cohorte."""
+    output_dir = manifest.get('output_dir', 'data/cohort')
+    stages = stages or manifest.get('stages') or STAGES
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Étape(s) inconnue(s) : {', '.join(sorted(unknown))} (disponibles : {', '.join(STAGES)})")
+
+    defaults = {**DEFAULTS, **(manifest.get('defaults') or {})}
+    tasks = []
+    for patient_id, patient in manifest['patients'].items():
+        if patient_ids and patient_id not in patient_ids:
+            continue
+        tasks.extend(patient_tasks(patient_id, {**defaults, **patient}, output_dir, stages))
+    return tasks
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Traitement d'une cohorte à partir d'un manifeste YAML")
+    parser.add_argument("manifest", help="Manifeste YAML de la cohorte")
+    parser.add_argument("--jobs", type=int, default=None, help="Nombre de processus (défaut : 'jobs' du manifeste, sinon 1)")
+    parser.add_argument("--threads_per_job", type=int, default=None, help="Threads BLAS/FFT par processus (défaut : 1)")
+    parser.add_argument("--patients", nargs="+", default=None, help="Ne traiter que ces patients")
+    parser.add_argument("--stages", nargs="+", default=None, choices=STAGES, help="Ne lancer que ces étapes")
+    parser.add_argument("--overwrite", action="store_true", help="Tout recalculer, même les sorties à jour")
+    parser.add_argument("--profile", default=None, help="Fichier JSON lines des mesures par tâche et sous-étape")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.profile:
+        # Avant le lancement des processus : ils héritent de la variable d'environnement
+        instrumentation.enable(args.profile)
+    manifest = load_manifest(args.manifest)
+    output_dir = manifest.get('output_dir', 'data/cohort')
+    # Stocks d'événements dans le dossier de sortie (hérité par les processus), pas à côté des CSV
+    events.set_store_root(os.path.join(output_dir, 'event_store'))
+    tasks = build_tasks(manifest, args.stages, args.patients)
+
+    os.makedirs(output_dir, exist_ok=True)
+    cache = ResultCache(os.path.join(output_dir, MANIFEST_NAME))
+
+    n_jobs = args.jobs or manifest.get('jobs', 1)
+    threads_per_job = args.threads_per_job or manifest.get('threads_per_job', 1)
+    print(f"{len(tasks)} tâche(s), {n_jobs} processus.")
+    results = run_tasks(tasks, cache, n_jobs=n_jobs, threads_per_job=threads_per_job, overwrite=args.overwrite)
+    cache.save()
+    print_summary(results)
+    if any(status == "error" for _, status, _ in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,25 @@
 import numpy as np
 import pandas as pd
-import mne
 import os
+import sys
 import yaml
 from scipy.io import savemat
-import matplotlib
-matplotlib.use('Qt5Agg')  # Forcer le backend Qt5 interactif
-import matplotlib.pyplot as plt
 
+from preprocessing.epochs import get_epochs, load_epochs
+from preprocessing.events import load_events
+from preprocessing.review import DecisionLog, ReviewFigure, WindowPrefetcher
+from preprocessing.scoring import score_events
+
+
+# Fichier de configuration YAML : argument de la ligne de commande, sinon chemin par défaut
+# python -m scripts.select_validate_ieds chemin/config.yaml
+# Le backend matplotlib n'est plus imposé à l'import : matplotlib choisit un backend interactif
+# disponible, ou celui de la variable d'environnement MPLBACKEND (ex. MPLBACKEND=QtAgg).
+CONFIG_PATH = 'C:/Users/boyer/github/ECOFEC/data/config/d3bd_f29d_ied_selection.yaml'
+config_path = sys.argv[1] if len(sys.argv) > 1 else CONFIG_PATH
 
 # Charger le fichier de configuration YAML
-with open('C:/Users/boyer/github/ECOFEC/data/config/d3bd_f29d_ied_selection.yaml', 'r') as f:
+with open(config_path, 'r') as f:
     config = yaml.safe_load(f)
 
 # Lire les chemins des fichiers depuis la configuration
@@ -18,34 +27,29 @@ csv_file = config['csv_file']
 edf_file = config['edf_file']
 #text_file_path = config['text_file_path']
 
-# Charger le fichier CSV
-df_csv = pd.read_csv(csv_file)
-
-# Charger le fichier EDF
-raw_edf = mne.io.read_raw_edf(edf_file, preload=True)
+# Charger les événements depuis le stock Parquet du CSV, avec la période de chaque événement
+# (bornes incluses, 'max' = fin de l'enregistrement, la première période listée l'emporte)
+events = load_events(csv_file, columns=['time', 'electrode', 'state'], periodes=config['periodes'])
 
 # Sélectionner les canaux souhaités
 channels = config['channels']
-raw_edf.pick_channels(channels)
 
 # Ordre des électrodes 
 ordre_electrodes = config['ordre_electrodes']
 
-# Convertir la colonne 'Tmu' de microsecondes en secondes
-df_csv['Tmu_seconds'] = df_csv['Tmu'] / 1e6
+# Temps en secondes (index = ligne du CSV = indice de l'epoch)
+df_csv = pd.DataFrame({
+    'Electrode': events['electrode'].astype(str),
+    'Tmu_seconds': events['time'],
+    'periode': events['state'].astype(object),
+})
 
-# Fonction pour définir les périodes
-def definir_periodes(df, periodes):
-    df['periode'] = None
-    for periode in periodes:
-        start = periode['start']
-        end = periode['end'] if periode['end'] != 'max' else df['Tmu_seconds'].max()
-        mask = (df['Tmu_seconds'] >= start) & (df['Tmu_seconds'] <= end)
-        df.loc[mask, 'periode'] = periode['name']
-    return df
+# Fenêtres d'1 s autour de chaque événement, extraites une fois du fichier EDF (ligne i = événement i du CSV)
+epochs_edf, epochs_meta = load_epochs(get_epochs(edf_file, df_csv['Tmu_seconds']))
 
-# Appliquer la définition des périodes
-df_csv = definir_periodes(df_csv, config['periodes'])
+# Score de qualité de chaque événement (corrélation au template de l'électrode, rapport pic/fond,
+# raideur de la pente) : la validation présente les meilleurs candidats en premier
+df_csv = df_csv.join(score_events(epochs_edf, epochs_meta, df_csv['Electrode'], config.get('electrode_map')))
 
 # Fonction pour calculer les occurrences et les ratios par période
 def calculer_occurrences_et_ratios(df):
@@ -96,43 +100,98 @@ def generer_n_target_dict(ratios_par_periode, periode_selectionnee, n_total):
 
     return n_target_dict.to_dict()
 
-def valider_evenements_selectionnes(raw, selection, n_target_dict, periode=None):
+def valider_evenements_selectionnes(epochs, meta, channels, selection, n_target_dict, periode=None,
+                                    decisions_path=None, n_prefetch=8, ordre='score'):
+    """
+    Validation manuelle des événements, électrode par électrode, jusqu'à atteindre n_target_dict.
+    Avec ordre='score' (et une colonne 'Score'), les événements de chaque électrode sont présentés
+    du meilleur au moins bon score ; avec ordre='temps', dans l'ordre chronologique.
+
+    Une seule figure est réutilisée pour tous les événements ; les n_prefetch fenêtres suivantes
+    sont lues et préparées en arrière-plan pendant que l'événement courant est affiché.
+    Chaque réponse est ajoutée au journal `decisions_path` (JSON lines) : après un 'exit' ou
+    une interruption, les événements déjà traités ne sont pas représentés et ceux validés
+    comptent dans les quotas.
+    """
     validation = []
+    # Les lignes de `selection` gardent l'index de df_csv, qui est aussi l'indice de l'epoch
+    channel_idx = [meta['channels'].index(ch) for ch in channels]
     event_count = {electrode: 0 for electrode in n_target_dict}
+    log = DecisionLog(decisions_path) if decisions_path else None
 
     if periode:
         selection = selection[selection['periode'] == periode]
 
     electrodes_ordered = list(n_target_dict.keys())
 
+    # Événements restant à examiner par électrode (reprise : décisions déjà prises appliquées)
+    candidats = {}
     for electrode in electrodes_ordered:
         selection_electrode = selection[selection['Electrode'] == electrode]
-        selection_electrode = selection_electrode.sort_values('Tmu_seconds')
-
+        if ordre == 'score' and 'Score' in selection_electrode:
+            selection_electrode = selection_electrode.sort_values(['Score', 'Tmu_seconds'], ascending=[False, True],
+                                                                  na_position='last')
+        else:
+            selection_electrode = selection_electrode.sort_values('Tmu_seconds')
+        candidats[electrode] = []
         for idx, row in selection_electrode.iterrows():
-            if event_count[electrode] >= n_target_dict[electrode]:
-                break
-
-            event_time = row['Tmu_seconds']
-            start = max(0, event_time - 0.5)
-            end = min(raw.times[-1], event_time + 0.5)
-
-            fig = raw.plot(start=start, duration=1.0, show=False)
-            plt.title(f"Électrode {electrode} · {row['periode']} @ {event_time:.3f}s", pad=20)
-            plt.show()
-
-            valid = input(f"Valider cet événement ? (y/n/exit) : ").strip().lower()
-            if valid == 'exit':
-                print("Validation interrompue par l'utilisateur.")
-                return pd.DataFrame(validation)
-            elif valid == 'y':
+            decision = log.get(idx) if log is not None else None
+            if decision == 'y' and event_count[electrode] < n_target_dict[electrode]:
                 validation.append(row)
                 event_count[electrode] += 1
-                print(f"✅ Validé ({event_count[electrode]}/{n_target_dict[electrode]} pour {electrode})")
-            else:
-                print("❌ Rejeté")
+            elif decision is None:
+                candidats[electrode].append((idx, row))
+
+    if log is not None and log.decisions:
+        print(f"Reprise : {len(log.decisions)} décision(s) déjà enregistrée(s) dans {decisions_path}, "
+              f"{len(validation)} événement(s) validé(s).")
 
-        print(f"➡️  Électrode {electrode} terminée : {event_count[electrode]}/{n_target_dict[electrode]} validés.\n")
+    def prochains(position_electrode, position_evenement):
+        """Indices des prochains événements à afficher (électrode courante puis suivantes)."""
+        for k, electrode in enumerate(electrodes_ordered[position_electrode:]):
+            if event_count[electrode] >= n_target_dict[electrode]:
+                continue
+            # Indices plutôt qu'une tranche : pas de copie de la liste des candidats restants
+            liste = candidats[electrode]
+            for position in range(position_evenement if k == 0 else 0, len(liste)):
+                yield liste[position][0]
+
+    figure = ReviewFigure(channels, meta['sfreq'], epochs.shape[2], meta['n_before'])
+    prefetcher = WindowPrefetcher(lambda idx: figure.prepare(epochs[idx][channel_idx]), n_ahead=n_prefetch)
+
+    try:
+        for position_electrode, electrode in enumerate(electrodes_ordered):
+            for position_evenement, (idx, row) in enumerate(candidats[electrode]):
+                if event_count[electrode] >= n_target_dict[electrode]:
+                    break
+
+                event_time = row['Tmu_seconds']
+
+                # Fenêtre d'1 s centrée sur l'événement (échantillons hors enregistrement : NaN dans les
+                # epochs, affichés sur la ligne de base du canal par ReviewFigure.prepare)
+                prefetcher.schedule(prochains(position_electrode, position_evenement))
+                titre = f"Électrode {electrode} · {row['periode']} @ {event_time:.3f}s"
+                if 'Score' in row and pd.notna(row['Score']):
+                    titre += f" · score {row['Score']:.2f}"
+                figure.show(prefetcher.get(idx), titre)
+
+                valid = input(f"Valider cet événement ? (y/n/exit) : ").strip().lower()
+                if valid == 'exit':
+                    print("Validation interrompue par l'utilisateur.")
+                    return pd.DataFrame(validation)
+                elif valid == 'y':
+                    validation.append(row)
+                    event_count[electrode] += 1
+                    print(f"✅ Validé ({event_count[electrode]}/{n_target_dict[electrode]} pour {electrode})")
+                else:
+                    print("❌ Rejeté")
+                if log is not None:
+                    log.record(idx, 'y' if valid == 'y' else 'n', Electrode=electrode, Tmu_seconds=event_time)
+
+            print(f"➡️  Électrode {electrode} terminée : {event_count[electrode]}/{n_target_dict[electrode]} validés.\n")
+    finally:
+        prefetcher.close()
+        figure.close()
 
     print("✅ Validation terminée pour toutes les électrodes.")
     return pd.DataFrame(validation)
@@ -151,7 +210,12 @@ for electrode, n in n_target_dict.items():
     print(f"  - {electrode} : {n}")
 
 # Appel de la fonction avec df_csv
-validated_events = valider_evenements_selectionnes(raw_edf, df_csv, n_target_dict, periode_selectionnee)
+# Journal des décisions (reprise après interruption), dans le dossier de sauvegarde
+decisions_path = config.get('decisions_file') or os.path.join(
+    config['save_folder'], os.path.splitext(os.path.basename(config_path))[0] + '_decisions.jsonl')
+validated_events = valider_evenements_selectionnes(epochs_edf, epochs_meta, channels, df_csv, n_target_dict,
+                                                   periode_selectionnee, decisions_path=decisions_path,
+                                                   ordre=config.get('ordre_validation', 'score'))
 
 
 # Affichage du résultat des événements validés